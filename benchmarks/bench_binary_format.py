@@ -0,0 +1,43 @@
+# Load time of the binary netlist format against parsing the text format.
+# Run from the repository root:  python -m benchmarks.bench_binary_format --sizes 100000 1000000
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_topological_sort import random_netlist
+from src.binary_format import read_binary, load_compact_circuit_dag, write_binary
+from src.compact_circuit_dag import CompactCircuitDAG
+from src.parser import Parser
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark binary netlist loading against text parsing')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    arg_parser.add_argument('--qubits', type=int, default=64)
+    args = arg_parser.parse_args()
+
+    parser = Parser()
+    print('%10s %12s %12s %14s %14s %14s' % ('gates', 'text_MB', 'binary_MB', 'text_parse_s', 'binary_nl_s', 'binary_dag_s'))
+    with tempfile.TemporaryDirectory() as d:
+        text_fn, binary_fn = os.path.join(d, 'circ.txt'), os.path.join(d, 'circ.qcb')
+        for size in args.sizes:
+            netlist = random_netlist(args.qubits, size)
+            parser.write_netlist(text_fn, args.qubits, netlist)
+            write_binary(binary_fn, args.qubits, netlist)
+
+            text_time, _ = timed(lambda: CompactCircuitDAG(args.qubits, parser.iter_gates(text_fn)))
+            binary_nl_time, _ = timed(lambda: read_binary(binary_fn).get_netlist())
+            binary_dag_time, _ = timed(load_compact_circuit_dag, binary_fn)
+            print('%10d %12.1f %12.1f %14.3f %14.3f %14.5f' % (size, os.path.getsize(text_fn) / 1e6, os.path.getsize(binary_fn) / 1e6,
+                                                                text_time, binary_nl_time, binary_dag_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Memory and throughput of CircuitDAG versus the array-backed CompactCircuitDAG.
+# Run from the repository root:  python -m benchmarks.bench_compact_dag --sizes 100000 1000000
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.bench_topological_sort import random_netlist
+from src.circuit_dag import CircuitDAG
+from src.compact_circuit_dag import CompactCircuitDAG
+
+
+def measure_memory(cls, num_qubits, netlist):
+    tracemalloc.start()
+    cd = cls(num_qubits, netlist)
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return used
+
+def measure_throughput(cls, num_qubits, netlist):
+    start = time.perf_counter()
+    cd = cls(num_qubits, netlist)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _,v in cd.get_vertex_map().items():
+        v.get_output()
+    lookups = time.perf_counter() - start
+
+    h_ids = cd.collect_gate_ids('H')
+    v_map = cd.get_vertex_map()
+    start = time.perf_counter()
+    for iden in h_ids:
+        cd.remove_vertex_and_merge(v_map[iden])
+    removals = time.perf_counter() - start
+    return build, lookups, len(h_ids) / removals
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark CircuitDAG against CompactCircuitDAG')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    arg_parser.add_argument('--qubits', type=int, default=64)
+    args = arg_parser.parse_args()
+
+    print('%10s %20s %14s %10s %12s %14s' % ('gates', 'dag', 'bytes/gate', 'build_s', 'neighbors_s', 'removals/s'))
+    for size in args.sizes:
+        netlist = random_netlist(args.qubits, size)
+        for cls in (CircuitDAG, CompactCircuitDAG):
+            used = measure_memory(cls, args.qubits, netlist)
+            build, lookups, removals = measure_throughput(cls, args.qubits, netlist)
+            print('%10d %20s %14.1f %10.3f %12.3f %14.0f' % (size, cls.__name__, used / size, build, lookups, removals))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Speedup of optimize_parallel over one process on a circuit of independent qubit blocks.
+# Run from the repository root:  python -m benchmarks.bench_parallel --blocks 16 --block-gates 20000 --jobs 1 2 4 8
+import argparse
+import os
+import time
+
+from benchmarks.generators import random_rz_cnot_h
+from src.gate import Gate
+from src.parallel import optimize_parallel
+
+
+# type: (Int, Int, Int) -> Tuple[Int, List[Gate]]
+# blocks random R_z+CNOT+H circuits side by side on disjoint wires, interleaved gate by gate
+def block_circuit(num_blocks, block_qubits, block_gates):
+    blocks = []
+    for b in range(num_blocks):
+        _, netlist = random_rz_cnot_h(block_qubits, block_gates, seed=b)
+        offset = b * block_qubits
+        blocks.append([Gate.from_fields(g.get_name(), [q + offset for q in g.get_all_qubits()], g.get_theta())
+                       for g in netlist])
+    return num_blocks * block_qubits, [g for gates in zip(*blocks) for g in gates]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark parallel optimization of independent blocks')
+    arg_parser.add_argument('--blocks', type=int, default=16)
+    arg_parser.add_argument('--block-qubits', type=int, default=16)
+    arg_parser.add_argument('--block-gates', type=int, default=20000)
+    arg_parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    args = arg_parser.parse_args()
+
+    num_qubits, netlist = block_circuit(args.blocks, args.block_qubits, args.block_gates)
+    print('%d gates on %d qubits in %d blocks' % (len(netlist), num_qubits, args.blocks))
+    print('%6s %10s %8s %10s' % ('jobs', 'seconds', 'speedup', 'gates'))
+    baseline = None
+    for jobs in args.jobs:
+        start = time.perf_counter()
+        optimized = optimize_parallel(num_qubits, netlist, jobs=jobs)
+        seconds = time.perf_counter() - start
+        baseline = seconds if baseline is None else baseline
+        print('%6d %10.2f %8.2f %10d' % (jobs, seconds, baseline / seconds, len(optimized)))
+
+
+if __name__ == '__main__':
+    main()
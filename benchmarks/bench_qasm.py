@@ -0,0 +1,43 @@
+# Throughput of reading and writing OpenQASM 2.0 against the text netlist format, on the same circuits.
+# Run from the repository root:  python -m benchmarks.bench_qasm --sizes 100000 1000000
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.generators import random_rz_cnot_h
+from src.parser import Parser
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark OpenQASM reading and writing against the text format')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    arg_parser.add_argument('--qubits', type=int, default=64)
+    args = arg_parser.parse_args()
+
+    parser = Parser()
+    print('%10s %10s %10s %14s %14s %14s %14s' % ('gates', 'text_MB', 'qasm_MB', 'text_parse_s', 'qasm_parse_s',
+                                                   'qasm_gates/s', 'qasm_write_s'))
+    with tempfile.TemporaryDirectory() as d:
+        text_fn, qasm_fn = os.path.join(d, 'circ.txt'), os.path.join(d, 'circ.qasm')
+        for size in args.sizes:
+            _, netlist = random_rz_cnot_h(args.qubits, size)
+            parser.write_netlist(text_fn, args.qubits, netlist)
+            qasm_write_time, _ = timed(parser.write_netlist, qasm_fn, args.qubits, netlist)
+
+            text_time, _ = timed(lambda: sum(1 for _ in parser.iter_gates(text_fn)))
+            qasm_time, num_gates = timed(lambda: sum(1 for _ in parser.iter_gates(qasm_fn)))
+            assert num_gates == size
+            print('%10d %10.1f %10.1f %14.3f %14.3f %14.0f %14.3f' % (
+                size, os.path.getsize(text_fn) / 1e6, os.path.getsize(qasm_fn) / 1e6, text_time, qasm_time,
+                size / qasm_time, qasm_write_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# Compares the iterative topological sort in src/adapter.py against the recursive DFS it replaced, and times
+# the layered schedule next to it.
+# Run from the repository root:  python -m benchmarks.bench_topological_sort --sizes 1000 10000 100000
+import argparse
+import random
+import sys
+import time
+
+from src.adapter import topological_sort, schedule_layers
+from src.circuit_dag import CircuitDAG
+from src.gate import Gate
+
+
+def recursive_topological_sort_help(v, visited, stack):
+    visited.add(v.get_id())
+
+    for v_neighbor in v.get_output():
+        if not v_neighbor.get_id() in visited:
+            recursive_topological_sort_help(v_neighbor, visited, stack)
+
+    stack.insert(0, v)
+
+def recursive_topological_sort(cd):
+    visited = set()
+    stack = []
+
+    for _,v in cd.get_vertex_map().items():
+        if not v.get_id() in visited:
+            recursive_topological_sort_help(v, visited, stack)
+
+    return stack
+
+
+def random_netlist(num_qubits, num_gates, seed=0):
+    rng = random.Random(seed)
+    netlist = []
+    for _ in range(num_gates):
+        if rng.random() < 0.3:
+            control, target = rng.sample(range(num_qubits), 2)
+            netlist.append(Gate('CNOT %d %d' % (control, target)))
+        else:
+            netlist.append(Gate('H %d' % rng.randrange(num_qubits)))
+    return netlist
+
+def time_call(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark iterative vs recursive topological sort')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    arg_parser.add_argument('--qubits', type=int, default=64)
+    arg_parser.add_argument('--old-limit', type=int, default=20000,
+                            help='largest size the recursive sort is run on (it is quadratic)')
+    args = arg_parser.parse_args()
+
+    print('%10s %12s %12s %12s' % ('gates', 'iterative_s', 'recursive_s', 'layers_s'))
+    for size in args.sizes:
+        cd = CircuitDAG(args.qubits, random_netlist(args.qubits, size))
+        new_time = time_call(topological_sort, cd)
+        old_time = float('nan')
+        if size <= args.old_limit:
+            try:
+                old_time = time_call(recursive_topological_sort, cd)
+            except RecursionError:
+                pass
+        print('%10d %12.4f %12.4f %12.4f' % (size, new_time, old_time, time_call(schedule_layers, cd)))
+
+    # a single long wire is the worst case for the recursive version
+    chain = CircuitDAG(1, [Gate('H 0')] * (10 * sys.getrecursionlimit()))
+    print('single wire of %d gates: iterative %.4fs' % (len(chain.get_vertex_map()), time_call(topological_sort, chain)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# Synthetic and reversible arithmetic netlists for the benchmark runner. Every generator returns
+# (num_qubits, netlist); write one out in the INIT n text format the Parser reads with
+#   python -m benchmarks.generators adder 64 adder_64.txt
+import argparse
+import math
+import random
+
+from src.gate import Gate
+from src.parser import Parser
+
+CLIFFORD_T_GATES = ('H', 'P', 'P_dag', 'T', 'T_dag', 'X', 'Z')
+
+
+# type: (Int, Int, Int) -> Tuple[Int, List[Gate]]
+def random_clifford_t(num_qubits, num_gates, seed=0):
+    rng = random.Random(seed)
+    netlist = []
+    for _ in range(num_gates):
+        if rng.random() < 0.3:
+            control, target = rng.sample(range(num_qubits), 2)
+            netlist.append(Gate('CNOT %d %d' % (control, target)))
+        else:
+            netlist.append(Gate('%s %d' % (rng.choice(CLIFFORD_T_GATES), rng.randrange(num_qubits))))
+    return num_qubits, netlist
+
+# type: (Int, Int, Int) -> Tuple[Int, List[Gate]]
+# angles are multiples of pi/8 so rotations can cancel and merge
+def random_rz_cnot_h(num_qubits, num_gates, seed=0):
+    rng = random.Random(seed)
+    netlist = []
+    for _ in range(num_gates):
+        r = rng.random()
+        if r < 0.4:
+            theta = rng.choice((-3, -2, -1, 1, 2, 3)) * math.pi / 8
+            netlist.append(Gate('R_z %r %d' % (theta, rng.randrange(num_qubits))))
+        elif r < 0.8:
+            control, target = rng.sample(range(num_qubits), 2)
+            netlist.append(Gate('CNOT %d %d' % (control, target)))
+        else:
+            netlist.append(Gate('H %d' % rng.randrange(num_qubits)))
+    return num_qubits, netlist
+
+
+# type: (Int, Int, Int) -> List[Gate]
+# Clifford+T decomposition of a Toffoli with 7 T gates
+def toffoli(a, b, target):
+    text = ['H %d' % target, 'CNOT %d %d' % (b, target), 'T_dag %d' % target, 'CNOT %d %d' % (a, target),
+            'T %d' % target, 'CNOT %d %d' % (b, target), 'T_dag %d' % target, 'CNOT %d %d' % (a, target),
+            'T %d' % b, 'T %d' % target, 'H %d' % target, 'CNOT %d %d' % (a, b), 'T %d' % a,
+            'T_dag %d' % b, 'CNOT %d %d' % (a, b)]
+    return [Gate(t) for t in text]
+
+# type: (List[Gate]) -> List[Gate]
+# T and T_dag written as R_z(+-pi/4), the form the rotation passes work on
+def t_as_rz(netlist):
+    angles = {'T': math.pi / 4, 'T_dag': -math.pi / 4}
+    return [Gate.from_fields('R_z', g.get_all_qubits(), angles[g.get_name()]) if g.get_name() in angles else g
+            for g in netlist]
+
+def majority(c, b, a):
+    return [Gate('CNOT %d %d' % (a, b)), Gate('CNOT %d %d' % (a, c))] + toffoli(c, b, a)
+
+def unmajority(c, b, a):
+    return toffoli(c, b, a) + [Gate('CNOT %d %d' % (a, c)), Gate('CNOT %d %d' % (c, b))]
+
+# type: (List[Int], List[Int], Int, Int) -> List[Gate]
+# Cuccaro ripple carry adder: b += a, carry ^= the carry out, ancilla starts and ends as 0
+def cuccaro_adder(a, b, ancilla, carry):
+    netlist = majority(ancilla, b[0], a[0])
+    for i in range(1, len(a)):
+        netlist += majority(a[i - 1], b[i], a[i])
+    netlist.append(Gate('CNOT %d %d' % (a[-1], carry)))
+    for i in range(len(a) - 1, 0, -1):
+        netlist += unmajority(a[i - 1], b[i], a[i])
+    netlist += unmajority(ancilla, b[0], a[0])
+    return netlist
+
+# type: (Int) -> Tuple[Int, List[Gate]]
+# qubits: a[n], b[n], ancilla, carry
+def adder(num_bits):
+    a = list(range(num_bits))
+    b = list(range(num_bits, 2 * num_bits))
+    return 2 * num_bits + 2, cuccaro_adder(a, b, 2 * num_bits, 2 * num_bits + 1)
+
+# type: (Int) -> Tuple[Int, List[Gate]]
+# Shift and add multiplier, p += a * b. Each row computes the partial product a & b_i into an ancilla
+# register with Toffolis, adds it into p shifted by i, and uncomputes it.
+# qubits: a[n], b[n], p[2n], partial[n], ancilla
+def multiplier(num_bits):
+    a = list(range(num_bits))
+    b = list(range(num_bits, 2 * num_bits))
+    p = list(range(2 * num_bits, 4 * num_bits))
+    partial = list(range(4 * num_bits, 5 * num_bits))
+    ancilla = 5 * num_bits
+
+    netlist = []
+    for i in range(num_bits):
+        row = []
+        for j in range(num_bits):
+            row += toffoli(a[j], b[i], partial[j])
+        netlist += row
+        netlist += cuccaro_adder(partial, p[i:i + num_bits], ancilla, p[i + num_bits])
+        netlist += row
+    return 5 * num_bits + 1, netlist
+
+
+# type: (Str, Int, Int) -> Tuple[Int, List[Gate]]
+# a circuit of the given kind with roughly num_gates gates, arithmetic circuits use R_z for T gates
+def circuit_of_size(kind, num_gates, seed=0):
+    if kind == 'clifford_t':
+        return random_clifford_t(max(2, int(math.sqrt(num_gates))), num_gates, seed)
+    if kind == 'rz_cnot_h':
+        return random_rz_cnot_h(max(2, int(math.sqrt(num_gates))), num_gates, seed)
+    if kind == 'adder':
+        # one majority and one unmajority block of 17 gates per bit
+        num_qubits, netlist = adder(max(1, num_gates // 34))
+        return num_qubits, t_as_rz(netlist)
+    if kind == 'multiplier':
+        # 2 n^2 Toffolis of 15 gates plus n adders of 34 n gates
+        num_qubits, netlist = multiplier(max(1, int(math.sqrt(num_gates / 64))))
+        return num_qubits, t_as_rz(netlist)
+    raise ValueError('unknown circuit kind %r' % kind)
+
+KINDS = ('clifford_t', 'rz_cnot_h', 'adder', 'multiplier')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Write a benchmark circuit in the INIT n text format')
+    arg_parser.add_argument('kind', choices=KINDS)
+    arg_parser.add_argument('size', type=int, help='number of gates, or bits for adder and multiplier')
+    arg_parser.add_argument('filename')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+
+    if args.kind == 'adder':
+        num_qubits, netlist = adder(args.size)
+    elif args.kind == 'multiplier':
+        num_qubits, netlist = multiplier(args.size)
+    else:
+        num_qubits, netlist = circuit_of_size(args.kind, args.size, args.seed)
+    Parser().write_netlist(args.filename, num_qubits, netlist)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# Times the parser, DAG construction, netlist extraction and optimizer passes on generated circuits and
+# prints one JSON record per (kind, size) so runs can be diffed for regressions.
+# Run from the repository root:  python -m benchmarks.run --sizes 1000 10000 100000 1000000 --output bench.json
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.generators import KINDS, circuit_of_size
+from src.adapter import circuit_dag_to_netlist
+from src.circuit_dag import CircuitDAG
+from src.optimizer_subroutines import hadamard_gate_reduction, single_qubit_gate_cancellation
+from src.parser import Parser
+
+
+# type: (Callable, Bool, Callable) -> Tuple[Any, Dict]
+# setup runs untimed before each call and its result is passed to fn. Peak memory is taken in a second run
+# under tracemalloc so it does not slow down the timed one.
+def measure(fn, memory, setup=None):
+    arg = () if setup is None else (setup(),)
+    start = time.perf_counter()
+    result = fn(*arg)
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        arg = () if setup is None else (setup(),)
+        tracemalloc.start()
+        fn(*arg)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {'seconds': seconds, 'peak_bytes': peak}
+
+def add_rate(stage, num_gates):
+    stage['ops_per_sec'] = num_gates / stage['seconds'] if stage['seconds'] > 0 else None
+    return stage
+
+
+# type: (Str, Int, Str, Bool, Int) -> Dict
+def run_case(kind, size, directory, memory, seed=0):
+    num_qubits, netlist = circuit_of_size(kind, size, seed)
+    num_gates = len(netlist)
+    filename = os.path.join(directory, '%s_%d.txt' % (kind, size))
+    parser = Parser()
+    parser.write_netlist(filename, num_qubits, netlist)
+    del netlist
+
+    stages = {}
+    netlist, stages['parse'] = measure(lambda: parser.get_netlist(filename), memory)
+    cd, stages['build_dag'] = measure(lambda: CircuitDAG(num_qubits, netlist), memory)
+    _, stages['dag_to_netlist'] = measure(lambda: circuit_dag_to_netlist(cd), memory)
+
+    # the passes rewrite in place, so every measured run gets a fresh DAG and the pipeline order is kept:
+    # cancellation runs on the output of the Hadamard reduction
+    after_hadamard = circuit_dag_to_netlist(hadamard_gate_reduction(CircuitDAG(num_qubits, netlist)))
+    _, stages['hadamard_gate_reduction'] = measure(hadamard_gate_reduction, memory,
+                                                   lambda: CircuitDAG(num_qubits, netlist))
+    stats, stages['single_qubit_gate_cancellation'] = measure(single_qubit_gate_cancellation, memory,
+                                                              lambda: CircuitDAG(num_qubits, after_hadamard))
+    for stage in stages.values():
+        add_rate(stage, num_gates)
+
+    gates_after = len(after_hadamard) - stats.gates_removed
+    return {
+        'kind': kind,
+        'size': size,
+        'num_qubits': num_qubits,
+        'num_gates': num_gates,
+        'stages': stages,
+        'gates_after_hadamard': len(after_hadamard),
+        'gates_after': gates_after,
+        'reduction': 1 - gates_after / num_gates if num_gates > 0 else 0.0,
+        'cancellation': stats.to_dict(),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark parsing, DAG construction and optimizer passes')
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    arg_parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--no-memory', dest='memory', action='store_false',
+                            help='skip the tracemalloc runs that measure peak memory')
+    arg_parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = arg_parser.parse_args()
+
+    records = []
+    with tempfile.TemporaryDirectory() as d:
+        for kind in args.kinds:
+            for size in args.sizes:
+                records.append(run_case(kind, size, d, args.memory, args.seed))
+
+    report = json.dumps(records, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
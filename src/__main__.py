@@ -0,0 +1,6 @@
+# python -m src netlist.txt circuits/ -o optimized/ --jobs 0 --report stats.json
+import sys
+
+from src.compiler import main
+
+sys.exit(main())
@@ -1,37 +1,99 @@
+import heapq
+
 from src.circuit_dag import CircuitDAG, Vertex
 from src.gate import Gate
 
 GARBAGE = 'IGNORE_THIS_GATE'
 
-def topological_sort_help(v, visited, stack):
-    visited.add(v.get_id())
+# Kahn's algorithm without recursion. Ready vertices are popped in order of their original gate index,
+# so an unmodified DAG comes back in netlist order and rewritten DAGs sort reproducibly. A ready vertex
+# is the first remaining gate on each of its wires, so the heap never holds more than num_qubits entries.
+def topological_sort(cd):
+    v_map = cd.get_vertex_map()
+    in_degree = {}
+    ready = []
 
-    for v_neighbor in v.get_output():
-        if not v_neighbor.get_id() in visited:
-            topological_sort_help(v_neighbor, visited, stack)
+    for iden, v in v_map.items():
+        in_degree[iden] = len(v.get_input())
+        if in_degree[iden] == 0:
+            ready.append(iden)
+    heapq.heapify(ready)
+
+    stack = []
+    while len(ready) > 0:
+        v = v_map[heapq.heappop(ready)]
+        stack.append(v)
+        for v_neighbor in v.get_output():
+            iden = v_neighbor.get_id()
+            in_degree[iden] -= 1
+            if in_degree[iden] == 0:
+                heapq.heappush(ready, iden)
 
+    assert len(stack) == len(v_map), 'circuit DAG contains a cycle'
+    return stack
 
-    stack.insert(0, v)
+SCHEDULES = ('asap', 'alap')
 
-def topological_sort(cd):
+# type: (CircuitDAG, Str) -> List[List[Vertex]]
+# Groups the gates into moments, layers of gates on disjoint wires that can run at the same time. 'asap' puts
+# every gate in the earliest layer after all of its inputs, 'alap' in the latest layer before all of its
+# outputs; both give as many layers as the circuit is deep. Linear in gates and edges: a FIFO Kahn's
+# algorithm gives a topological order, one sweep over it (backwards for alap) assigns the layers and the
+# gates are bucketed by their lowest wire first, so each layer lists its gates in wire order without sorting.
+def schedule_layers(cd, schedule='asap'):
+    if schedule not in SCHEDULES:
+        raise ValueError('unknown schedule %s, expected one of %s' % (schedule, ', '.join(SCHEDULES)))
     v_map = cd.get_vertex_map()
-    visited = set()
-    stack = []
+    in_degree = {}
+    order = []
+    for iden, v in v_map.items():
+        in_degree[iden] = len(v.get_input())
+        if in_degree[iden] == 0:
+            order.append(v)
+    # order grows while it is walked
+    i = 0
+    while i < len(order):
+        for v_neighbor in order[i].get_output():
+            iden = v_neighbor.get_id()
+            in_degree[iden] -= 1
+            if in_degree[iden] == 0:
+                order.append(v_neighbor)
+        i += 1
+    assert len(order) == len(v_map), 'circuit DAG contains a cycle'
 
-    for _,v in v_map.items():
-        if not v.get_id() in visited:
-            topological_sort_help(v, visited, stack)
-
-    return stack
+    layer = {}
+    if schedule == 'asap':
+        for v in order:
+            layer[v.get_id()] = max([layer[u.get_id()] + 1 for u in v.get_input()], default=0)
+    else:
+        # gates on the longest path to the end of the circuit, counted backwards from the last layer
+        for v in reversed(order):
+            layer[v.get_id()] = max([layer[u.get_id()] + 1 for u in v.get_output()], default=0)
+        last = max(layer.values(), default=0)
+        for iden in layer:
+            layer[iden] = last - layer[iden]
 
-def circuit_dag_to_netlist(cd):
-    netlist = []
+    by_wire = [[] for _ in range(cd.get_num_qubits())]
+    for v in order:
+        by_wire[min(v.get_gate_all_qubits())].append(v)
+    layers = [[] for _ in range(max(layer.values(), default=-1) + 1)]
+    for vertices in by_wire:
+        for v in vertices:
+            layers[layer[v.get_id()]].append(v)
+    return layers
 
-    top_sort_dag = topological_sort(cd)
-    for v in top_sort_dag:
-        netlist.append(v.get_gate().copy())
+# type: (CircuitDAG, Str, Bool) -> List[Gate]
+# Copies of the gates in topological_sort order, or with schedule 'asap' or 'alap' layer after layer as
+# schedule_layers groups them. With layers set the result is one list of gates per layer instead (asap unless
+# another schedule is given).
+def circuit_dag_to_netlist(cd, schedule=None, layers=False):
+    if schedule is None and not layers:
+        return [v.get_gate().copy() for v in topological_sort(cd)]
 
-    return netlist
+    moments = [[v.get_gate().copy() for v in moment] for moment in schedule_layers(cd, schedule or 'asap')]
+    if layers:
+        return moments
+    return [gate for moment in moments for gate in moment]
 
 
 def netlist_to_circuit_dag(num_qubits, netlist):
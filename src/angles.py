@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+
+from src.compact_circuit_dag import CompactCircuitDAG
+from src.optimizer_subroutines import ANGLE_EPSILON
+from src.pass_stats import PassStats
+
+QUARTER_PI = np.pi / 4
+# multiples k of pi / 4 (mod 8) that are a named gate up to global phase, R_z(k pi / 4) ~ diag(1, e^(i k pi / 4))
+SNAP_NAMES = {1: 'T', 2: 'P', 4: 'Z', 6: 'P_dag', 7: 'T_dag'}
+# NOT_SNAPPED marks angles that are no multiple of pi / 4 within the tolerance
+NOT_SNAPPED = -1
+
+
+# type: (np.ndarray) -> np.ndarray
+# angles wrapped into (-pi, pi], R_z(theta + 2 pi) only differs from R_z(theta) by a global phase
+def normalize_angles(thetas):
+    return np.pi - np.mod(np.pi - thetas, 2 * np.pi)
+
+# type: (np.ndarray, Float) -> Tuple[np.ndarray, np.ndarray]
+# Normalizes a whole array of angles at once and classifies them: the second array holds k in 0..7 for
+# angles within tolerance of k pi / 4, whose normalized angle is snapped to exactly that multiple, and
+# NOT_SNAPPED for the rest. k = 0 is an identity rotation.
+def fold_angles(thetas, tolerance=ANGLE_EPSILON):
+    thetas = normalize_angles(np.asarray(thetas, dtype=np.float64))
+    k = np.rint(thetas / QUARTER_PI)
+    snapped = np.abs(thetas - k * QUARTER_PI) < tolerance
+    thetas = np.where(snapped, k * QUARTER_PI, thetas)
+    return thetas, np.where(snapped, np.mod(k, 8), NOT_SNAPPED).astype(np.int8)
+
+# type: (CircuitDAG, np.ndarray) -> np.ndarray
+# R_z angles of the given vertex ids as one float64 array. A CompactCircuitDAG already keeps its angles in a
+# contiguous array indexed by vertex id, so this is a single gather; a CircuitDAG has them on its gates.
+def gather_thetas(cd, ids):
+    if isinstance(cd, CompactCircuitDAG):
+        return np.frombuffer(cd.thetas, dtype=np.float64)[ids]
+    v_map = cd.get_vertex_map()
+    return np.fromiter((v_map[i].get_gate().get_theta() for i in ids.tolist()), dtype=np.float64, count=len(ids))
+
+# type: (CircuitDAG, np.ndarray, np.ndarray) -> None
+# the inverse of gather_thetas, a single scatter into the angle array unless the undo journal has to see
+# every write
+def scatter_thetas(cd, ids, thetas):
+    if isinstance(cd, CompactCircuitDAG) and cd.undo_log is None:
+        np.frombuffer(cd.thetas, dtype=np.float64)[ids] = thetas
+        return
+    v_map = cd.get_vertex_map()
+    for i, theta in zip(ids.tolist(), thetas.tolist()):
+        v_map[i].set_gate_theta(theta)
+
+
+# Angle cleanup over every R_z of a DAG in one vectorized step: angles are wrapped into (-pi, pi], rotations
+# within tolerance of the identity are removed and, with snap set, rotations within tolerance of a multiple of
+# pi / 4 become P, P_dag, Z, T or T_dag (or get the exact angle for 3 pi / 4 and -3 pi / 4). Only the vertices
+# that change are touched afterwards. Snapped gates are no longer R_z, so the merging passes cannot combine
+# them any further: snapping belongs at the end of a pipeline.
+# type: (CircuitDAG, Float, Bool) -> PassStats
+def fold_rotations(cd, tolerance=ANGLE_EPSILON, snap=False):
+    stats = PassStats('snap_rotations' if snap else 'fold_rotations')
+    start_time = time.perf_counter()
+    stats.iterations = 1
+    v_map = cd.get_vertex_map()
+    num_gates = len(v_map)
+
+    ids = np.array(sorted(cd.collect_gate_ids('R_z')), dtype=np.int64)
+    old = gather_thetas(cd, ids)
+    stats.attempts = len(ids)
+    thetas, k = fold_angles(old, tolerance)
+
+    dropped = ids[k == 0].tolist()
+    for i in dropped:
+        cd.remove_vertex_and_merge(v_map[i])
+    named = np.isin(k, list(SNAP_NAMES)) if snap else np.zeros(len(ids), dtype=bool)
+    for i, k_i in zip(ids[named].tolist(), k[named].tolist()):
+        v = v_map[i]
+        v.set_gate_theta(None)
+        v.set_gate_name(SNAP_NAMES[k_i])
+    changed = (k != 0) & ~named & (thetas != old)
+    scatter_thetas(cd, ids[changed], thetas[changed])
+
+    stats.rewrites = len(dropped) + int(np.count_nonzero(named)) + int(np.count_nonzero(changed))
+    stats.gates_removed = num_gates - len(v_map)
+    stats.wall_time = time.perf_counter() - start_time
+    return stats
+
+# type: (CircuitDAG, Float) -> PassStats
+def snap_rotations(cd, tolerance=ANGLE_EPSILON):
+    return fold_rotations(cd, tolerance, snap=True)
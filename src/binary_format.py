@@ -0,0 +1,150 @@
+import io
+import mmap
+import struct
+import sys
+from array import array
+
+from src.gate import Gate
+from src.circuit_dag import CircuitDAG
+from src.compact_circuit_dag import CompactCircuitDAG
+from src.adapter import circuit_dag_to_netlist
+
+# Binary netlist layout, little endian, every section starts on an 8 byte boundary:
+#   header     magic, version, flags, num_qubits, num_names, names_bytes, num_gates, num_slots
+#   names      gate names joined by '\n', utf-8
+#   name_ids   uint16[num_gates]     index of each gate's name
+#   thetas     float64[num_gates]    R_z angle, NaN for other gates
+#   slot_start int64[num_gates + 1]  gate i acts on slot_wire[slot_start[i]:slot_start[i + 1]], target last
+#   slot_wire  int32[num_slots]
+# and when the HAS_LINKS flag is set, the per-wire links of CompactCircuitDAG:
+#   slot_prev, slot_next         int64[num_slots]
+#   first_on_wire, last_on_wire  int64[num_qubits]
+MAGIC = b'QCNL'
+VERSION = 1
+HAS_LINKS = 1
+HEADER = struct.Struct('<4sHHIIIQQ')
+ALIGNMENT = 8
+
+LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def padding(length):
+    return -length % ALIGNMENT
+
+def write_section(f, data):
+    if not LITTLE_ENDIAN and isinstance(data, array):
+        data = array(data.typecode, data)
+        data.byteswap()
+    data = bytes(data)
+    f.write(data)
+    f.write(b'\0' * padding(len(data)))
+
+# type: (BinaryIO, CompactCircuitDAG, Bool) -> None
+def write_compact_circuit_dag(f, cd, links):
+    # only freshly built DAGs are written directly, their arrays have no deleted vertices
+    assert cd.num_vertices == len(cd.name_ids)
+    names = '\n'.join(cd.name_list).encode('utf-8')
+    f.write(HEADER.pack(MAGIC, VERSION, HAS_LINKS if links else 0, cd.get_num_qubits(), len(cd.name_list),
+                        len(names), len(cd.name_ids), len(cd.slot_wire)))
+    f.write(b'\0' * padding(HEADER.size))
+    write_section(f, names)
+    for section in (cd.name_ids, cd.thetas, cd.slot_start, cd.slot_wire):
+        write_section(f, section)
+    if links:
+        for section in (cd.slot_prev, cd.slot_next, cd.first_on_wire, cd.last_on_wire):
+            write_section(f, section)
+
+# type: (Str, Int, Iterable[Gate], Bool) -> None
+def write_binary(filename, num_qubits, netlist, links=True):
+    with open(filename, 'wb') as f:
+        write_compact_circuit_dag(f, CompactCircuitDAG(num_qubits, netlist), links)
+
+# type: (Int, Iterable[Gate], Bool) -> Bytes
+def dumps(num_qubits, netlist, links=True):
+    f = io.BytesIO()
+    write_compact_circuit_dag(f, CompactCircuitDAG(num_qubits, netlist), links)
+    return f.getvalue()
+
+# type: (Str, CircuitDAG, Bool) -> None
+def write_circuit_dag(filename, cd, links=True):
+    write_binary(filename, cd.get_num_qubits(), circuit_dag_to_netlist(cd), links)
+
+
+# Read-only or copy-on-write view of a binary netlist. Sections are memoryviews cast straight over the
+# buffer, so opening a memory mapped file costs O(1) regardless of the number of gates.
+class BinaryNetlist:
+    def __init__(self, buffer):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        magic, version, flags, self.num_qubits, num_names, names_bytes, num_gates, num_slots = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not a version %d binary netlist' % VERSION)
+        self.offset = HEADER.size + padding(HEADER.size)
+
+        self.name_list = self.section(view, 'B', names_bytes).tobytes().decode('utf-8').split('\n')[:num_names]
+        self.name_ids = self.section(view, 'H', num_gates)
+        self.thetas = self.section(view, 'd', num_gates)
+        self.slot_start = self.section(view, 'q', num_gates + 1)
+        self.slot_wire = self.section(view, 'i', num_slots)
+
+        self.links = None
+        if flags & HAS_LINKS:
+            self.links = [self.section(view, 'q', num) for num in (num_slots, num_slots, self.num_qubits, self.num_qubits)]
+
+    def section(self, view, typecode, count):
+        start = self.offset
+        nbytes = count * struct.calcsize(typecode)
+        self.offset += nbytes + padding(nbytes)
+        if typecode == 'B':
+            return view[start:start + nbytes]
+        if LITTLE_ENDIAN:
+            return view[start:start + nbytes].cast(typecode)
+        data = array(typecode, view[start:start + nbytes].tobytes())
+        data.byteswap()
+        return data
+
+    def get_num_qubits(self):
+        return self.num_qubits
+
+    def __len__(self):
+        return len(self.name_ids)
+
+    def __getitem__(self, i):
+        name = self.name_list[self.name_ids[i]]
+        theta = self.thetas[i] if name == 'R_z' else None
+        return Gate.from_fields(name, self.slot_wire[self.slot_start[i]:self.slot_start[i + 1]], theta)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def get_netlist(self):
+        return list(self)
+
+    # type: () -> CompactCircuitDAG
+    # with stored links the DAG wraps the sections directly, the buffer must then be writable
+    def to_compact_circuit_dag(self):
+        if self.links is None:
+            return CompactCircuitDAG(self.num_qubits, self)
+        return CompactCircuitDAG.from_arrays(self.num_qubits, self.name_list, self.name_ids, self.thetas,
+                                             self.slot_start, self.slot_wire, *self.links)
+
+    def to_circuit_dag(self):
+        return CircuitDAG.from_stream(iter(self), self.num_qubits)
+
+
+# type: (Str) -> BinaryNetlist
+# The file is mapped copy-on-write: pages are read lazily and edits to a loaded DAG never reach the file.
+def read_binary(filename):
+    with open(filename, 'rb') as f:
+        return BinaryNetlist(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+
+# type: (Bytes) -> BinaryNetlist
+def loads(data):
+    return BinaryNetlist(bytearray(data))
+
+def load_compact_circuit_dag(filename):
+    return read_binary(filename).to_compact_circuit_dag()
+
+def load_circuit_dag(filename):
+    return read_binary(filename).to_circuit_dag()
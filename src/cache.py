@@ -0,0 +1,188 @@
+import hashlib
+import os
+import tempfile
+
+from src.binary_format import dumps, loads
+from src.parser import Parser, QASM_SUFFIX
+
+# bump when the passes change what they produce, old entries then simply stop matching
+CACHE_VERSION = 1
+DEFAULT_MAX_BYTES = 1 << 30
+ENTRY_SUFFIX = '.qcnl'
+
+
+# type: (Iterable[Str or Callable], Int, Float) -> Bytes
+# the pass configuration as hashed into every key, callables are named by module and qualified name
+def config_bytes(passes, max_rounds=None, time_budget=None):
+    names = [p if isinstance(p, str) else '%s.%s' % (p.__module__, p.__qualname__) for p in passes]
+    return repr((CACHE_VERSION, tuple(names), max_rounds, time_budget)).encode('utf-8')
+
+def gate_bytes(name, theta, qubits):
+    if theta is None:
+        return ('%s %s\n' % (name, ' '.join(map(str, qubits)))).encode('utf-8')
+    return ('%s %s %s\n' % (name, float(theta).hex(), ' '.join(map(str, qubits)))).encode('utf-8')
+
+# type: (Int, Iterable[Gate], Bytes) -> Str
+# Canonical hash of a netlist and a pass configuration: every gate contributes its name, its angle written
+# exactly and its qubits controls first, so spacing and number formatting in the source do not matter.
+# Without a qubit count the netlist is taken to span wires 0 to its highest one, as CircuitDAG.from_stream
+# does.
+def hash_netlist(num_qubits, netlist, config):
+    h = hashlib.sha256(config)
+    max_wire = -1
+    for gate in netlist:
+        h.update(gate_bytes(gate.get_name(), gate.get_theta(), gate.get_all_qubits()))
+        if num_qubits is None:
+            max_wire = max(max_wire, *gate.get_all_qubits())
+    if num_qubits is None:
+        num_qubits = max_wire + 1
+    h.update(b'INIT %d\n' % num_qubits)
+    return h.hexdigest()
+
+# type: (Str, Bytes) -> Tuple[Str, Int, Int]
+# Same key as hash_netlist for the netlist in a text file, read the way Parser reads it but without
+# building any Gate. Also returns the number of qubits and gates. A QASM file goes through the parser, it
+# gets the same key as the text file of the same netlist.
+def hash_netlist_file(filename, config):
+    if filename.endswith(QASM_SUFFIX):
+        parser = Parser()
+        netlist = list(parser.iter_gates(filename))
+        num_qubits = parser.get_num_qubits()
+        if num_qubits is None:
+            num_qubits = max((max(gate.get_all_qubits()) for gate in netlist), default=-1) + 1
+        return hash_netlist(num_qubits, netlist, config), num_qubits, len(netlist)
+    h = hashlib.sha256(config)
+    num_qubits = None
+    # only looked at until an INIT header turns up, which is the first line of almost every netlist
+    max_wire = -1
+    num_gates = 0
+    with open(filename, 'r') as f:
+        for line in f:
+            arr = line.split()
+            if len(arr) == 0:
+                continue
+            if arr[0] == 'INIT':
+                num_qubits = int(arr[1])
+            elif arr[0] == 'R_z':
+                qubits = [int(arr[2])]
+                h.update(gate_bytes('R_z', float(arr[1]), qubits))
+                num_gates += 1
+            else:
+                qubits = [int(q) for q in arr[1:]]
+                h.update(gate_bytes(arr[0], None, qubits))
+                num_gates += 1
+            if num_qubits is None and arr[0] != 'INIT':
+                max_wire = max(max_wire, *qubits)
+    if num_qubits is None:
+        num_qubits = max_wire + 1
+    h.update(b'INIT %d\n' % num_qubits)
+    return h.hexdigest(), num_qubits, num_gates
+
+
+# On-disk cache of optimized netlists, one binary netlist file per key under a two character fan-out
+# directory. Entries are written to a temporary file and renamed into place, so workers sharing the
+# directory never see a partial entry. A hit refreshes the entry's mtime and once the entries take more
+# than max_bytes the least recently used ones are deleted. The size of the directory is only walked on the
+# first put and when the running total crosses max_bytes, in between every put just adds its entry. A
+# worker's total does not see what other workers sharing the directory put, so the directory can run over
+# max_bytes by their entries until one of them crosses the limit and walks it again.
+class CompilationCache:
+    # type: (Str, Int) -> None
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # bytes of all entries as of the last walk plus the puts since, None before the first walk
+        self.total_bytes = None
+
+    def get_path(self, key):
+        return os.path.join(self.directory, key[:2], key + ENTRY_SUFFIX)
+
+    # type: (Str) -> Tuple[Int, List[Gate]]
+    # the cached (num_qubits, netlist) or None
+    def get(self, key):
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            block = loads(data)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return block.get_num_qubits(), block.get_netlist()
+
+    # type: (Str, Int, Iterable[Gate]) -> None
+    def put(self, key, num_qubits, netlist):
+        path = self.get_path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        data = dumps(num_qubits, netlist, links=False)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        if self.total_bytes is None:
+            self.total_bytes = self.get_size()
+        else:
+            self.total_bytes += len(data) - replaced
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    # type: () -> List[Tuple[Float, Int, Str]]
+    # (mtime, size, path) of every entry, entries deleted meanwhile by another worker are skipped
+    def get_entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for fan_out in os.scandir(self.directory):
+            if not fan_out.is_dir():
+                continue
+            for entry in os.scandir(fan_out.path):
+                if entry.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def get_size(self):
+        return sum(size for _, size, _ in self.get_entries())
+
+    # deletes least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = self.get_entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+
+# CompilationCache instances by (directory, max_bytes), so the compiles run by one process share a running
+# total and do not each walk the directory again
+open_caches = {}
+
+# type: (Str, Int) -> CompilationCache
+def get_cache(directory, max_bytes=DEFAULT_MAX_BYTES):
+    key = (os.path.abspath(directory), max_bytes)
+    cache = open_caches.get(key)
+    if cache is None:
+        cache = open_caches[key] = CompilationCache(directory, max_bytes)
+    return cache
@@ -1,4 +1,13 @@
-from src.gate import Gate
+import heapq
+from collections import deque
+from collections.abc import Mapping
+
+from src.gate import Gate, GARBAGE, Opcode, lookup_name
+
+# Levels of a freshly built DAG are spaced this far apart, so the +1 steps a swap makes to restore the
+# ordering are absorbed by the next gap instead of rippling through the rest of the circuit.
+LEVEL_GAP = 1 << 32
+TWO_QUBIT_OPCODES = (Opcode.CNOT, Opcode.CZ)
 
 class Vertex:
     def __init__(self, iden, gate):
@@ -6,6 +15,12 @@ class Vertex:
         self.iden = iden
         self.input = set() # type: Set[Vertex]
         self.output = set() #  type: Set[Vertex]
+        self.cd = None # owning CircuitDAG, journals edits while a checkpoint is open
+        self.level = 0 # strictly increases along every edge, see CircuitDAG.raise_levels
+
+    def log_undo(self, undo, *args):
+        if self.cd is not None:
+            self.cd.log_undo(undo, *args)
 
     def get_id(self):
         return self.iden
@@ -24,12 +39,31 @@ class Vertex:
         return self.gate.get_name()
 
     def set_gate_name(self, new_name):
-        self.gate.set_name(new_name)
+        self.log_undo(self.rename, self.gate.get_name())
+        self.rename(new_name)
+
+    # renames without journaling and keeps the opcode index of the owning DAG current
+    def rename(self, name):
+        opcode = self.gate.get_opcode()
+        self.gate.set_name(name)
+        if self.cd is not None:
+            self.cd.reindex(self, opcode)
+
+    def set_gate_theta(self, theta):
+        self.log_undo(self.gate.set_theta, self.gate.get_theta())
+        self.gate.set_theta(theta)
 
     # type: (None) -> List[Int]
     def get_gate_all_qubits(self):
         return self.gate.get_all_qubits()
 
+    def get_level(self):
+        return self.level
+
+    def set_level(self, level):
+        self.log_undo(setattr, self, 'level', self.level)
+        self.level = level
+
     def get_input(self):
         return self.input
 
@@ -37,46 +71,62 @@ class Vertex:
         return self.output
 
     def add_input(self, inp):
-        # search for repeats
-        if type(inp) == Vertex:
-            self.input.add(inp)
-        else: 
-            self.input.update(inp)
+        if isinstance(inp, Vertex):
+            inp = [inp]
+        for v in inp:
+            # only journal vertices that were not already neighbors
+            if v not in self.input:
+                self.input.add(v)
+                self.log_undo(self.input.discard, v)
 
     def add_output(self, out):
-        # search for repeats
-        if type(out) == Vertex:
-            self.output.add(out)
-        else:
-            self.output.update(out)
+        if isinstance(out, Vertex):
+            out = [out]
+        for v in out:
+            if v not in self.output:
+                self.output.add(v)
+                self.log_undo(self.output.discard, v)
 
     def remove_input(self, inp):
         self.input.remove(inp)
+        self.log_undo(self.input.add, inp)
 
     def remove_output(self, out):
         self.output.remove(out)
+        self.log_undo(self.output.add, out)
+
+    # type: (Int) -> Vertex
+    # Several inputs can touch the wire when a gate is also adjacent to them through another wire. They are
+    # all ordered along the wire, so the nearest one is the one with the highest level.
+    def get_prev_on_wire(self, wire):
+        prev = None
+        for v in self.input:
+            if wire in v.gate.all_qubits and (prev is None or v.level > prev.level):
+                prev = v
+        return prev
+
+    # type: (Int) -> Vertex
+    def get_next_on_wire(self, wire):
+        nxt = None
+        for v in self.output:
+            if wire in v.gate.all_qubits and (nxt is None or v.level < nxt.level):
+                nxt = v
+        return nxt
 
 
     def set_target(self, target):
-        self.gate.target = target
+        self.log_undo(self.gate.set_target, self.gate.get_target())
+        self.gate.set_target(target)
 
     def set_controls(self, controls):
-        self.gate.controls = controls
-
-    def is_dagger_to(v):
-        if v.get_gate_name().find('_dag') > -1 and self.get_gate_name().find('_dag') == -1:
-            dag_gate = v
-            undag_gate = self
-        elif self.get_gate_name().find('_dag') > -1 and c.get_gate_name().find('_dag') == -1:
-            dag_gate = self
-            undag_gate = v
-        else:
-            return False
+        self.log_undo(self.gate.set_controls, self.gate.get_controls())
+        self.gate.set_controls(controls)
 
-        dag_gate_name = "".join(dag_gate.get_gate_name().split('_dag'))
-        undag_gate_name = undag.get_gate_name()
+    def get_gate_opcode(self):
+        return self.gate.get_opcode()
 
-        return dag_gate_name == undag_gate_name 
+    def is_dagger_to(self, v):
+        return self.gate.is_dagger_to(v.get_gate())
 
     def is_gate_delted(self):
         return self.gate.is_deleted()
@@ -95,21 +145,46 @@ class CircuitDAG:
     def __init__(self, num_qubits, netlist):
         self.vertex_map = {}
         self.num_qubits = num_qubits
+        self.undo_log = None # type: List[Tuple[Callable, Tuple]], None when no checkpoint is open
+        self.checkpoints = []
+        # secondary indexes, every edit below keeps them current
+        self.opcode_index = {} # type: Dict[Opcode, Set[Int]], names outside the Opcode enum are under None
+        self.first_on_wire = {} # type: Dict[Int, Vertex]
+        self.last_on_wire = {} # type: Dict[Int, Vertex]
+        self.depths = None # type: Dict[Int, Int], built on first use, see get_depth
 
-        lru_qubits = [-1] * num_qubits
         for i, gate in enumerate(netlist):
-            vertex = Vertex(i, gate.copy())
-            self.vertex_map[i] = vertex
-           
-            # Find any predecessors if they exist to update DAG, then update the LRU per qubit with the current gate
-            all_qubits = gate.get_all_qubits()
-            for qub in all_qubits:
-                lru_gate_index = lru_qubits[qub]
-                if lru_gate_index > -1:
-                    in_vertex = self.vertex_map[lru_gate_index]
-                    vertex.add_input(in_vertex)
-                    in_vertex.add_output(vertex)
-                lru_qubits[qub] = vertex.get_id()
+            self.append_vertex(Vertex(i, gate.copy()))
+
+    # type: (Iterable[Gate], Int) -> CircuitDAG
+    # Builds the DAG while consuming a gate iterator such as Parser.iter_gates, so the netlist is never
+    # materialized. The DAG takes ownership of the gates. num_qubits grows to cover every wire seen.
+    @classmethod
+    def from_stream(cls, gates, num_qubits=None):
+        cd = cls(0 if num_qubits is None else num_qubits, [])
+        for i, gate in enumerate(gates):
+            cd.append_vertex(Vertex(i, gate))
+        if len(cd.last_on_wire) > 0:
+            cd.num_qubits = max(cd.num_qubits, max(cd.last_on_wire) + 1)
+        return cd
+
+    # type: (Vertex) -> None
+    def append_vertex(self, vertex):
+        vertex.cd = self
+        self.vertex_map[vertex.get_id()] = vertex
+        self.opcode_index.setdefault(vertex.get_gate_opcode(), set()).add(vertex.get_id())
+
+        # Find any predecessors if they exist to update DAG, then make the current gate the last on its wires
+        for qub in vertex.get_gate_all_qubits():
+            in_vertex = self.last_on_wire.get(qub)
+            if in_vertex is None:
+                self.first_on_wire[qub] = vertex
+            else:
+                vertex.add_input(in_vertex)
+                in_vertex.add_output(vertex)
+                vertex.level = max(vertex.level, in_vertex.level + LEVEL_GAP)
+            self.last_on_wire[qub] = vertex
+        self.mark_depths([vertex.get_id()])
 
     def get_vertex_map(self):
         return self.vertex_map
@@ -118,48 +193,478 @@ class CircuitDAG:
     def get_num_qubits(self):
         return self.num_qubits
 
+    # type: (Str) -> Set[Int]
+    # O(k) in the number of gates sharing the opcode of gate_name, P and P_dag for instance
     def collect_gate_ids(self, gate_name):
-        ids = set()
-        for iden, vertex in self.vertex_map.items():
-            if vertex.get_gate().get_name() == gate_name:
-                ids.add(vertex.get_id())
-        return ids
+        name, _, opcode, _ = lookup_name(gate_name)
+        v_map = self.get_vertex_map()
+        return {iden for iden in self.get_opcode_index().get(opcode, ()) if v_map[iden].get_gate_name() == name}
+
+    # type: (Opcode) -> Set[Int]
+    def collect_opcode_ids(self, opcode):
+        return set(self.get_opcode_index().get(opcode, ()))
+
+    def get_opcode_index(self):
+        return self.opcode_index
+
+    # Live metrics. The counts are sizes of opcode index buckets, which every edit keeps current.
+    # type: () -> Int
+    def get_num_gates(self):
+        return len(self.get_vertex_map())
+
+    # type: (Opcode) -> Int
+    def get_opcode_count(self, opcode):
+        return len(self.get_opcode_index().get(opcode, ()))
+
+    # type: () -> Dict[Opcode, Int]
+    def get_opcode_counts(self):
+        return {opcode: len(ids) for opcode, ids in self.get_opcode_index().items() if len(ids) > 0}
+
+    def get_num_two_qubit_gates(self):
+        return sum(self.get_opcode_count(opcode) for opcode in TWO_QUBIT_OPCODES)
+
+    def get_num_rotations(self):
+        return self.get_opcode_count(Opcode.R_z)
+
+    # type: () -> Dict
+    def get_metrics(self):
+        return {
+            'gates': self.get_num_gates(),
+            'two_qubit_gates': self.get_num_two_qubit_gates(),
+            'rotations': self.get_num_rotations(),
+            'depth': self.get_depth(),
+            'opcodes': {'other' if opcode is None else opcode.value: n for opcode, n in self.get_opcode_counts().items()},
+        }
+
+    # Exact depth, the number of gates on the longest path ending in a gate, for every gate plus how many gates
+    # have each depth. Built on the first get_depth, after which removals and swaps mark the gates whose depth
+    # may have changed and the next get_depth updates those and whatever they feed, stopping where the depth
+    # comes out unchanged. Marked gates are taken in level order, so each one is updated after its inputs.
+    # type: () -> Int
+    def get_depth(self):
+        if self.depths is None:
+            self.build_depths()
+        self.update_depths()
+        while self.max_depth > 0 and self.depth_counts.get(self.max_depth, 0) == 0:
+            self.max_depth -= 1
+        return self.max_depth
+
+    # type: (Int) -> Int
+    def get_gate_depth(self, iden):
+        self.get_depth()
+        return self.depths[iden]
+
+    def build_depths(self):
+        # rolling back past this point drops the depths again, they do not know the edits made before it
+        self.log_undo(setattr, self, 'depths', None)
+        self.depths = {}
+        self.depth_counts = {} # type: Dict[Int, Int]
+        self.max_depth = 0
+        self.dirty_depths = set() # type: Set[Int]
+        depths = self.depths
+        for v in sorted(self.get_vertex_map().values(), key=lambda v: v.get_level()):
+            self.put_depth(v.get_id(), 1 + max([depths[u.get_id()] for u in v.get_input()], default=0))
+
+    # type: (Int, Int) -> None
+    # sets or with None removes the depth of a gate without journaling
+    def put_depth(self, iden, depth):
+        old = self.depths.pop(iden, None)
+        if old is not None:
+            self.depth_counts[old] -= 1
+        if depth is not None:
+            self.depths[iden] = depth
+            self.depth_counts[depth] = self.depth_counts.get(depth, 0) + 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def set_depth(self, iden, depth):
+        self.log_undo(self.put_depth, iden, self.depths.get(iden))
+        self.put_depth(iden, depth)
+
+    # type: (Iterable[Int]) -> None
+    def mark_depths(self, idens):
+        if self.depths is not None:
+            self.dirty_depths.update(idens)
+
+    def update_depths(self):
+        dirty = self.dirty_depths
+        if len(dirty) == 0:
+            return
+        self.log_undo(setattr, self, 'dirty_depths', dirty)
+        self.dirty_depths = set()
+
+        v_map = self.get_vertex_map()
+        depths = self.depths
+        heap = [(v.get_level(), v.get_id()) for v in (v_map.get(iden) for iden in dirty) if v is not None]
+        heapq.heapify(heap)
+        queued = {iden for _, iden in heap}
+        while len(heap) > 0:
+            _, iden = heapq.heappop(heap)
+            v = v_map[iden]
+            depth = 1 + max([depths[u.get_id()] for u in v.get_input()], default=0)
+            if depth == depths.get(iden):
+                continue
+            self.set_depth(iden, depth)
+            for u in v.get_output():
+                if u.get_id() not in queued:
+                    queued.add(u.get_id())
+                    heapq.heappush(heap, (u.get_level(), u.get_id()))
+
+    # type: (Int) -> Vertex
+    def get_first_on_wire(self, wire):
+        return self.first_on_wire.get(wire)
+
+    # type: (Int) -> Vertex
+    def get_last_on_wire(self, wire):
+        return self.last_on_wire.get(wire)
+
+    # type: (Int) -> Iterator[Vertex]
+    # the gates on one wire in circuit order, without touching the rest of the DAG
+    def iter_wire(self, wire):
+        v = self.get_first_on_wire(wire)
+        while v is not None:
+            yield v
+            v = v.get_next_on_wire(wire)
+
+    # type: (Dict[Int, Vertex], Int, Vertex) -> None
+    def set_wire_end(self, ends, wire, vertex):
+        if wire in ends:
+            self.log_undo(ends.__setitem__, wire, ends[wire])
+        else:
+            self.log_undo(ends.pop, wire)
+        ends[wire] = vertex
+
+    # type: (Vertex, Opcode) -> None
+    # moves a renamed vertex to the bucket of its new opcode, removed vertices are no longer in any bucket
+    def reindex(self, vertex, old_opcode):
+        opcode_index = self.opcode_index
+        opcode = vertex.get_gate_opcode()
+        if opcode_index is None or opcode == old_opcode:
+            return
+        ids = opcode_index.get(old_opcode)
+        if ids is not None and vertex.get_id() in ids:
+            ids.discard(vertex.get_id())
+            opcode_index.setdefault(opcode, set()).add(vertex.get_id())
+
+    def add_to_index(self, vertex):
+        if self.opcode_index is not None:
+            self.opcode_index.setdefault(vertex.get_gate_opcode(), set()).add(vertex.get_id())
+
+    def remove_from_index(self, vertex):
+        if self.opcode_index is not None:
+            self.opcode_index[vertex.get_gate_opcode()].discard(vertex.get_id())
+            self.log_undo(self.add_to_index, vertex)
 
 
     # type: (Vertex) -> None
     def remove_vertex_and_merge(self, vertex):
         iden = vertex.get_id()
-        inp = vertex.get_input()
-        out = vertex.get_output()
+        wires = vertex.get_gate_all_qubits()
+        before = [vertex.get_prev_on_wire(w) for w in wires]
+        after = [vertex.get_next_on_wire(w) for w in wires]
 
-        # remove this vertex's references in its neighbors and connect neighbors together
-        for inp_v in inp:
+        # remove this vertex's references in its neighbors and connect neighbors together on each of its wires
+        for inp_v in vertex.get_input():
             inp_v.remove_output(vertex)
-            new_wires = get_all_vertices_on_wires(vertex.get_output(), set(inp_v.get_gate_all_qubits()))
-            inp_v.add_output(new_wires)
-            
-        for out_v in out:
+        for out_v in vertex.get_output():
             out_v.remove_input(vertex)
-            new_wires = get_all_vertices_on_wires(vertex.get_input(), set(out_v.get_gate_all_qubits()))
-            out_v.add_input(new_wires)
-           
+        for w, inp_v, out_v in zip(wires, before, after):
+            if inp_v is not None and out_v is not None:
+                inp_v.add_output(out_v)
+                out_v.add_input(inp_v)
+            if self.get_first_on_wire(w) is vertex:
+                self.set_wire_end(self.first_on_wire, w, out_v)
+            if self.get_last_on_wire(w) is vertex:
+                self.set_wire_end(self.last_on_wire, w, inp_v)
 
         del self.vertex_map[vertex.get_id()]
-        vertex.get_gate().delete() # renames the gate name for deletion
+        self.log_undo(self.vertex_map.__setitem__, iden, vertex)
+        self.remove_from_index(vertex)
+        vertex.set_gate_name(GARBAGE) # renames the gate name for deletion
+        if self.depths is not None:
+            self.set_depth(iden, None)
+            self.mark_depths(v.get_id() for v in after if v is not None)
+
+    # type: (Vertex, Vertex) -> None
+    def swap_2_vertex_neighbors(self, v1, v2):
+        # v1 is to the left of v2 and directly precedes it on every wire they share
+        assert v2 in v1.get_output()
+        assert v1 in v2.get_input()
+        v1_wires = set(v1.get_gate_all_qubits())
+        v2_wires = set(v2.get_gate_all_qubits())
+        shared = v1_wires.intersection(v2_wires)
+        assert all(v1.get_next_on_wire(w) is v2 for w in shared)
+
+        before = [v1.get_prev_on_wire(w) for w in shared]
+        after = [v2.get_next_on_wire(w) for w in shared]
+        for w in shared:
+            if self.get_first_on_wire(w) is v1:
+                self.set_wire_end(self.first_on_wire, w, v2)
+            if self.get_last_on_wire(w) is v2:
+                self.set_wire_end(self.last_on_wire, w, v1)
+        # neighbors that stay attached through a wire only one of the two gates is on
+        v1_kept_inputs = {v1.get_prev_on_wire(w) for w in v1_wires.difference(shared)}
+        v2_kept_outputs = {v2.get_next_on_wire(w) for w in v2_wires.difference(shared)}
+
+        v1.remove_output(v2)
+        v2.remove_input(v1)
+        for v in before:
+            if v is not None:
+                if v not in v1_kept_inputs and v in v1.get_input():
+                    v.remove_output(v1)
+                    v1.remove_input(v)
+                v.add_output(v2)
+                v2.add_input(v)
+        for v in after:
+            if v is not None:
+                if v not in v2_kept_outputs and v in v2.get_output():
+                    v2.remove_output(v)
+                    v.remove_input(v2)
+                v.add_input(v1)
+                v1.add_output(v)
+        v1.add_input(v2)
+        v2.add_output(v1)
+
+        v2.set_level(max([v.get_level() + 1 for v in v2.get_input()] + [0]))
+        v1.set_level(max(v.get_level() + 1 for v in v1.get_input()))
+        self.raise_levels(v1)
+        # the gates after v1 on the shared wires followed v2 before
+        self.mark_depths([v1.get_id(), v2.get_id()] + [v.get_id() for v in v1.get_output()])
+
+    # Levels only have to increase strictly along edges, which removals never break. After a swap the
+    # successors of the moved gate are pushed up until that holds again.
+    # type: (Vertex) -> None
+    def raise_levels(self, vertex):
+        stack = [vertex]
+        while len(stack) > 0:
+            v = stack.pop()
+            for v_out in v.get_output():
+                if v_out.get_level() <= v.get_level():
+                    v_out.set_level(v.get_level() + 1)
+                    stack.append(v_out)
+
+    # type: (Vertex, Vertex) -> Bool
+    # Reachability oracle. A path needs the level to grow along every edge, so start can only reach end if
+    # its level is lower, and the breadth first search only visits vertices with levels in between.
+    def exists_path(self, start, end):
+        if start == end:
+            return True
+        end_level = end.get_level()
+        if start.get_level() >= end_level:
+            return False
 
-    '''
-    # TODO
-    # type (None) -> CircuitDAG
-    def copy():
-    ''' 
-        
-            
-        
+        visited = {start}
+        queue = deque([start])
+        while len(queue) > 0:
+            for v_out in queue.popleft().get_output():
+                if v_out == end:
+                    return True
+                if v_out.get_level() < end_level and v_out not in visited:
+                    visited.add(v_out)
+                    queue.append(v_out)
+        return False
+
+    # Undo journal: while a checkpoint is open every edge edit, rename and removal appends its inverse,
+    # so a rollback costs time proportional to the edits made since the checkpoint.
+    def log_undo(self, undo, *args):
+        if self.undo_log is not None:
+            self.undo_log.append((undo, args))
+
+    # type: () -> Int
+    def checkpoint(self):
+        if self.undo_log is None:
+            self.undo_log = []
+        token = len(self.undo_log)
+        self.checkpoints.append(token)
+        return token
+
+    # type: (Int) -> None
+    def commit(self, token):
+        assert len(self.checkpoints) > 0 and self.checkpoints[-1] == token, 'checkpoints must be closed innermost first'
+        self.checkpoints.pop()
+        if len(self.checkpoints) == 0:
+            self.undo_log = None
+
+    # type: (Int) -> None
+    def rollback(self, token):
+        assert len(self.checkpoints) > 0 and self.checkpoints[-1] == token, 'checkpoints must be closed innermost first'
+        while len(self.undo_log) > token:
+            undo, args = self.undo_log.pop()
+            undo(*args)
+        self.commit(token)
+
+    # type: () -> CircuitDAG
+    # Clones vertices and edges directly in O(V + E), gates are copied field by field without re-parsing.
+    # Works on any DAG exposing the vertex API; the copy has no open checkpoints.
+    def copy(self):
+        cd = CircuitDAG(self.num_qubits, [])
+        v_map = cd.vertex_map
+        for iden, v in self.get_vertex_map().items():
+            vertex = Vertex(iden, v.get_gate().copy())
+            vertex.cd = cd
+            vertex.level = v.get_level()
+            v_map[iden] = vertex
+        for iden, v in self.get_vertex_map().items():
+            vertex = v_map[iden]
+            vertex.input = {v_map[u.get_id()] for u in v.get_input()}
+            vertex.output = {v_map[u.get_id()] for u in v.get_output()}
+            cd.add_to_index(vertex)
+        for wire in range(self.num_qubits):
+            for ends, end in ((cd.first_on_wire, self.get_first_on_wire(wire)), (cd.last_on_wire, self.get_last_on_wire(wire))):
+                if end is not None:
+                    ends[wire] = v_map[end.get_id()]
+        return cd
+
+    # type: () -> SnapshotCircuitDAG
+    # copy-on-write fork of this DAG, see SnapshotCircuitDAG
+    def snapshot(self):
+        return SnapshotCircuitDAG(self)
+
+
+# Vertex of a SnapshotCircuitDAG. Until its first edit it has no state of its own: gate, level and edges are
+# read through from the vertex of the base DAG, neighbors being mapped to the snapshot's own vertices. The
+# first edit copies that state in, after which it behaves like a plain Vertex. get_gate returns the base
+# gate while the vertex is shared, so gates must be changed through the vertex setters.
+class SnapshotVertex(Vertex):
+    def __init__(self, cd, base):
+        self.iden = base.get_id()
+        self.cd = cd
+        self.base = base
+
+    # only called for the attributes a shared vertex has not copied yet
+    def __getattr__(self, name):
+        base = self.__dict__.get('base')
+        if base is None:
+            raise AttributeError(name)
+        if name == 'gate':
+            return base.get_gate()
+        if name == 'level':
+            return base.get_level()
+        if name == 'input':
+            return {self.cd.get_vertex(u.get_id()) for u in base.get_input()}
+        if name == 'output':
+            return {self.cd.get_vertex(u.get_id()) for u in base.get_output()}
+        raise AttributeError(name)
+
+    def is_shared(self):
+        return 'gate' not in self.__dict__
+
+    def materialize(self):
+        if self.is_shared():
+            base = self.base
+            self.input = self.input
+            self.output = self.output
+            self.level = base.get_level()
+            self.gate = base.get_gate().copy()
+            self.cd.num_materialized += 1
 
+    def set_gate_name(self, new_name):
+        self.materialize()
+        Vertex.set_gate_name(self, new_name)
 
+    def set_gate_theta(self, theta):
+        self.materialize()
+        Vertex.set_gate_theta(self, theta)
 
-        
- 
-    
+    def set_level(self, level):
+        self.materialize()
+        Vertex.set_level(self, level)
 
+    def add_input(self, inp):
+        self.materialize()
+        Vertex.add_input(self, inp)
 
+    def add_output(self, out):
+        self.materialize()
+        Vertex.add_output(self, out)
+
+    def remove_input(self, inp):
+        self.materialize()
+        Vertex.remove_input(self, inp)
+
+    def remove_output(self, out):
+        self.materialize()
+        Vertex.remove_output(self, out)
+
+    def set_target(self, target):
+        self.materialize()
+        Vertex.set_target(self, target)
+
+    def set_controls(self, controls):
+        self.materialize()
+        Vertex.set_controls(self, controls)
+
+
+class SnapshotVertexMap(Mapping):
+    def __init__(self, cd):
+        self.cd = cd
+        self.removed = set()
+
+    def __getitem__(self, iden):
+        if iden in self.removed or iden not in self.cd.base.get_vertex_map():
+            raise KeyError(iden)
+        return self.cd.get_vertex(iden)
+
+    def __iter__(self):
+        for iden in self.cd.base.get_vertex_map():
+            if iden not in self.removed:
+                yield iden
+
+    def __len__(self):
+        return len(self.cd.base.get_vertex_map()) - len(self.removed)
+
+    def __delitem__(self, iden):
+        self.removed.add(iden)
+
+    # only used to undo a removal
+    def __setitem__(self, iden, vertex):
+        self.removed.discard(iden)
+
+
+# Copy-on-write fork of a CircuitDAG (or of any DAG with the same API, another snapshot included). Creating
+# one is O(1); vertices are wrapped on first access and only the ones a pass edits copy their state, so
+# speculative rewrites pay for what they touch. The base must not change while the snapshot is in use.
+class SnapshotCircuitDAG(CircuitDAG):
+    def __init__(self, base):
+        self.base = base
+        self.num_qubits = base.get_num_qubits()
+        self.undo_log = None
+        self.checkpoints = []
+        self.vertices = {}
+        self.num_materialized = 0
+        self.vertex_map = SnapshotVertexMap(self)
+        # wire ends that differ from the base, the opcode index is built on first use
+        self.first_on_wire = {}
+        self.last_on_wire = {}
+        self.opcode_index = None
+        self.depths = None
+
+    # type: (Int) -> SnapshotVertex
+    def get_vertex(self, iden):
+        vertex = self.vertices.get(iden)
+        if vertex is None:
+            vertex = SnapshotVertex(self, self.base.get_vertex_map()[iden])
+            self.vertices[iden] = vertex
+        return vertex
+
+    def get_num_materialized(self):
+        return self.num_materialized
+
+    def get_opcode_index(self):
+        if self.opcode_index is None:
+            self.opcode_index = {}
+            for v in self.vertex_map.values():
+                self.add_to_index(v)
+        return self.opcode_index
+
+    def get_first_on_wire(self, wire):
+        if wire in self.first_on_wire:
+            return self.first_on_wire[wire]
+        return self.wrap(self.base.get_first_on_wire(wire))
+
+    def get_last_on_wire(self, wire):
+        if wire in self.last_on_wire:
+            return self.last_on_wire[wire]
+        return self.wrap(self.base.get_last_on_wire(wire))
+
+    def wrap(self, base_vertex):
+        return None if base_vertex is None else self.get_vertex(base_vertex.get_id())
@@ -0,0 +1,334 @@
+from array import array
+from collections.abc import Mapping
+
+from src.circuit_dag import CircuitDAG, LEVEL_GAP
+from src.gate import Gate, lookup_name
+
+NO_VERTEX = -1
+
+
+# Lightweight handle on a vertex of a CompactCircuitDAG. It exposes the same API as Vertex so the optimizer
+# subroutines can run on either representation. Handles are created on demand and compare equal by id.
+class CompactVertex:
+    __slots__ = ('cd', 'iden')
+
+    def __init__(self, cd, iden):
+        self.cd = cd
+        self.iden = iden
+
+    def __eq__(self, other):
+        return isinstance(other, CompactVertex) and self.iden == other.iden and self.cd is other.cd
+
+    def __hash__(self):
+        return hash(self.iden)
+
+    def __repr__(self):
+        return 'CompactVertex(%d, %s)' % (self.iden, self.get_gate_name())
+
+    def get_id(self):
+        return self.iden
+
+    # the returned gate is a detached copy, mutate through the vertex setters instead
+    def get_gate(self):
+        return self.cd.get_gate(self.iden)
+
+    def get_gate_target(self):
+        return self.cd.slot_wire[self.cd.slot_start[self.iden + 1] - 1]
+
+    def get_gate_controls(self):
+        if self.cd.get_name(self.iden) == 'R_z':
+            return []
+        return list(self.cd.get_wires(self.iden)[:-1])
+
+    def get_gate_name(self):
+        return self.cd.get_name(self.iden)
+
+    def get_gate_opcode(self):
+        return lookup_name(self.cd.get_name(self.iden))[2]
+
+    def set_gate_name(self, new_name):
+        self.cd.log_undo(self.rename, self.get_gate_name())
+        self.rename(new_name)
+
+    def rename(self, name):
+        opcode = self.get_gate_opcode()
+        self.cd.name_ids[self.iden] = self.cd.get_name_id(name)
+        self.cd.reindex(self, opcode)
+
+    def set_gate_theta(self, theta):
+        self.cd.set_item(self.cd.thetas, self.iden, float('nan') if theta is None else theta)
+
+    def get_gate_all_qubits(self):
+        return list(self.cd.get_wires(self.iden))
+
+    def get_level(self):
+        return self.cd.levels[self.iden]
+
+    def set_level(self, level):
+        self.cd.set_item(self.cd.levels, self.iden, level)
+
+    def get_prev_on_wire(self, wire):
+        iden = self.cd.get_prev_on_wire(self.iden, wire)
+        return None if iden == NO_VERTEX else CompactVertex(self.cd, iden)
+
+    def get_next_on_wire(self, wire):
+        iden = self.cd.get_next_on_wire(self.iden, wire)
+        return None if iden == NO_VERTEX else CompactVertex(self.cd, iden)
+
+    def get_input(self):
+        return self.cd.get_neighbors(self.iden, self.cd.slot_prev)
+
+    def get_output(self):
+        return self.cd.get_neighbors(self.iden, self.cd.slot_next)
+
+    # a gate keeps its wires, so moving the target onto a control wire exchanges the two roles
+    def set_target(self, target):
+        old_target = self.get_gate_target()
+        controls = [old_target if w == target else w for w in self.get_gate_controls()]
+        self.cd.reorder_wires(self.iden, controls + [target])
+
+    def set_controls(self, controls):
+        target = self.get_gate_target()
+        if target in controls:
+            target = set(self.get_gate_all_qubits()).difference(controls).pop()
+        self.cd.reorder_wires(self.iden, list(controls) + [target])
+
+    def is_gate_delted(self):
+        return not self.cd.alive[self.iden]
+
+
+class CompactVertexMap(Mapping):
+    def __init__(self, cd):
+        self.cd = cd
+
+    def __getitem__(self, iden):
+        if not isinstance(iden, int) or not 0 <= iden < len(self.cd.alive) or not self.cd.alive[iden]:
+            raise KeyError(iden)
+        return CompactVertex(self.cd, iden)
+
+    def __iter__(self):
+        alive = self.cd.alive
+        for iden in range(len(alive)):
+            if alive[iden]:
+                yield iden
+
+    def __len__(self):
+        return self.cd.num_vertices
+
+
+# CircuitDAG stored as flat arrays instead of Vertex objects holding neighbor sets. Every vertex owns one
+# slot per wire it touches (slot_start[i]:slot_start[i + 1]); each slot records the wire and the ids of the
+# previous and next gate on that wire, so every qubit is a doubly linked list of gates and neighbor lookup on
+# a given wire is O(1). Edits go through set_item so the undo journal of CircuitDAG keeps working.
+class CompactCircuitDAG(CircuitDAG):
+    def __init__(self, num_qubits, netlist):
+        self.num_qubits = num_qubits
+        self.undo_log = None
+        self.checkpoints = []
+
+        # gate names are stored as 16 bit indices into name_list
+        self.name_list = []
+        self.name_index = {}
+        self.name_ids = array('H')
+        self.thetas = array('d')
+        self.slot_start = array('q', [0])
+        self.slot_wire = array('i')
+        self.slot_prev = array('q')
+        self.slot_next = array('q')
+        self.first_on_wire = array('q', [NO_VERTEX]) * num_qubits
+        self.last_on_wire = array('q', [NO_VERTEX]) * num_qubits
+        # slot index of the last gate on each wire, only needed while building
+        last_slot = array('q', [NO_VERTEX]) * num_qubits
+
+        for i, gate in enumerate(netlist):
+            self.name_ids.append(self.get_name_id(gate.get_name()))
+            theta = gate.get_theta()
+            self.thetas.append(float('nan') if theta is None else theta)
+
+            for qub in gate.get_all_qubits():
+                slot = len(self.slot_wire)
+                prev = self.last_on_wire[qub]
+                self.slot_wire.append(qub)
+                self.slot_prev.append(prev)
+                self.slot_next.append(NO_VERTEX)
+                if prev == NO_VERTEX:
+                    self.first_on_wire[qub] = i
+                else:
+                    self.slot_next[last_slot[qub]] = i
+                self.last_on_wire[qub] = i
+                last_slot[qub] = slot
+            self.slot_start.append(len(self.slot_wire))
+
+        self.alive = bytearray(b'\x01') * len(self.name_ids)
+        self.num_vertices = len(self.name_ids)
+        # gate order is a valid level numbering to start from, see CircuitDAG.raise_levels
+        self.levels = array('q', range(0, self.num_vertices * LEVEL_GAP, LEVEL_GAP))
+        self.opcode_index = None
+        self.depths = None
+        self.vertex_map = CompactVertexMap(self)
+
+    # type: (Int, List[Str], ...) -> CompactCircuitDAG
+    # Wraps already built arrays (or writable memoryviews of the same item types) without copying them,
+    # this is how binary_format loads a DAG straight out of a memory map.
+    @classmethod
+    def from_arrays(cls, num_qubits, name_list, name_ids, thetas, slot_start, slot_wire, slot_prev, slot_next,
+                    first_on_wire, last_on_wire):
+        cd = cls.__new__(cls)
+        cd.num_qubits = num_qubits
+        cd.undo_log = None
+        cd.checkpoints = []
+        cd.name_list = []
+        cd.name_index = {}
+        for name in name_list:
+            cd.get_name_id(name)
+        cd.name_ids = name_ids
+        cd.thetas = thetas
+        cd.slot_start = slot_start
+        cd.slot_wire = slot_wire
+        cd.slot_prev = slot_prev
+        cd.slot_next = slot_next
+        cd.first_on_wire = first_on_wire
+        cd.last_on_wire = last_on_wire
+        cd.alive = bytearray(b'\x01') * len(name_ids)
+        cd.num_vertices = len(name_ids)
+        cd.levels = array('q', range(0, cd.num_vertices * LEVEL_GAP, LEVEL_GAP))
+        cd.opcode_index = None
+        cd.depths = None
+        cd.vertex_map = CompactVertexMap(cd)
+        return cd
+
+    # the constructor already consumes the netlist in a single pass, but needs the wire count up front
+    @classmethod
+    def from_stream(cls, gates, num_qubits):
+        return cls(num_qubits, gates)
+
+    # type: () -> CompactCircuitDAG
+    # copies the flat arrays, O(V + E) with no per-vertex objects
+    def copy(self):
+        cd = CompactCircuitDAG.from_arrays(self.num_qubits, self.name_list, array('H', self.name_ids),
+                                           array('d', self.thetas), array('q', self.slot_start),
+                                           array('i', self.slot_wire), array('q', self.slot_prev),
+                                           array('q', self.slot_next), array('q', self.first_on_wire),
+                                           array('q', self.last_on_wire))
+        cd.alive = bytearray(self.alive)
+        cd.num_vertices = self.num_vertices
+        cd.levels = array('q', self.levels)
+        return cd
+
+    def get_name(self, iden):
+        return self.name_list[self.name_ids[iden]]
+
+    def get_name_id(self, name):
+        name_id = self.name_index.get(name)
+        if name_id is None:
+            name_id = len(self.name_list)
+            self.name_list.append(lookup_name(name)[0])
+            self.name_index[name] = name_id
+        return name_id
+
+    def set_item(self, arr, index, value):
+        self.log_undo(arr.__setitem__, index, arr[index])
+        arr[index] = value
+
+    def get_wires(self, iden):
+        return self.slot_wire[self.slot_start[iden]:self.slot_start[iden + 1]]
+
+    # type: (Int, Int) -> Int
+    def get_slot(self, iden, wire):
+        for slot in range(self.slot_start[iden], self.slot_start[iden + 1]):
+            if self.slot_wire[slot] == wire:
+                return slot
+        raise KeyError('gate %d does not act on wire %d' % (iden, wire))
+
+    # type: (Int, Int) -> Int
+    def get_next_on_wire(self, iden, wire):
+        return self.slot_next[self.get_slot(iden, wire)]
+
+    # type: (Int, Int) -> Int
+    def get_prev_on_wire(self, iden, wire):
+        return self.slot_prev[self.get_slot(iden, wire)]
+
+    def get_neighbors(self, iden, links):
+        neighbors = set()
+        for slot in range(self.slot_start[iden], self.slot_start[iden + 1]):
+            if links[slot] != NO_VERTEX:
+                neighbors.add(CompactVertex(self, links[slot]))
+        return neighbors
+
+    def get_gate(self, iden):
+        name = self.get_name(iden)
+        return Gate.from_fields(name, self.get_wires(iden), self.thetas[iden] if name == 'R_z' else None)
+
+    # the opcode index is built on first use, loading a DAG from a memory map stays O(1)
+    def get_opcode_index(self):
+        if self.opcode_index is None:
+            opcodes = [lookup_name(name)[2] for name in self.name_list]
+            self.opcode_index = {}
+            alive = self.alive
+            for iden, name_id in enumerate(self.name_ids):
+                if alive[iden]:
+                    self.opcode_index.setdefault(opcodes[name_id], set()).add(iden)
+        return self.opcode_index
+
+    def get_first_on_wire(self, wire):
+        iden = self.first_on_wire[wire]
+        return None if iden == NO_VERTEX else CompactVertex(self, iden)
+
+    def get_last_on_wire(self, wire):
+        iden = self.last_on_wire[wire]
+        return None if iden == NO_VERTEX else CompactVertex(self, iden)
+
+    # the slots of a gate are ordered controls first, target last; this rewrites that order in place
+    def reorder_wires(self, iden, wires):
+        start = self.slot_start[iden]
+        old_slots = list(range(start, self.slot_start[iden + 1]))
+        assert sorted(wires) == sorted(self.slot_wire[s] for s in old_slots), 'a gate cannot change wires in a CompactCircuitDAG'
+        links = {self.slot_wire[s]: (self.slot_prev[s], self.slot_next[s]) for s in old_slots}
+        for slot, wire in zip(old_slots, wires):
+            self.set_item(self.slot_wire, slot, wire)
+            self.set_item(self.slot_prev, slot, links[wire][0])
+            self.set_item(self.slot_next, slot, links[wire][1])
+
+    def link(self, prev, nxt, wire):
+        if prev == NO_VERTEX:
+            self.set_item(self.first_on_wire, wire, nxt)
+        else:
+            self.set_item(self.slot_next, self.get_slot(prev, wire), nxt)
+        if nxt == NO_VERTEX:
+            self.set_item(self.last_on_wire, wire, prev)
+        else:
+            self.set_item(self.slot_prev, self.get_slot(nxt, wire), prev)
+
+    # type: (CompactVertex) -> None
+    def remove_vertex_and_merge(self, vertex):
+        iden = vertex.get_id()
+        after = [self.slot_next[slot] for slot in range(self.slot_start[iden], self.slot_start[iden + 1])]
+        for slot in range(self.slot_start[iden], self.slot_start[iden + 1]):
+            self.link(self.slot_prev[slot], self.slot_next[slot], self.slot_wire[slot])
+        self.set_item(self.alive, iden, 0)
+        self.log_undo(setattr, self, 'num_vertices', self.num_vertices)
+        self.num_vertices -= 1
+        self.remove_from_index(vertex)
+        if self.depths is not None:
+            self.set_depth(iden, None)
+            self.mark_depths(nxt for nxt in after if nxt != NO_VERTEX)
+
+    # type: (CompactVertex, CompactVertex) -> None
+    def swap_2_vertex_neighbors(self, v1, v2):
+        # v1 is to the left of v2 and directly precedes it on every wire they share
+        i1, i2 = v1.get_id(), v2.get_id()
+        shared = set(self.get_wires(i1)).intersection(self.get_wires(i2))
+        assert len(shared) > 0
+        for wire in shared:
+            s1, s2 = self.get_slot(i1, wire), self.get_slot(i2, wire)
+            assert self.slot_next[s1] == i2
+            before, after = self.slot_prev[s1], self.slot_next[s2]
+            self.link(before, i2, wire)
+            self.link(i2, i1, wire)
+            self.link(i1, after, wire)
+
+        v2.set_level(max([v.get_level() + 1 for v in v2.get_input()] + [0]))
+        v1.set_level(max(v.get_level() + 1 for v in v1.get_input()))
+        self.raise_levels(v1)
+        # the gates after v1 on the shared wires followed v2 before
+        self.mark_depths([i1, i2] + [v.get_id() for v in v1.get_output()])
@@ -0,0 +1,182 @@
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.adapter import circuit_dag_to_netlist
+from src.circuit_dag import CircuitDAG
+from src.cache import DEFAULT_MAX_BYTES, config_bytes, get_cache, hash_netlist_file
+from src.parser import Parser
+from src.pass_manager import PassManager, PASSES, LIGHT
+from src.verification import verify as verify_netlists
+
+
+# type: (List[Str], Str, Str) -> List[Tuple[Str, Str]]
+# Pairs every input netlist with its output path. Files are taken as given and written under their base
+# name, directories are searched recursively for names matching pattern and keep their layout below it.
+def collect_files(paths, output_dir, pattern='*.txt'):
+    pairs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                # results of an earlier run are not picked up again when the output is inside an input
+                dirs[:] = sorted(name for name in dirs
+                                 if os.path.abspath(os.path.join(root, name)) != os.path.abspath(output_dir))
+                for name in sorted(fnmatch.filter(files, pattern)):
+                    in_filename = os.path.join(root, name)
+                    pairs.append((in_filename, os.path.join(output_dir, os.path.relpath(in_filename, path))))
+        else:
+            pairs.append((path, os.path.join(output_dir, os.path.basename(path))))
+
+    # an input named twice is compiled once, two inputs written to the same output are an error
+    outputs = {}
+    unique = []
+    for in_filename, out_filename in pairs:
+        key = os.path.abspath(out_filename)
+        if key not in outputs:
+            outputs[key] = in_filename
+            unique.append((in_filename, out_filename))
+        elif os.path.abspath(outputs[key]) != os.path.abspath(in_filename):
+            raise ValueError('%s and %s would both be written to %s' % (outputs[key], in_filename, out_filename))
+    return unique
+
+# type: (Str, Int, Iterable[Gate]) -> None
+def write_output(out_filename, num_qubits, netlist):
+    directory = os.path.dirname(out_filename)
+    if directory != '':
+        os.makedirs(directory, exist_ok=True)
+    Parser().write_netlist(out_filename, num_qubits, netlist)
+
+# type: (Str, Str, Tuple[Str], Int, Float, Str, Int, Bool) -> Dict
+# Optimizes one netlist file and returns its report record. Runs in a worker process in batch mode, so a
+# failure is reported in the record instead of raised and the other files still get compiled. With a
+# cache_dir, a file whose netlist and pass configuration were compiled before is answered from the
+# CompilationCache there without parsing it into gates or running any pass. With verify set, every
+# compiled (not cached) result is checked against its input and a result that is not equivalent is an error.
+def compile_file(in_filename, out_filename, passes=LIGHT, max_rounds=None, time_budget=None, cache_dir=None,
+                 cache_bytes=DEFAULT_MAX_BYTES, verify=False):
+    record = {'input': in_filename, 'output': out_filename}
+    start = time.perf_counter()
+    try:
+        cache = None
+        if cache_dir is not None:
+            cache = get_cache(cache_dir, cache_bytes)
+            key, num_qubits, num_gates = hash_netlist_file(in_filename, config_bytes(passes, max_rounds, time_budget))
+            hit = cache.get(key)
+            if hit is not None:
+                num_qubits, netlist = hit
+                write_output(out_filename, num_qubits, netlist)
+                record.update(num_qubits=num_qubits, gates_before=num_gates, gates_after=len(netlist), cache='hit')
+                record['seconds'] = time.perf_counter() - start
+                return record
+
+        parser = Parser()
+        if verify:
+            original = parser.get_netlist(in_filename)
+            cd = CircuitDAG.from_stream((gate.copy() for gate in original), parser.get_num_qubits())
+        else:
+            cd = parser.get_circuit_dag(in_filename)
+        record['num_qubits'] = cd.get_num_qubits()
+        record['gates_before'] = len(cd.get_vertex_map())
+
+        pm = PassManager(passes, max_rounds=max_rounds, time_budget=time_budget)
+        pm.run(cd)
+        netlist = circuit_dag_to_netlist(cd)
+        record['gates_after'] = len(netlist)
+        record['passes'] = pm.summary()
+        if verify:
+            report = verify_netlists(cd.get_num_qubits(), original, netlist)
+            record['verification'] = report.to_dict()
+            if report.equivalent is False:
+                record['error'] = 'optimized netlist differs from the input on wires %s from gate %s' % (
+                    report.wires, report.first_gate)
+                record['seconds'] = time.perf_counter() - start
+                return record
+        write_output(out_filename, cd.get_num_qubits(), netlist)
+        if cache is not None:
+            cache.put(key, cd.get_num_qubits(), netlist)
+            record['cache'] = 'miss'
+    except Exception as e:
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    record['seconds'] = time.perf_counter() - start
+    return record
+
+# type: (List[Tuple[Str, Str]], Tuple[Str], Int, Float, Int, Str, Int, Bool) -> List[Dict]
+# Compiles every (input, output) pair, jobs at a time in a process pool. jobs=None uses every core and
+# jobs=1 compiles in this process. Records come back in the order of pairs. The workers can share one
+# cache_dir, see CompilationCache.
+def compile_batch(pairs, passes=LIGHT, max_rounds=None, time_budget=None, jobs=None, cache_dir=None,
+                  cache_bytes=DEFAULT_MAX_BYTES, verify=False):
+    # the biggest files are submitted first so a long one does not start last
+    sizes = [os.path.getsize(in_filename) if os.path.isfile(in_filename) else 0 for in_filename, _ in pairs]
+    order = sorted(range(len(pairs)), key=lambda i: sizes[i], reverse=True)
+    n = len(order)
+    args = (compile_file, [pairs[i][0] for i in order], [pairs[i][1] for i in order],
+            [tuple(passes)] * n, [max_rounds] * n, [time_budget] * n, [cache_dir] * n, [cache_bytes] * n,
+            [verify] * n)
+    records = [None] * n
+    if jobs == 1:
+        for i, record in zip(order, map(*args)):
+            records[i] = record
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for i, record in zip(order, executor.map(*args)):
+                records[i] = record
+    return records
+
+# type: (List[Dict]) -> Dict
+def summarize(records):
+    compiled = [r for r in records if 'error' not in r]
+    gates_before = sum(r['gates_before'] for r in compiled)
+    gates_after = sum(r['gates_after'] for r in compiled)
+    return {
+        'files': len(records),
+        'failed': len(records) - len(compiled),
+        'gates_before': gates_before,
+        'gates_after': gates_after,
+        'reduction': 1 - gates_after / gates_before if gates_before > 0 else 0.0,
+        'cache_hits': sum(1 for r in records if r.get('cache') == 'hit'),
+        'seconds': sum(r['seconds'] for r in records),
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m src',
+                                         description='Optimize netlist files with the configured pass pipeline')
+    arg_parser.add_argument('inputs', nargs='+', help='netlist files or directories to search for them')
+    arg_parser.add_argument('-o', '--output-dir', required=True,
+                            help='optimized netlists are written here, under the same relative names')
+    arg_parser.add_argument('--pattern', default='*.txt', help='file names to pick up from directories')
+    arg_parser.add_argument('--passes', nargs='+', choices=sorted(PASSES), default=list(LIGHT),
+                            help='pass sequence repeated until a round removes no gates')
+    arg_parser.add_argument('--max-rounds', type=int)
+    arg_parser.add_argument('--time-budget', type=float, help='seconds per file')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=1, help='worker processes, 0 uses every core')
+    arg_parser.add_argument('--cache-dir', help='reuse results of earlier compiles stored here')
+    arg_parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES >> 20,
+                            help='megabytes the cache may take before old entries are evicted')
+    arg_parser.add_argument('--verify', action='store_true',
+                            help='check every compiled netlist against its input, see src.verification')
+    arg_parser.add_argument('--report', help='write the JSON stats report here instead of stdout')
+    args = arg_parser.parse_args(argv)
+
+    try:
+        pairs = collect_files(args.inputs, args.output_dir, args.pattern)
+    except ValueError as e:
+        arg_parser.error(str(e))
+    records = compile_batch(pairs, args.passes, args.max_rounds, args.time_budget, args.jobs or None,
+                            args.cache_dir, args.cache_size << 20, args.verify)
+
+    report = json.dumps({'files': records, 'total': summarize(records)}, indent=2)
+    if args.report is None:
+        print(report)
+    else:
+        with open(args.report, 'w') as f:
+            f.write(report + '\n')
+    for record in records:
+        if 'error' in record:
+            print('%s: %s' % (record['input'], record['error']), file=sys.stderr)
+    return 1 if any('error' in record for record in records) else 0
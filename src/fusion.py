@@ -0,0 +1,161 @@
+import time
+
+import numpy as np
+
+from src.angles import gather_thetas, fold_angles
+from src.pass_stats import PassStats
+
+# single qubit gates a run can consist of, as their 2x2 matrices with R_z(theta) = diag(1, e^(i theta)), which
+# is the usual R_z up to a global phase
+GATE_MATRICES = {
+    'H': np.array([[1, 1], [1, -1]]) / np.sqrt(2),
+    'X': np.array([[0, 1], [1, 0]]),
+    'Z': np.diag([1, -1]),
+    'P': np.diag([1, 1j]),
+    'P_dag': np.diag([1, -1j]),
+    'T': np.diag([1, np.exp(1j * np.pi / 4)]),
+    'T_dag': np.diag([1, np.exp(-1j * np.pi / 4)]),
+    'R_z': np.eye(2),
+}
+FUSED_NAMES = sorted(GATE_MATRICES)
+# products are classified and their angles dropped or snapped with this tolerance, float products of a few
+# hundred gates are far from ANGLE_EPSILON exact
+FUSION_EPSILON = 1e-9
+
+# shapes of a synthesized product, see synthesize
+DIAGONAL, HADAMARD, ANTI_DIAGONAL, EULER = range(4)
+
+
+# type: (CircuitDAG) -> List[List[Vertex]]
+# the maximal runs of at least two fusable gates on every wire, in circuit order
+def collect_runs(cd):
+    runs = []
+    for wire in range(cd.get_num_qubits()):
+        run = []
+        for v in cd.iter_wire(wire):
+            if v.get_gate_name() in GATE_MATRICES:
+                run.append(v)
+                continue
+            if len(run) > 1:
+                runs.append(run)
+            run = []
+        if len(run) > 1:
+            runs.append(run)
+    return runs
+
+# type: (CircuitDAG, List[List[Vertex]]) -> np.ndarray
+# Builds the matrices of every gate of every run as one (num_gates, 2, 2) array and multiplies each run out.
+# The runs are taken longest first, so step k multiplies gate k of every run that is longer than k onto its
+# product in one batched matmul: there are as many steps as the longest run has gates and no padding.
+def multiply_runs(cd, runs):
+    order = sorted(range(len(runs)), key=lambda i: len(runs[i]), reverse=True)
+    lengths = np.array([len(runs[i]) for i in order], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    vertices = [v for i in order for v in runs[i]]
+
+    table = np.stack([GATE_MATRICES[name].astype(np.complex128) for name in FUSED_NAMES])
+    name_ids = np.fromiter((FUSED_NAMES.index(v.get_gate_name()) for v in vertices), dtype=np.int64,
+                           count=len(vertices))
+    matrices = table[name_ids]
+    is_rz = name_ids == FUSED_NAMES.index('R_z')
+    ids = np.fromiter((v.get_id() for v in vertices), dtype=np.int64, count=len(vertices))
+    matrices[is_rz, 1, 1] = np.exp(1j * gather_thetas(cd, ids[is_rz]))
+
+    products = np.broadcast_to(np.eye(2, dtype=np.complex128), (len(runs), 2, 2)).copy()
+    for k in range(int(lengths[0]) if len(runs) > 0 else 0):
+        m = int(np.count_nonzero(lengths > k))
+        # a later gate multiplies from the left
+        products[:m] = matrices[offsets[:m] + k] @ products[:m]
+
+    unordered = np.empty_like(products)
+    unordered[order] = products
+    return unordered
+
+# type: (np.ndarray, Float) -> Tuple[np.ndarray, np.ndarray]
+# Classifies a batch of 2x2 unitaries and finds angles a, b, c such that, up to global phase, each is
+#   DIAGONAL       R_z(a)
+#   HADAMARD       R_z(c) H R_z(a)
+#   ANTI_DIAGONAL  X R_z(a)
+#   EULER          R_z(c) H R_z(b) H R_z(a)
+# in circuit order, the shortest of these forms that fits. Angles are folded into (-pi, pi] and snapped to
+# multiples of pi / 4 within tolerance, so a zero angle means the R_z can be left out.
+def synthesize(products, tolerance=FUSION_EPSILON):
+    u00, u01, u10, u11 = products[:, 0, 0], products[:, 0, 1], products[:, 1, 0], products[:, 1, 1]
+    cos, sin = np.abs(u00), np.abs(u01)
+    shapes = np.full(len(products), EULER, dtype=np.int8)
+    shapes[np.abs(cos - sin) < tolerance] = HADAMARD
+    shapes[sin < tolerance] = DIAGONAL
+    shapes[cos < tolerance] = ANTI_DIAGONAL
+
+    # D(c) H D(b) H D(a) as a matrix has entries e^(i b / 2) times cos(b / 2), -i sin(b / 2) e^(i a),
+    # -i sin(b / 2) e^(i c) and cos(b / 2) e^(i (a + c)), which fixes every angle from the phases of U
+    b = 2 * np.arctan2(sin, cos)
+    a = np.angle(u01) - np.angle(u00) + np.pi / 2
+    c = np.angle(u10) - np.angle(u00) + np.pi / 2
+    # D(c) H D(a) has entries 1, e^(i a), e^(i c) and -e^(i (a + c)) over sqrt(2)
+    hadamard = shapes == HADAMARD
+    a[hadamard] = np.angle(u01[hadamard]) - np.angle(u00[hadamard])
+    c[hadamard] = np.angle(u10[hadamard]) - np.angle(u00[hadamard])
+    # D(a) X has entries 1 and e^(i a) off the diagonal
+    anti_diagonal = shapes == ANTI_DIAGONAL
+    a[anti_diagonal] = np.angle(u10[anti_diagonal]) - np.angle(u01[anti_diagonal])
+    diagonal = shapes == DIAGONAL
+    a[diagonal] = np.angle(u11[diagonal]) - np.angle(u00[diagonal])
+
+    angles = np.stack([a, b, c])
+    folded, k = fold_angles(angles.ravel(), tolerance)
+    folded[k.ravel() == 0] = 0.0
+    return shapes, folded.reshape(angles.shape)
+
+# type: (Int, Float, Float, Float) -> List[Tuple[Str, Float]]
+# the gates of one synthesized product in circuit order, as (name, theta) pairs
+def get_sequence(shape, a, b, c):
+    if shape == DIAGONAL:
+        gates = [('R_z', a)]
+    elif shape == HADAMARD:
+        gates = [('R_z', a), ('H', None), ('R_z', c)]
+    elif shape == ANTI_DIAGONAL:
+        gates = [('X', None), ('R_z', a)]
+    else:
+        gates = [('R_z', a), ('H', None), ('R_z', b), ('H', None), ('R_z', c)]
+    return [(name, theta) for name, theta in gates if theta != 0.0]
+
+# type: (Vertex, Str, Float) -> None
+def set_gate(v, name, theta):
+    if v.get_gate_name() != name:
+        v.set_gate_theta(theta)
+        v.set_gate_name(name)
+    elif theta is not None:
+        v.set_gate_theta(theta)
+
+
+# Gate fusion in one linear sweep: every maximal run of single qubit gates between multi-qubit gates on a
+# wire is multiplied out, all runs at once with numpy, and re-synthesized into at most five H and R_z gates
+# (X R_z for a bit flip). A run is only rewritten when that makes it shorter. The first gates of the run are
+# renamed into the new sequence and the others removed, so the DAG needs no new vertices. Like the merging
+# passes it gives R_z angles where the run had named gates, snap_rotations names them again.
+# type: (CircuitDAG, Float) -> PassStats
+def gate_fusion(cd, tolerance=FUSION_EPSILON):
+    stats = PassStats('gate_fusion')
+    start_time = time.perf_counter()
+    stats.iterations = 1
+    v_map = cd.get_vertex_map()
+    num_gates = len(v_map)
+
+    runs = collect_runs(cd)
+    stats.attempts = len(runs)
+    if len(runs) > 0:
+        shapes, angles = synthesize(multiply_runs(cd, runs), tolerance)
+        for run, shape, a, b, c in zip(runs, shapes.tolist(), *angles.tolist()):
+            gates = get_sequence(shape, a, b, c)
+            if len(gates) >= len(run):
+                continue
+            stats.rewrites += 1
+            for v, (name, theta) in zip(run, gates):
+                set_gate(v, name, theta)
+            for v in run[len(gates):]:
+                cd.remove_vertex_and_merge(v)
+
+    stats.gates_removed = num_gates - len(v_map)
+    stats.wall_time = time.perf_counter() - start_time
+    return stats
@@ -1,22 +1,70 @@
+import sys
+from enum import Enum
+
 GARBAGE = 'IGNORE_THIS_GATE'
+DAGGER_SUFFIX = '_dag'
+
+class Opcode(Enum):
+    H = 'H'
+    P = 'P'
+    X = 'X'
+    Z = 'Z'
+    T = 'T'
+    R_z = 'R_z'
+    CNOT = 'CNOT'
+    CZ = 'CZ'
+    CCZ = 'CCZ'
+    CCX = 'CCX'
+
+OPCODE_VALUES = {op.value: op for op in Opcode}
+
+# gate name -> (interned name, name without '_dag', Opcode or None for names outside the enum, dagger flag)
+# names are interned on first sight so gates with the same name share one string object
+name_table = {}
+
+# type: (Str) -> Tuple[Str, Str, Opcode, Bool]
+def lookup_name(name):
+    entry = name_table.get(name)
+    if entry is None:
+        name = sys.intern(name)
+        dagger = name.endswith(DAGGER_SUFFIX)
+        base = name[:-len(DAGGER_SUFFIX)] if dagger else name
+        entry = (name, base, OPCODE_VALUES.get(base), dagger)
+        name_table[name] = entry
+    return entry
+
 
 class Gate:
+    __slots__ = ('gate_name', 'opcode', 'dagger', 'theta', 'target', 'controls', 'all_qubits')
+
     def __init__(self, text):
         arr = text.split()
-        self.text = text
-        self.gate_name = arr[0]
+        self.set_name(arr[0])
 
         if self.gate_name == 'R_z':
             assert len(arr) == 3
             self.theta = float(arr[1])
             self.target = int(arr[2])
-            self.controls = []
-            self.all_qubits = [self.target]
+            self.controls = ()
+            self.all_qubits = (self.target,)
         else:
             self.theta = None
             self.target = int(arr[-1])
-            self.controls = [int(a) for a in arr[1:-1]] if len(arr) > 2 else []
-            self.all_qubits = [int(a) for a in arr[1:]]
+            self.controls = tuple(map(int, arr[1:-1]))
+            self.all_qubits = self.controls + (self.target,)
+
+    # type: (Str, Iterable[Int], Float) -> Gate
+    # builds a gate from already parsed fields, qubits are ordered controls first and target last
+    @staticmethod
+    def from_fields(name, all_qubits, theta=None):
+        gate = Gate.__new__(Gate)
+        gate.gate_name, _, gate.opcode, gate.dagger = lookup_name(name)
+        gate.theta = theta
+        all_qubits = tuple(all_qubits)
+        gate.all_qubits = all_qubits
+        gate.target = all_qubits[-1]
+        gate.controls = all_qubits[:-1]
+        return gate
 
     def __eq__(self, other):
         eq = True
@@ -29,7 +77,16 @@ class Gate:
         if not self.controls == other.controls:
             eq = False
         return eq
-        
+
+    def __repr__(self):
+        return 'Gate(%r)' % self.get_text()
+
+    # type: () -> Str
+    # one line of the netlist text format
+    def get_text(self):
+        if self.gate_name == 'R_z':
+            return 'R_z %r %d' % (self.theta, self.target)
+        return ' '.join([self.gate_name] + [str(q) for q in self.all_qubits])
 
     def get_theta(self):
         return self.theta
@@ -38,31 +95,52 @@ class Gate:
         self.theta = theta
 
     def set_name(self, name):
-        self.gate_name = name
+        self.gate_name, _, self.opcode, self.dagger = lookup_name(name)
 
     def get_name(self):
         return self.gate_name
 
+    def get_opcode(self):
+        return self.opcode
+
+    def is_dagger(self):
+        return self.dagger
+
     def get_target(self):
         return int(self.target)
 
+    def set_target(self, target):
+        self.target = target
+        self.all_qubits = self.controls + (target,)
+
     def get_controls(self):
-        return self.controls.copy()
+        return list(self.controls)
+
+    def set_controls(self, controls):
+        self.controls = tuple(controls)
+        self.all_qubits = self.controls + (self.target,)
 
     def get_all_qubits(self):
-        return self.all_qubits
-    
+        return list(self.all_qubits)
+
+    def is_dagger_to(self, other):
+        _, base, _, dagger = lookup_name(self.gate_name)
+        _, other_base, _, other_dagger = lookup_name(other.gate_name)
+        return base == other_base and dagger != other_dagger
+
     def copy(self):
-        gate = Gate(self.text)
+        gate = Gate.__new__(Gate)
         gate.gate_name = self.gate_name
+        gate.opcode = self.opcode
+        gate.dagger = self.dagger
         gate.theta = self.theta
         gate.target = self.target
-        gate.controls = self.controls.copy()
-        gate.all_qubits = self.all_qubits.copy()
+        gate.controls = self.controls
+        gate.all_qubits = self.all_qubits
         return gate
 
     def delete(self):
-        self.gate_name = GARBAGE
+        self.set_name(GARBAGE)
 
     def is_deleted(self):
         return self.gate_name == GARBAGE
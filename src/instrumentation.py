@@ -0,0 +1,143 @@
+import json
+import marshal
+import time
+from contextlib import contextmanager
+
+from src.circuit_dag import CircuitDAG, SnapshotVertex, Vertex
+from src.compact_circuit_dag import CompactCircuitDAG, CompactVertex
+
+# The Instrumentation collecting events, None while instrumentation is off. The passes read it once per
+# rule check and skip all bookkeeping while it is None, so the disabled cost is one global lookup.
+ACTIVE = None
+
+# DAG methods timed while instrumentation is on. They are wrapped when it is enabled and restored when it is
+# disabled, so they cost nothing otherwise. Only methods a class defines itself are listed, an inherited one
+# is timed through the class that defines it.
+TIMED_METHODS = (
+    (CircuitDAG, ('checkpoint', 'commit', 'rollback', 'copy', 'snapshot',
+                  'remove_vertex_and_merge', 'swap_2_vertex_neighbors')),
+    (CompactCircuitDAG, ('copy', 'remove_vertex_and_merge', 'swap_2_vertex_neighbors')),
+    (Vertex, ('set_gate_name',)),
+    (CompactVertex, ('set_gate_name',)),
+    (SnapshotVertex, ('materialize',)),
+)
+
+
+# Rule hit counters and timers of one instrumented run. Counters are keyed 'pass/rule' and hold attempts and
+# successes, timers are keyed by method or pass name and hold calls and seconds. hook, if given, is called
+# as hook(kind, name, value) for every event: ('rule', name, success) or ('time', name, seconds).
+class Instrumentation:
+    # type: (Callable) -> None
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.counters = {}
+        self.timers = {}
+
+    def get_counters(self):
+        return self.counters
+
+    def get_timers(self):
+        return self.timers
+
+    # type: (Str, Bool) -> None
+    def count(self, name, success):
+        counter = self.counters.get(name)
+        if counter is None:
+            counter = self.counters[name] = [0, 0]
+        counter[0] += 1
+        if success:
+            counter[1] += 1
+        if self.hook is not None:
+            self.hook('rule', name, success)
+
+    # type: (Str, Int, Int) -> None
+    # Rules of a commutation routine are tried in order until one fires, fired is its 1-based number or 0
+    # when none did. Every rule up to the one that fired counts as attempted.
+    def count_rules(self, prefix, fired, num_rules):
+        for rule in range(1, (fired or num_rules) + 1):
+            self.count('%s/rule_%d' % (prefix, rule), rule == fired)
+
+    # type: (Str, Float) -> None
+    def add_time(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = [0, 0.0]
+        timer[0] += 1
+        timer[1] += seconds
+        if self.hook is not None:
+            self.hook('time', name, seconds)
+
+    def to_dict(self):
+        return {
+            'rules': {name: {'attempts': a, 'successes': s} for name, (a, s) in sorted(self.counters.items())},
+            'timers': {name: {'calls': c, 'seconds': t} for name, (c, t) in sorted(self.timers.items())},
+        }
+
+    # type: (Str) -> Str
+    def to_json(self, filename=None):
+        report = json.dumps(self.to_dict(), indent=2)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(report + '\n')
+        return report
+
+    # Stats in the layout cProfile.Profile dumps, {(file, line, name): (cc, nc, tt, ct, callers)}. Timers are
+    # entries with their calls and seconds; rules are entries with successes as primitive calls and attempts
+    # as total calls, which pstats prints as attempts/successes in the ncalls column.
+    def to_pstats(self):
+        stats = {}
+        for name, (calls, seconds) in self.timers.items():
+            stats[('q_compile', 0, name)] = (calls, calls, seconds, seconds, {})
+        for name, (attempts, successes) in self.counters.items():
+            stats[('q_compile', 0, name)] = (successes, attempts, 0.0, 0.0, {})
+        return stats
+
+    # type: (Str) -> None
+    # readable with pstats.Stats(filename), snakeviz and other cProfile viewers
+    def dump_stats(self, filename):
+        with open(filename, 'wb') as f:
+            marshal.dump(self.to_pstats(), f)
+
+
+def timed(name, method):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            if ACTIVE is not None:
+                ACTIVE.add_time(name, time.perf_counter() - start)
+    wrapper.__wrapped__ = method
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+# type: (Callable) -> Instrumentation
+def enable(hook=None):
+    global ACTIVE
+    if ACTIVE is None:
+        for cls, names in TIMED_METHODS:
+            for name in names:
+                setattr(cls, name, timed('%s.%s' % (cls.__name__, name), cls.__dict__[name]))
+    ACTIVE = Instrumentation(hook)
+    return ACTIVE
+
+# type: () -> Instrumentation
+# turns instrumentation off and returns what it collected
+def disable():
+    global ACTIVE
+    inst = ACTIVE
+    if inst is not None:
+        for cls, names in TIMED_METHODS:
+            for name in names:
+                setattr(cls, name, cls.__dict__[name].__wrapped__)
+    ACTIVE = None
+    return inst
+
+# with instrument() as inst: ... runs the body instrumented, inst keeps its counters afterwards
+@contextmanager
+def instrument(hook=None):
+    inst = enable(hook)
+    try:
+        yield inst
+    finally:
+        disable()
@@ -1,121 +1,318 @@
 from src.circuit_dag import CircuitDAG, Vertex, get_all_vertices_on_wires
-from src.gate import Gate
+from src.gate import Gate, Opcode, lookup_name
 from src.parser import Parser
-from queue import Queue
+from src.pass_stats import PassStats
+from src import instrumentation
+import time
+from collections import deque
 from src.optimizer_subroutines_helper import *
 from src.adapter import *
 
 GARBAGE = 'IGNORE_THIS_GATE'
 
 
+# A rewrite rule of hadamard_gate_reduction. names are the gates met walking forward along the wire of the
+# first H and new_names what they become, None removes the gate. cnot_role says whether that wire is the
+# control or the target of the CNOT in the pattern. side_names are the gates directly before and after the
+# CNOT on its other wire, they are removed, and flip_cnot exchanges the control and target of the CNOT.
+# name labels the rule in instrumentation counters.
+class HadamardRule:
+    def __init__(self, name, names, new_names, cnot_role=None, side_names=None, flip_cnot=False):
+        self.name = name
+        self.names = names
+        self.new_names = new_names
+        self.cnot_role = cnot_role
+        self.side_names = side_names
+        self.flip_cnot = flip_cnot
+
+HADAMARD_RULES = [
+    HadamardRule('hadamard_gate_reduction/rule_1', ('H', 'P', 'H'), ('P_dag', 'H', 'P_dag')),
+    HadamardRule('hadamard_gate_reduction/rule_2', ('H', 'P_dag', 'H'), ('P', 'H', 'P')),
+    HadamardRule('hadamard_gate_reduction/rule_3', ('H', 'CNOT', 'H'), (None, 'CNOT', None), cnot_role='control', side_names=('H', 'H'), flip_cnot=True),
+    HadamardRule('hadamard_gate_reduction/rule_4', ('H', 'P', 'CNOT', 'P_dag', 'H'), (None, 'P_dag', 'CNOT', 'P', None), cnot_role='target'),
+    HadamardRule('hadamard_gate_reduction/rule_5', ('H', 'P_dag', 'CNOT', 'P', 'H'), (None, 'P', 'CNOT', 'P_dag', None), cnot_role='target'),
+]
+
+# type: (List[HadamardRule]) -> Dict[Tuple[Opcode, Opcode], List[HadamardRule]]
+# rules keyed on the opcodes of their first two gates, so a candidate only tries the rules that can match
+def index_rules(rules):
+    index = {}
+    for rule in rules:
+        index.setdefault((lookup_name(rule.names[0])[2], lookup_name(rule.names[1])[2]), []).append(rule)
+    return index
+
+HADAMARD_RULE_INDEX = index_rules(HADAMARD_RULES)
+MAX_RULE_LENGTH = max(len(rule.names) for rule in HADAMARD_RULES)
+
+# type: (HadamardRule, Vertex, Int) -> List[Vertex]
+# returns the vertices of the pattern along the wire followed by the side vertices, or None
+def match_hadamard_rule(rule, v, wire):
+    matched = []
+    cnot = None
+    for name in rule.names:
+        if v is None or v.get_gate_name() != name:
+            return None
+        if name == 'CNOT':
+            if (v.get_gate_target() == wire) != (rule.cnot_role == 'target'):
+                return None
+            cnot = v
+        matched.append(v)
+        v = v.get_next_on_wire(wire)
+
+    if rule.side_names is not None:
+        other = [w for w in cnot.get_gate_all_qubits() if w != wire][0]
+        before, after = cnot.get_prev_on_wire(other), cnot.get_next_on_wire(other)
+        if before is None or after is None or (before.get_gate_name(), after.get_gate_name()) != rule.side_names:
+            return None
+        matched += [before, after]
+    return matched
+
+# type: (CircuitDAG, HadamardRule, List[Vertex], Int) -> None
+def apply_hadamard_rule(cd, rule, matched, wire):
+    for v, new_name in zip(matched, rule.new_names):
+        if new_name is None:
+            cd.remove_vertex_and_merge(v)
+        elif v.get_gate_name() != new_name:
+            v.set_gate_name(new_name)
+    for v in matched[len(rule.names):]:
+        cd.remove_vertex_and_merge(v)
+
+    if rule.flip_cnot:
+        cnot = matched[rule.names.index('CNOT')]
+        other = [w for w in cnot.get_gate_all_qubits() if w != wire][0]
+        cnot.set_target(wire)
+        cnot.set_controls([other])
+
+# Every H is queued once and looked up in HADAMARD_RULE_INDEX by its own and its successor's opcode. After
+# a rewrite, the H gates that can start a pattern reaching the rewritten gates (at most MAX_RULE_LENGTH - 1
+# gates back on each of their wires) are queued again, and the queue runs until it is empty.
 # type: (CirctuitDAG) -> CircuitDAG
 def hadamard_gate_reduction(cd):
-    q = Queue()
-    H_gate_ids = cd.collect_gate_ids('H')  # type: set
-    for iden in H_gate_ids:
-        q.put(iden)
+    v_map = cd.get_vertex_map()
+    q = deque(cd.collect_gate_ids('H'))
+    queued = set(q)
 
-    while not q.empty():
-        H_gate_id = q.get()
-        H_vertex = cd.get_vertex_map().get(H_gate_id, None)
+    while len(q) > 0:
+        H_gate_id = q.popleft()
+        queued.discard(H_gate_id)
+        H_vertex = v_map.get(H_gate_id, None)
 
         if H_vertex is None or H_vertex.get_gate_name() != 'H':
             # this happens when a previous rewrite rule changes the gate of a vertex or deletes the vertex
             continue
-    
-        # rule 1, rule 2
-        for vertex1, vertex2 in get_2_vertices_forward(H_vertex):
-            if vertex1.get_gate_name() == 'P' and vertex2.get_gate_name() == 'H': 
-                H_vertex.set_gate_name('P_dag')
-                vertex1.set_gate_name('H')
-                vertex2.set_gate_name('P_dag')
-                q.put(vertex1.get_id())
-                break
-            elif vertex1.get_gate_name() == 'P_dag' and vertex2.get_gate_name() == 'H':
-                H_vertex.set_gate_name('P')
-                vertex1.set_gate_name('H')
-                vertex2.set_gate_name('P')
-                q.put(vertex1.get_id())
-                break
-
-        # rule 3
+
         H_target = H_vertex.get_gate_target()
-        for vertex1, vertex2 in get_2_vertices_forward(H_vertex):
-            if vertex1.get_gate_name() == 'CNOT' and vertex2.get_gate_name() == 'H':
-                cnot_gate = vertex1.get_gate()
-                if cnot_gate.get_controls() == [H_target] and vertex2.get_gate().get_target() == H_target:
-                    # H_target wire is correct
-                    cnot_target = cnot_gate.get_target()
-                    inp = vertex1.get_input()
-                    out = vertex1.get_output()
-                    assert len(inp) == 2 and len(out) == 2
-                    assert cnot_target != H_target
-                    
-                    # bottom-left
-                    list_inp = list(inp)
-                    if list_inp[0].get_gate_target() == cnot_target:
-                        bl_v = list_inp[0]
-                    else:
-                        bl_v = list_inp[1]
-
-                    # bottom-right
-                    list_out = list(out)
-                    if list_out[0].get_gate_target() == cnot_target:
-                        br_v = list_out[0]
-                    else:
-                        br_v = list_out[1]
-            
-                    if bl_v.get_gate_name() == br_v.get_gate_name() == 'H':
-                        # bottom wire is correct
-                        # remove the Hadamards and swap the target and control for CNOT
-                        cd.remove_vertex_and_merge(H_vertex)
-                        cd.remove_vertex_and_merge(vertex2) 
-                        cd.remove_vertex_and_merge(bl_v)
-                        cd.remove_vertex_and_merge(br_v)
-
-                        vertex1.set_target(H_target)
-                        vertex1.set_controls([cnot_target])
-                        break
-
-        # rule 4
-        for vertex1, vertex2 in get_2_vertices_forward(H_vertex):
-            if vertex1.get_gate_name() == 'P' and vertex2.get_gate_name() == 'CNOT' and vertex2.get_gate_target() == H_target:
-                for vertex3, vertex4 in get_2_vertices_forward(vertex2):
-                    if vertex3.get_gate_target() == vertex4.get_gate_target() == H_target and vertex3.get_gate_name() == 'P_dag' and vertex4.get_gate_name() == 'H':
-                        # wires are correct
-                        cd.remove_vertex_and_merge(H_vertex)
-                        cd.remove_vertex_and_merge(vertex4)
-                        vertex1.set_gate_name('P_dag')
-                        vertex3.set_gate_name('P')
-                        break
-
-        # rule 5
-        for vertex1, vertex2 in get_2_vertices_forward(H_vertex):
-            if vertex1.get_gate_name() == 'P_dag' and vertex2.get_gate_name() == 'CNOT' and vertex2.get_gate_target() == H_target:
-                for vertex3, vertex4 in get_2_vertices_forward(vertex2):
-                    if vertex3.get_gate_target() == vertex4.get_gate_target() == H_target and vertex3.get_gate_name() == 'P' and vertex4.get_gate_name() == 'H':
-                        # wires are correct
-                        cd.remove_vertex_and_merge(H_vertex)
-                        cd.remove_vertex_and_merge(vertex4)
-                        vertex1.set_gate_name('P')
-                        vertex3.set_gate_name('P_dag')
-                        break
-
-        return cd
+        next_vertex = H_vertex.get_next_on_wire(H_target)
+        if next_vertex is None:
+            continue
 
+        for rule in HADAMARD_RULE_INDEX.get((H_vertex.get_gate_opcode(), next_vertex.get_gate_opcode()), ()):
+            matched = match_hadamard_rule(rule, H_vertex, H_target)
+            if instrumentation.ACTIVE is not None:
+                instrumentation.ACTIVE.count(rule.name, matched is not None)
+            if matched is None:
+                continue
 
+            touched = set()
+            for v in matched:
+                for wire in v.get_gate_all_qubits():
+                    touched.add(v.get_prev_on_wire(wire))
+            touched.update(matched)
+            touched.discard(None)
+
+            apply_hadamard_rule(cd, rule, matched, H_target)
+
+            for v in touched:
+                if v_map.get(v.get_id()) is None:
+                    continue
+                for wire in v.get_gate_all_qubits():
+                    u = v
+                    for _ in range(MAX_RULE_LENGTH - 1):
+                        if u is None:
+                            break
+                        if u.get_gate_name() == 'H' and u.get_id() not in queued:
+                            q.append(u.get_id())
+                            queued.add(u.get_id())
+                        u = u.get_prev_on_wire(wire)
+            break
 
-# TODO do more cancellations than r and cnot after commutations
-# type: (CircuitDAG) -> CircuitDAG
-def single_qubit_gate_cancellation(cd):
-    for _,v in cd.get_vertex_map().items():
-        if not v.is_deleted():
-            if v.get_gate_name() == 'R_z':
-                cd = find_R_z_combination(cd, v)
-            if v.get_gate_name() == 'CNOT':
-                cd = find_cnot_combination(cd, v)
     return cd
 
 
 
+# opcode -> routine that tries to commute a gate of that kind into a cancelling or merging partner
+COMBINATIONS = {
+    Opcode.R_z: find_R_z_combination,
+    Opcode.CNOT: find_cnot_combination,
+}
+
+# TODO do more cancellations than r and cnot after commutations
+# Worklist driver: every R_z and CNOT is queued once, a successful combination re-queues the vertex and
+# its neighbors before and after the rewrite, and rounds repeat until one fires nothing (a fixed point)
+# or max_iterations rounds have run. The DAG is rewritten in place.
+# type: (CircuitDAG, Int) -> PassStats
+def single_qubit_gate_cancellation(cd, max_iterations=None):
+    stats = PassStats('single_qubit_gate_cancellation')
+    start_time = time.perf_counter()
+    v_map = cd.get_vertex_map()
+    start_gates = len(v_map)
+
+    fired = True
+    while fired and (max_iterations is None or stats.iterations < max_iterations):
+        fired = False
+        stats.iterations += 1
+        worklist = deque(sorted(set().union(*[cd.collect_opcode_ids(opcode) for opcode in COMBINATIONS])))
+        queued = set(worklist)
+
+        while len(worklist) > 0:
+            iden = worklist.popleft()
+            queued.discard(iden)
+            v = v_map.get(iden)
+            if v is None:
+                continue
+            find_combination = COMBINATIONS.get(v.get_gate_opcode())
+            if find_combination is None:
+                continue
+
+            stats.attempts += 1
+            touched = v.get_input() | v.get_output()
+            num_gates = len(v_map)
+            find_combination(cd, v)
+            if len(v_map) == num_gates:
+                continue
+
+            fired = True
+            stats.rewrites += 1
+            if v_map.get(iden) is not None:
+                touched |= v.get_input() | v.get_output() | {v}
+            for v_touched in touched:
+                touched_id = v_touched.get_id()
+                if touched_id not in queued and v_map.get(touched_id) is not None:
+                    worklist.append(touched_id)
+                    queued.add(touched_id)
+
+    stats.gates_removed = start_gates - len(v_map)
+    stats.wall_time = time.perf_counter() - start_time
+    return stats
+
+
+# gates that only multiply basis states by a phase, they leave every wire's parity unchanged
+DIAGONAL_OPCODES = {Opcode.P, Opcode.Z, Opcode.T, Opcode.R_z, Opcode.CZ, Opcode.CCZ}
+ANGLE_EPSILON = 1e-12
+
+# type: (List[Int], Dict[Int, List], List[List]) -> Dict[Int, List]
+# Re-expresses the parities of rotation_merging in the basis of the current wire parities, which stay linearly
+# independent because every gate either is reversible or gives its wires fresh variables: wire q becomes
+# variable q + 1 again, keeping its constant bit. A term outside the span of the wires can never be matched
+# again and moves to finished; the others get their coordinates in the new basis as key. Gauss-Jordan
+# elimination leaves every pivot bit in one row only, so a key is reduced in a single pass over the rows.
+def rebase_parities(parity, terms, finished):
+    rows = []
+    for q, p in enumerate(parity):
+        vec = p >> 1
+        combo = 1 << q
+        for bit, row, row_combo in rows:
+            if vec & bit:
+                vec ^= row
+                combo ^= row_combo
+        bit = vec & -vec
+        for i, (row_bit, row, row_combo) in enumerate(rows):
+            if row & bit:
+                rows[i] = (row_bit, row ^ vec, row_combo ^ combo)
+        rows.append((bit, vec, combo))
+
+    # a key with a variable no wire carries any more is outside the span without reducing it
+    carried = 0
+    for p in parity:
+        carried |= p
+    dead = ~(carried >> 1)
+    rebased = {}
+    for key, term in terms.items():
+        if key & dead:
+            finished.append(term)
+            continue
+        rest = key
+        coordinates = 0
+        for bit, row, row_combo in rows:
+            if key & bit:
+                rest ^= row
+                coordinates ^= row_combo
+        if rest == 0:
+            rebased[coordinates] = term
+        else:
+            finished.append(term)
+    for q in range(len(parity)):
+        parity[q] = (1 << (q + 1)) | (parity[q] & 1)
+    return rebased
+
+
+# Rotation merging with phase polynomials. Walking the DAG in topological order, every wire holds an affine
+# parity of boolean variables packed into an int: bit 0 is the constant, bit k > 0 a variable. CNOT and X
+# update parities, diagonal gates keep them, and any other gate (H, CCX, unknown names) gives the wires it
+# changes a fresh variable, which is where one {CNOT, X, R_z} region ends and the next begins. R_z gates
+# whose wires carry the same parity add up to one phase term, so the first keeps the summed angle (negated
+# when its parity has the constant bit) and the rest are removed. The DAG is rewritten in place.
+# Fresh variables widen every parity, so once there are more new ones than four times the wires and than
+# the terms that survived the last rebase, the parities are rebased onto the wires (see rebase_parities). The ints then
+# stay O(wires + live terms) bits wide however many H gates the circuit has, and a surviving term is only
+# reduced again after as many fresh variables as there were survivors.
+# type: (CircuitDAG) -> PassStats
+def rotation_merging(cd):
+    stats = PassStats('rotation_merging')
+    start_time = time.perf_counter()
+    stats.iterations = 1
+
+    num_qubits = cd.get_num_qubits()
+    parity = [1 << (q + 1) for q in range(num_qubits)]
+    next_var = num_qubits + 1
+    # parity without the constant bit -> [first R_z vertex, its sign, summed angle, merged vertices]
+    terms = {}
+    # terms no later R_z can join
+    finished = []
+    survivors = 0
+
+    for v in topological_sort(cd):
+        opcode = v.get_gate_opcode()
+        target = v.get_gate_target()
+        if opcode == Opcode.R_z:
+            stats.attempts += 1
+            sign = -1 if parity[target] & 1 else 1
+            theta = sign * v.get_gate().get_theta()
+            term = terms.get(parity[target] >> 1)
+            if term is None:
+                terms[parity[target] >> 1] = [v, sign, theta, []]
+            else:
+                term[2] += theta
+                term[3].append(v)
+        elif opcode == Opcode.CNOT:
+            parity[target] ^= parity[v.get_gate_controls()[0]]
+        elif opcode == Opcode.X:
+            parity[target] ^= 1
+        elif opcode in DIAGONAL_OPCODES:
+            continue
+        else:
+            wires = [target] if opcode in (Opcode.H, Opcode.CCX) else v.get_gate_all_qubits()
+            if next_var - num_qubits > max(4 * num_qubits, survivors):
+                terms = rebase_parities(parity, terms, finished)
+                survivors = len(terms)
+                next_var = num_qubits + 1
+            for wire in wires:
+                parity[wire] = 1 << next_var
+                next_var += 1
+
+    num_gates = len(cd.get_vertex_map())
+    finished.extend(terms.values())
+    for first, sign, theta, merged in finished:
+        if len(merged) == 0 and abs(theta) >= ANGLE_EPSILON:
+            continue
+        stats.rewrites += 1
+        for v in merged:
+            cd.remove_vertex_and_merge(v)
+        if abs(theta) < ANGLE_EPSILON:
+            cd.remove_vertex_and_merge(first)
+        else:
+            first.set_gate_theta(sign * theta)
 
+    stats.gates_removed = num_gates - len(cd.get_vertex_map())
+    stats.wall_time = time.perf_counter() - start_time
+    return stats
@@ -0,0 +1,104 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from src.adapter import circuit_dag_to_netlist
+from src.binary_format import dumps, loads
+from src.gate import Gate
+from src.pass_manager import PassManager, LIGHT
+
+
+# type: (Int, Iterable[Gate]) -> List[Tuple[List[Int], List[Gate]]]
+# Splits a netlist into the connected components of its qubit interaction graph. Each block is the sorted
+# list of qubits of one component and its gates in netlist order; qubits no gate touches are left out.
+# The union-find is keyed by the wires the gates use, so num_qubits may be None or smaller than the
+# highest wire, as for a netlist without an INIT header.
+def partition_by_components(num_qubits, netlist):
+    parent = {}
+
+    def find(q):
+        if q not in parent:
+            parent[q] = q
+            return q
+        while parent[q] != q:
+            parent[q] = parent[parent[q]]
+            q = parent[q]
+        return q
+
+    netlist = list(netlist)
+    for gate in netlist:
+        qubits = gate.get_all_qubits()
+        root = find(qubits[0])
+        for q in qubits[1:]:
+            other = find(q)
+            if other != root:
+                parent[other] = root
+
+    blocks = {}
+    for gate in netlist:
+        blocks.setdefault(find(gate.get_target()), []).append(gate)
+
+    partition = []
+    for gates in blocks.values():
+        qubits = sorted({q for gate in gates for q in gate.get_all_qubits()})
+        partition.append((qubits, gates))
+    return partition
+
+# type: (List[Tuple[List[Int], List[Gate]]], Int) -> List[Tuple[List[Int], List[Gate]]]
+# Cuts every block into time slices of at most max_gates consecutive gates. The slices are optimized on
+# their own, so rewrites never cross a slice boundary, and stitching them back in order keeps the circuit.
+def slice_blocks(partition, max_gates):
+    sliced = []
+    for qubits, gates in partition:
+        for start in range(0, len(gates), max_gates):
+            sliced.append((qubits, gates[start:start + max_gates]))
+    return sliced
+
+
+# type: (List[Int], List[Gate]) -> Bytes
+# a block renumbered onto wires 0..len(qubits) - 1 in the compact binary format
+def encode_block(qubits, gates):
+    local = {q: i for i, q in enumerate(qubits)}
+    return dumps(len(qubits), (Gate.from_fields(g.get_name(), [local[q] for q in g.get_all_qubits()], g.get_theta())
+                               for g in gates), links=False)
+
+# type: (List[Int], Bytes) -> List[Gate]
+def decode_block(qubits, data):
+    return [Gate.from_fields(g.get_name(), [qubits[q] for q in g.get_all_qubits()], g.get_theta())
+            for g in loads(data)]
+
+# type: (Bytes, Tuple[Str], Int) -> Bytes
+# Runs in a worker process. Blocks travel as binary netlists so no Vertex graph is ever pickled.
+def optimize_block(data, passes, max_rounds=None):
+    block = loads(data)
+    cd = PassManager(passes, max_rounds=max_rounds).run(block.to_circuit_dag())
+    return dumps(block.get_num_qubits(), circuit_dag_to_netlist(cd), links=False)
+
+
+# type: (Int, Iterable[Gate], Tuple[Str], Int, Int, Int) -> List[Gate]
+# Optimizes the independent blocks of a circuit in a process pool and stitches the results back: blocks
+# act on disjoint wires, so their outputs are simply concatenated, slices of one block in time order.
+# max_block_gates additionally slices large blocks so a single dominant component still spreads over the
+# workers, at the cost of the rewrites that would cross a slice boundary. jobs=None uses every core and
+# jobs=1 runs the blocks in this process.
+def optimize_parallel(num_qubits, netlist, passes=LIGHT, jobs=None, max_block_gates=None, max_rounds=None):
+    partition = partition_by_components(num_qubits, netlist)
+    if max_block_gates is not None:
+        partition = slice_blocks(partition, max_block_gates)
+
+    # biggest blocks are submitted first so a long one does not start last, results keep partition order
+    order = sorted(range(len(partition)), key=lambda i: len(partition[i][1]), reverse=True)
+    encoded = [encode_block(*partition[i]) for i in order]
+    args = (optimize_block, encoded, [tuple(passes)] * len(order), [max_rounds] * len(order))
+    results = [None] * len(partition)
+    if jobs == 1:
+        # same code path without worker processes, handy for debugging
+        for i, data in zip(order, map(*args)):
+            results[i] = data
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            for i, data in zip(order, executor.map(*args)):
+                results[i] = data
+
+    netlist = []
+    for (qubits, _), data in zip(partition, results):
+        netlist += decode_block(qubits, data)
+    return netlist
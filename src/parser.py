@@ -1,20 +1,364 @@
+import ast
+import functools
+import itertools
+import math
+import operator
+import re
+
 from src.gate import Gate
 from src.circuit_dag import CircuitDAG, Vertex
 
+# bytes of lines handed to the tokenizer per read
+CHUNK_SIZE = 1 << 20
+
+# tokens per line of every gate name the text format has a fixed arity for, including the name
+TEXT_ARITY = {
+    'INIT': 2, 'R_z': 3, 'H': 2, 'X': 2, 'Z': 2, 'P': 2, 'P_dag': 2, 'T': 2, 'T_dag': 2,
+    'CNOT': 3, 'CZ': 3, 'CCZ': 4, 'CCX': 4,
+}
+
+# OpenQASM 2.0. Files with this suffix are read and written as QASM by iter_gates and write_netlist.
+QASM_SUFFIX = '.qasm'
+QASM_HEADER = 'OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg q[%d];\n'
+# qelib1 gate -> (Gate name, number of qubits, whether it takes an angle), rz and u1 only differ by a global
+# phase
+QASM_GATES = {
+    'h': ('H', 1, False), 'x': ('X', 1, False), 'z': ('Z', 1, False), 's': ('P', 1, False),
+    'sdg': ('P_dag', 1, False), 't': ('T', 1, False), 'tdg': ('T_dag', 1, False),
+    'rz': ('R_z', 1, True), 'u1': ('R_z', 1, True),
+    'cx': ('CNOT', 2, False), 'CX': ('CNOT', 2, False), 'cz': ('CZ', 2, False), 'ccx': ('CCX', 3, False),
+}
+QASM_NAMES = {
+    'H': 'h', 'X': 'x', 'Z': 'z', 'P': 's', 'P_dag': 'sdg', 'T': 't', 'T_dag': 'tdg',
+    'R_z': 'rz', 'CNOT': 'cx', 'CZ': 'cz', 'CCX': 'ccx',
+}
+# statements that declare nothing the netlist needs
+QASM_SKIPPED = {'OPENQASM', 'include', 'creg', 'barrier'}
+# name, optional parameters in parentheses and the operands
+QASM_STATEMENT = re.compile(r'\s*([A-Za-z_]\w*)\s*(?:\((.*)\))?\s*(.*)', re.S)
+# a gate on one or two qubits given by index, the parameter without nested parentheses
+QASM_SIMPLE_STATEMENT = re.compile(
+    r'\s*([A-Za-z_]\w*)\s*(?:\(([^()]*)\))?\s*([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\]\s*'
+    r'(?:,\s*([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\]\s*)?$')
+# a register or one qubit of it
+QASM_OPERAND = re.compile(r'\s*([A-Za-z_]\w*)\s*(?:\[\s*(\d+)\s*\])?\s*')
+# the operands of a qreg declaration
+QASM_REGISTER = re.compile(r'\s*([A-Za-z_]\w*)\s*\[\s*(\d+)\s*\]\s*')
+
+QASM_BINARY_OPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+                   ast.Pow: operator.pow}
+QASM_UNARY_OPS = {ast.USub: operator.neg, ast.UAdd: operator.pos}
+QASM_FUNCTIONS = {'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'exp': math.exp, 'ln': math.log,
+                  'sqrt': math.sqrt}
+# parameter expressions whose values are kept, generated circuits repeat a handful like pi/4 over and over
+QASM_ANGLE_CACHE_SIZE = 1024
+
+# type: (Str) -> Float
+# Evaluates a QASM parameter: numbers, pi, + - * / ^, parentheses and the qelib1 functions. Plain numbers
+# are taken as they are, anything else goes through evaluate_qasm_angle. Angles that are not finite are an
+# unsupported parameter like any other.
+def qasm_angle(text):
+    try:
+        value = float(text)
+    except ValueError:
+        value = evaluate_qasm_angle(text)
+    if not math.isfinite(value):
+        raise ValueError('unsupported QASM parameter %s' % text)
+    return value
+
+# type: (Str) -> Float
+# The expression is parsed as Python and only the node types above are evaluated, on floats so that no
+# operand can turn into an arbitrarily large int, and nothing else in it can run. Division by zero,
+# overflow and domain errors are an unsupported parameter. The last QASM_ANGLE_CACHE_SIZE distinct
+# expressions are remembered, so a stream with many different angles does not grow memory.
+@functools.lru_cache(maxsize=QASM_ANGLE_CACHE_SIZE)
+def evaluate_qasm_angle(text):
+    def evaluate(node):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            return float(node.value)
+        if isinstance(node, ast.Name) and node.id == 'pi':
+            return math.pi
+        if isinstance(node, ast.BinOp) and type(node.op) in QASM_BINARY_OPS:
+            return QASM_BINARY_OPS[type(node.op)](evaluate(node.left), evaluate(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in QASM_UNARY_OPS:
+            return QASM_UNARY_OPS[type(node.op)](evaluate(node.operand))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in QASM_FUNCTIONS \
+                and len(node.args) == 1 and len(node.keywords) == 0:
+            return QASM_FUNCTIONS[node.func.id](evaluate(node.args[0]))
+        raise ValueError('unsupported QASM parameter %s' % text)
+    try:
+        # a negative base to a fractional power gives a complex number, which float() refuses
+        return float(evaluate(ast.parse(text.replace('^', '**'), mode='eval').body))
+    except (SyntaxError, ArithmeticError, ValueError, TypeError, RecursionError):
+        raise ValueError('unsupported QASM parameter %s' % text) from None
+
+# type: (Str, Str) -> ValueError
+# every statement that does not describe a circuit the netlist can hold is reported this way
+def invalid_qasm(statement, reason):
+    return ValueError('invalid QASM statement %s: %s' % (' '.join(statement.split()), reason))
+
+# type: (Gate) -> Str
+# the QASM statement of one gate, CCZ has no qelib1 gate and is written as H CCX H on its target
+def get_qasm_text(gate):
+    name = gate.get_name()
+    operands = ','.join(['q[%d]' % q for q in gate.get_all_qubits()])
+    if name == 'R_z':
+        return 'rz(%r) %s;' % (gate.get_theta(), operands)
+    if name == 'CCZ':
+        return 'h q[%d];\nccx %s;\nh q[%d];' % (gate.get_target(), operands, gate.get_target())
+    qasm_name = QASM_NAMES.get(name)
+    if qasm_name is None:
+        raise ValueError('no QASM gate for %s' % name)
+    return '%s %s;' % (qasm_name, operands)
+
 class Parser:
     def __init__(self):
-        pass
+        self.num_qubits = None
+        # QASM register name -> (offset, size), registers are laid out one after another
+        self.qregs = {}
+
+    # valid once iter_gates has returned, taken from the INIT header of the last file opened
+    def get_num_qubits(self):
+        return self.num_qubits
+
+    # type: (Str) -> Iterator[Gate]
+    # The INIT header is read eagerly so get_num_qubits() is set before the first gate is pulled.
+    # The rest of the file is read in CHUNK_SIZE batches of lines and never held in memory as a whole.
+    def iter_gates(self, filename):
+        if filename.endswith(QASM_SUFFIX):
+            return self.iter_qasm_gates(filename)
+        self.num_qubits = None
+        f = open(filename, 'r', buffering=CHUNK_SIZE)
+        line = f.readline()
+        while len(line) > 0 and line.isspace():
+            line = f.readline()
+
+        if line.startswith('INIT'):
+            self.num_qubits = int(line.split()[1])
+            line = ''
+        return self.read_gates(f, line)
+
+    def read_gates(self, f, first_line):
+        with f:
+            lines = [first_line]
+            while len(lines) > 0:
+                yield from self.parse_lines(lines)
+                lines = f.readlines(CHUNK_SIZE)
+
+    # type: (List[Str]) -> List[Gate]
+    # Tokenizes a whole batch of lines with one split and walks the tokens by the arity of each gate name, so
+    # no line is split on its own. A name without a fixed arity or tokens that do not line up (a line with
+    # too few or too many qubits shifts a number into the name position or a name into a number) fall back to
+    # Gate(line) for the batch, which parses every line as written and raises on the bad ones.
+    def parse_lines(self, lines):
+        tokens = ''.join(lines).split()
+        num_tokens = len(tokens)
+        gates = []
+        append = gates.append
+        from_fields = Gate.from_fields
+        i = 0
+        try:
+            while i < num_tokens:
+                name = tokens[i]
+                arity = TEXT_ARITY[name]
+                if arity == 2:
+                    if name == 'INIT':
+                        self.num_qubits = int(tokens[i + 1])
+                    else:
+                        append(from_fields(name, (int(tokens[i + 1]),)))
+                elif name == 'R_z':
+                    append(from_fields(name, (int(tokens[i + 2]),), float(tokens[i + 1])))
+                elif arity == 3:
+                    append(from_fields(name, (int(tokens[i + 1]), int(tokens[i + 2]))))
+                else:
+                    append(from_fields(name, tuple(map(int, tokens[i + 1:i + arity]))))
+                i += arity
+        except (KeyError, ValueError, IndexError):
+            i = -1
+        if i == len(tokens):
+            return gates
+
+        gates = []
+        for line in lines:
+            if len(line) > 0 and not line.isspace():
+                if line.startswith('INIT'):
+                    self.num_qubits = int(line.split()[1])
+                else:
+                    gates.append(Gate(line))
+        return gates
+
+    # type: (Str) -> Iterator[Gate]
+    # Same contract as iter_gates for an OpenQASM 2.0 file: the statements up to the first gate are read
+    # eagerly, so get_num_qubits() covers every qreg declared before it, and the rest is tokenized in
+    # CHUNK_SIZE batches of lines.
+    def iter_qasm_gates(self, filename):
+        self.num_qubits = None
+        self.qregs = {}
+        chunks = self.read_qasm_statements(open(filename, 'r', buffering=CHUNK_SIZE))
+        gates = []
+        for statements in chunks:
+            while len(statements) > 0 and len(gates) == 0:
+                gates = self.parse_qasm_statement(statements.pop(0))
+            if len(gates) > 0:
+                # the rest of this chunk goes ahead of the chunks still to be read
+                chunks = itertools.chain([statements], chunks)
+                break
+        return self.read_qasm_gates(gates, chunks)
+
+    def read_qasm_gates(self, first_gates, chunks):
+        yield from first_gates
+        qregs = self.qregs
+        from_fields = Gate.from_fields
+        for statements in chunks:
+            for statement in statements:
+                # Most statements are a qelib1 gate on one or two indexed qubits. Those are built right here when
+                # they check out, anything else, including every invalid statement, goes the long way.
+                gate = None
+                m = QASM_SIMPLE_STATEMENT.match(statement)
+                if m is not None:
+                    name, params, reg, index, reg2, index2 = m.groups()
+                    spec = QASM_GATES.get(name)
+                    first = qregs.get(reg)
+                    if spec is not None and first is not None and int(index) < first[1] \
+                            and spec[2] == (params is not None):
+                        gate_name, num_qubits, _ = spec
+                        try:
+                            theta = None if params is None else qasm_angle(params)
+                        except ValueError:
+                            num_qubits = 0
+                        if reg2 is None:
+                            if num_qubits == 1:
+                                gate = from_fields(gate_name, (first[0] + int(index),), theta)
+                        elif num_qubits == 2:
+                            second = qregs.get(reg2)
+                            if second is not None and int(index2) < second[1]:
+                                qubits = (first[0] + int(index), second[0] + int(index2))
+                                if qubits[0] != qubits[1]:
+                                    gate = from_fields(gate_name, qubits, theta)
+                if gate is None:
+                    yield from self.parse_qasm_statement(statement)
+                else:
+                    yield gate
+
+    # type: (File) -> Iterator[List[Str]]
+    # the statements of a QASM file without comments, split on ';' across line and chunk boundaries, one list
+    # per CHUNK_SIZE batch of lines
+    def read_qasm_statements(self, f):
+        with f:
+            rest = ''
+            lines = f.readlines(CHUNK_SIZE)
+            while len(lines) > 0:
+                text = ''.join([line.split('//', 1)[0] if '//' in line else line for line in lines])
+                statements = (rest + text).split(';')
+                rest = statements.pop()
+                yield [statement for statement in statements if len(statement) > 0 and not statement.isspace()]
+                lines = f.readlines(CHUNK_SIZE)
+        if not rest.isspace() and len(rest) > 0:
+            raise ValueError('QASM statement without ; at the end of the file: %s' % rest.strip())
+
+    # type: (Str) -> List[Gate]
+    # The gates of one statement, several when an operand is a whole register, none for declarations. Every
+    # operand has to name a declared register and an index inside it, every gate gets the number of qubits
+    # and angles qelib1 gives it and no qubit twice; anything else raises ValueError with the statement.
+    def parse_qasm_statement(self, statement):
+        m = QASM_STATEMENT.match(statement)
+        if m is None:
+            raise invalid_qasm(statement, 'not a statement')
+        name, params, operands = m.groups()
+        spec = QASM_GATES.get(name)
+        if spec is None:
+            if name == 'qreg':
+                m = QASM_REGISTER.fullmatch(operands)
+                if m is None:
+                    raise invalid_qasm(statement, 'expected qreg name[size]')
+                reg, size = m.groups()
+                if reg in self.qregs:
+                    raise invalid_qasm(statement, 'register %s is already declared' % reg)
+                offset = 0 if self.num_qubits is None else self.num_qubits
+                self.qregs[reg] = (offset, int(size))
+                self.num_qubits = offset + int(size)
+                return []
+            if name in QASM_SKIPPED:
+                return []
+            raise ValueError('unsupported QASM statement: %s' % statement.strip())
+
+        gate_name, num_qubits, takes_angle = spec
+        theta = None
+        if takes_angle:
+            if params is None or params.strip() == '':
+                raise invalid_qasm(statement, '%s takes an angle' % name)
+            try:
+                theta = qasm_angle(params)
+            except ValueError as e:
+                raise invalid_qasm(statement, str(e)) from None
+        elif params is not None and params.strip() != '':
+            raise invalid_qasm(statement, '%s takes no parameters' % name)
+
+        columns = []
+        width = None
+        for operand in operands.split(',') if operands.strip() != '' else []:
+            m = QASM_OPERAND.fullmatch(operand)
+            if m is None:
+                raise invalid_qasm(statement, 'bad operand %s' % operand.strip())
+            reg, index = m.groups()
+            if reg not in self.qregs:
+                raise invalid_qasm(statement, 'register %s is not declared' % reg)
+            offset, size = self.qregs[reg]
+            if index is None:
+                # a whole register applies the gate to each of its qubits in turn
+                if width is not None and width != size:
+                    raise invalid_qasm(statement, 'registers of different sizes')
+                width = size
+                columns.append(range(offset, offset + size))
+            elif int(index) >= size:
+                raise invalid_qasm(statement, 'index %s is outside register %s of size %d' % (index, reg, size))
+            else:
+                columns.append(int(index) + offset)
+        if len(columns) != num_qubits:
+            raise invalid_qasm(statement, '%s acts on %d qubits, not %d' % (name, num_qubits, len(columns)))
+
+        if width is None:
+            rows = [columns]
+        else:
+            rows = zip(*[q if isinstance(q, range) else [q] * width for q in columns])
+        gates = []
+        for all_qubits in rows:
+            if len(set(all_qubits)) != len(all_qubits):
+                raise invalid_qasm(statement, 'a qubit appears twice')
+            gates.append(Gate.from_fields(gate_name, all_qubits, theta))
+        return gates
 
     def get_netlist(self, filename):
-        netlist = []
-
-        f = open(filename, 'r')
-        for line in f:
-            line = line.replace('\n', '')
-            if len(line) > 0:
-                gate = Gate(line)
-                if gate.get_name() != 'INIT':
-                    netlist.append(gate)
-        return netlist
-            
+        return list(self.iter_gates(filename))
+
+    # type: (Str) -> CircuitDAG
+    def get_circuit_dag(self, filename):
+        gates = self.iter_gates(filename)
+        return CircuitDAG.from_stream(gates, self.get_num_qubits())
+
+    # type: (Str, Int) -> Str
+    # the lines write_netlist puts in front of the gates of filename
+    def get_header(self, filename, num_qubits):
+        if filename.endswith(QASM_SUFFIX):
+            return QASM_HEADER % num_qubits
+        return 'INIT %d\n' % num_qubits
+
+    # type: (Str, Int, Iterable[Gate]) -> None
+    def write_netlist(self, filename, num_qubits, netlist):
+        if filename.endswith(QASM_SUFFIX):
+            self.write_qasm(filename, num_qubits, netlist)
+            return
+        with open(filename, 'w', buffering=CHUNK_SIZE) as f:
+            f.write(self.get_header(filename, num_qubits))
+            for gate in netlist:
+                f.write(gate.get_text())
+                f.write('\n')
 
+    # type: (Str, Int, Iterable[Gate]) -> None
+    # the netlist as OpenQASM 2.0 on a single register q
+    def write_qasm(self, filename, num_qubits, netlist):
+        with open(filename, 'w', buffering=CHUNK_SIZE) as f:
+            f.write(self.get_header(filename, num_qubits))
+            for gate in netlist:
+                f.write(get_qasm_text(gate))
+                f.write('\n')
@@ -0,0 +1,130 @@
+import time
+
+from src import instrumentation
+from src.optimizer_subroutines import hadamard_gate_reduction, single_qubit_gate_cancellation, rotation_merging
+from src.angles import fold_rotations, snap_rotations
+from src.fusion import gate_fusion
+from src.pass_stats import PassStats
+
+# passes by name, every pass rewrites the CircuitDAG it is given in place
+PASSES = {
+    'hadamard_gate_reduction': hadamard_gate_reduction,
+    'single_qubit_gate_cancellation': single_qubit_gate_cancellation,
+    'rotation_merging': rotation_merging,
+    'fold_rotations': fold_rotations,
+    'snap_rotations': snap_rotations,
+    'gate_fusion': gate_fusion,
+}
+
+# Orderings after Nam et al. single_qubit_gate_cancellation covers both their single-qubit (R_z) and
+# two-qubit (CNOT) cancellation passes, so each of those steps maps onto it.
+LIGHT = ('hadamard_gate_reduction', 'single_qubit_gate_cancellation',
+         'hadamard_gate_reduction', 'single_qubit_gate_cancellation',
+         'rotation_merging', 'single_qubit_gate_cancellation')
+# LIGHT around a gate_fusion of the single-qubit runs it leaves, so the second pass sees the fused runs.
+# Nam et al.'s floating R_z gates and their phase-polynomial resynthesis of CNOT+R_z regions have no pass here.
+HEAVY = LIGHT + ('gate_fusion',) + LIGHT
+
+
+# One invocation of one pass. The depths are only known when the PassManager tracks them.
+class PassRecord:
+    def __init__(self, name, round_index, gates_before, gates_after, wall_time, stats=None, depth_before=None,
+                 depth_after=None):
+        self.name = name
+        self.round_index = round_index
+        self.gates_before = gates_before
+        self.gates_after = gates_after
+        self.wall_time = wall_time
+        self.stats = stats
+        self.depth_before = depth_before
+        self.depth_after = depth_after
+
+    def get_gate_delta(self):
+        return self.gates_after - self.gates_before
+
+    def to_dict(self):
+        record = {
+            'name': self.name,
+            'round': self.round_index,
+            'gates_before': self.gates_before,
+            'gates_after': self.gates_after,
+            'gate_delta': self.get_gate_delta(),
+            'wall_time': self.wall_time,
+        }
+        if self.depth_after is not None:
+            record['depth_before'] = self.depth_before
+            record['depth_after'] = self.depth_after
+        if self.stats is not None:
+            record['stats'] = self.stats.to_dict()
+        return record
+
+
+# Runs a sequence of passes over a CircuitDAG and repeats it until a whole round removes no gates, max_rounds
+# rounds have run or time_budget seconds have passed. The budget is checked before each pass, so one pass can
+# overrun it. With skip_stale set, a pass that removed no gates in that many consecutive invocations is
+# skipped in later rounds. Gate-count deltas miss rewrites that only rename gates (Hadamard rules 1, 2, 4
+# and 5), so skipping is off by default. With track_depth set every record also has the circuit depth before
+# and after the pass, which CircuitDAG.get_depth keeps up to date incrementally.
+class PassManager:
+    # type: (Iterable[Str or Callable], Int, Float, Int, Bool) -> None
+    def __init__(self, passes=LIGHT, max_rounds=None, time_budget=None, skip_stale=None, track_depth=False):
+        self.passes = []
+        for p in passes:
+            if callable(p):
+                self.passes.append((p.__name__, p))
+            else:
+                self.passes.append((p, PASSES[p]))
+        self.max_rounds = max_rounds
+        self.time_budget = time_budget
+        self.skip_stale = skip_stale
+        self.track_depth = track_depth
+        self.records = []
+
+    def get_records(self):
+        return self.records
+
+    def out_of_time(self, start_time):
+        return self.time_budget is not None and time.perf_counter() - start_time >= self.time_budget
+
+    # type: (CircuitDAG) -> CircuitDAG
+    def run(self, cd):
+        start_time = time.perf_counter()
+        v_map = cd.get_vertex_map()
+        stale = [0] * len(self.passes)
+        round_index = 0
+
+        while self.max_rounds is None or round_index < self.max_rounds:
+            round_gates = len(v_map)
+            for i, (name, pass_fn) in enumerate(self.passes):
+                if self.out_of_time(start_time):
+                    return cd
+                if self.skip_stale is not None and stale[i] >= self.skip_stale:
+                    continue
+
+                gates_before = len(v_map)
+                depth_before = cd.get_depth() if self.track_depth else None
+                pass_start = time.perf_counter()
+                result = pass_fn(cd)
+                wall_time = time.perf_counter() - pass_start
+                if instrumentation.ACTIVE is not None:
+                    instrumentation.ACTIVE.add_time(name, wall_time)
+                stats = result if isinstance(result, PassStats) else None
+                depth_after = cd.get_depth() if self.track_depth else None
+                self.records.append(PassRecord(name, round_index, gates_before, len(v_map), wall_time, stats,
+                                               depth_before, depth_after))
+                stale[i] = stale[i] + 1 if len(v_map) == gates_before else 0
+
+            round_index += 1
+            if len(v_map) == round_gates:
+                break
+        return cd
+
+    # totals per pass name over every invocation so far
+    def summary(self):
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record.name, {'invocations': 0, 'gates_removed': 0, 'wall_time': 0.0})
+            total['invocations'] += 1
+            total['gates_removed'] -= record.get_gate_delta()
+            total['wall_time'] += record.wall_time
+        return totals
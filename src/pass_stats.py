@@ -0,0 +1,22 @@
+# Counters an optimization pass reports about one invocation.
+class PassStats:
+    def __init__(self, name):
+        self.name = name
+        self.gates_removed = 0
+        self.rewrites = 0
+        self.attempts = 0
+        self.iterations = 0
+        self.wall_time = 0.0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'gates_removed': self.gates_removed,
+            'rewrites': self.rewrites,
+            'attempts': self.attempts,
+            'iterations': self.iterations,
+            'wall_time': self.wall_time,
+        }
+
+    def __repr__(self):
+        return 'PassStats(%r)' % self.to_dict()
@@ -0,0 +1,113 @@
+import os
+import shutil
+
+from src.adapter import topological_sort
+from src.circuit_dag import CircuitDAG
+from src.parser import Parser, CHUNK_SIZE
+from src.pass_manager import PassManager, LIGHT
+
+DEFAULT_WINDOW = 256
+
+
+# type: (CircuitDAG, Set[Int], Int) -> Tuple[List[Gate], List[Gate]]
+# Splits an optimized window into the gates to flush and the gates to keep, both in topological order.
+# Every wire that received gates in the last batch keeps its last `window` gates; everything before them,
+# and every gate of a wire that stayed idle, is flushed together with its ancestors. The flushed set is
+# closed under predecessors, so it is a prefix of the circuit and the kept gates can be optimized further
+# on their own. Flushing a gate also flushes the gates it depends on, even recent ones on sparse wires;
+# that is where a small window loses reductions.
+def split_window(cd, open_wires, window):
+    order = topological_sort(cd)
+    on_wire = {}
+    for v in order:
+        for wire in v.get_gate_all_qubits():
+            on_wire.setdefault(wire, []).append(v)
+
+    stack = []
+    for wire, vertices in on_wire.items():
+        if wire in open_wires:
+            stack += vertices[:-window]
+        else:
+            stack += vertices
+    flushed = set()
+    while len(stack) > 0:
+        v = stack.pop()
+        if v not in flushed:
+            flushed.add(v)
+            stack += v.get_input()
+
+    flush, keep = [], []
+    for v in order:
+        (flush if v in flushed else keep).append(v.get_gate())
+    return flush, keep
+
+# type: (Int, Iterable[Gate], Int, Tuple[Str], Int) -> Iterator[Gate]
+# Optimizes a gate stream through a sliding window of about `window` gates per wire. Gates are read until
+# some wire holds 2 * window of them, the passes run on that window only, and the gates that can no longer
+# meet new ones are yielded. Memory grows with the window and the number of active wires, not with the
+# circuit; a larger window finds more reductions at a higher cost per batch. Wires are counted as they are
+# seen, so num_qubits may be None or smaller than the highest wire, as for a netlist without an INIT header.
+def optimize_stream(num_qubits, gates, window=DEFAULT_WINDOW, passes=LIGHT, max_rounds=None):
+    keep = []
+    counts = {}
+    batch = []
+    open_wires = set()
+
+    for gate in gates:
+        batch.append(gate.copy())
+        full = False
+        for wire in gate.get_all_qubits():
+            open_wires.add(wire)
+            counts[wire] = counts.get(wire, 0) + 1
+            full = full or counts[wire] >= 2 * window
+        if not full:
+            continue
+
+        cd = CircuitDAG.from_stream(keep + batch, num_qubits)
+        PassManager(passes, max_rounds=max_rounds).run(cd)
+        flush, keep = split_window(cd, open_wires, window)
+        for gate in flush:
+            yield gate
+
+        batch = []
+        open_wires = set()
+        counts = {}
+        for gate in keep:
+            for wire in gate.get_all_qubits():
+                counts[wire] = counts.get(wire, 0) + 1
+
+    cd = CircuitDAG.from_stream(keep + batch, num_qubits)
+    PassManager(passes, max_rounds=max_rounds).run(cd)
+    for v in topological_sort(cd):
+        yield v.get_gate()
+
+# type: (Str, Str, Int, Tuple[Str], Int) -> None
+# Reads, optimizes and writes a netlist file without ever holding the whole circuit. The header is written
+# before the gates, so when the input had none or it undercounts the wires, the output is written once more
+# behind a header for the highest wire of the input + 1, as CircuitDAG.from_stream counts them.
+def optimize_file(in_filename, out_filename, window=DEFAULT_WINDOW, passes=LIGHT, max_rounds=None):
+    parser = Parser()
+    gates = parser.iter_gates(in_filename)
+    num_qubits = parser.get_num_qubits()
+    width = 0 if num_qubits is None else num_qubits
+    highest = [-1]
+
+    def track(stream):
+        for gate in stream:
+            highest[0] = max(highest[0], *gate.get_all_qubits())
+            yield gate
+
+    parser.write_netlist(out_filename, width, optimize_stream(num_qubits, track(gates), window, passes, max_rounds))
+    if highest[0] < width:
+        return
+
+    body_filename = out_filename + '.body'
+    os.replace(out_filename, body_filename)
+    try:
+        with open(body_filename, 'r') as body, open(out_filename, 'w', buffering=CHUNK_SIZE) as f:
+            for _ in range(parser.get_header(out_filename, width).count('\n')):
+                body.readline()
+            f.write(parser.get_header(out_filename, max(width, highest[0] + 1)))
+            shutil.copyfileobj(body, f, CHUNK_SIZE)
+    finally:
+        os.unlink(body_filename)
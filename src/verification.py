@@ -0,0 +1,445 @@
+import math
+import random
+
+import numpy as np
+
+from src.adapter import circuit_dag_to_netlist
+from src.circuit_dag import CircuitDAG
+from src.gate import Gate
+from src.parallel import partition_by_components
+from src.pass_manager import PassManager, PASSES, LIGHT
+
+# components up to this width are checked by simulation, wider ones with path sums
+MAX_SIMULATION_QUBITS = 12
+DEFAULT_BATCH = 4
+TOLERANCE = 1e-8
+# random assignments a leftover path sum phase is evaluated on
+PHASE_SAMPLES = 256
+
+# diagonal single qubit gates as the angle of their |1> phase, R_z(theta) is taken as diag(1, e^(i theta)),
+# which only differs from the usual convention by a global phase
+PHASES = {'P': math.pi / 2, 'P_dag': -math.pi / 2, 'T': math.pi / 4, 'T_dag': -math.pi / 4, 'Z': math.pi}
+SELF_INVERSE = {'H', 'X', 'Z', 'CNOT', 'CZ', 'CCZ', 'CCX'}
+
+
+# Outcome of an equivalence check. equivalent is True, False, or None when the check could not decide.
+# wires are the qubits where the circuits diverge and first_gate the index of the first gate of the original
+# netlist acting on one of them, the start of the divergent region.
+class VerificationReport:
+    def __init__(self, method, equivalent, wires=(), first_gate=None, message=''):
+        self.method = method
+        self.equivalent = equivalent
+        self.wires = sorted(wires)
+        self.first_gate = first_gate
+        self.message = message
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'equivalent': self.equivalent,
+            'wires': self.wires,
+            'first_gate': self.first_gate,
+            'message': self.message,
+        }
+
+    def __repr__(self):
+        return 'VerificationReport(%r)' % self.to_dict()
+
+
+# type: (List[Gate]) -> List[Gate]
+def inverse_netlist(netlist):
+    inverse = []
+    for gate in reversed(netlist):
+        name = gate.get_name()
+        if name == 'R_z':
+            inverse.append(Gate.from_fields(name, gate.get_all_qubits(), -gate.get_theta()))
+        elif name in SELF_INVERSE:
+            inverse.append(gate)
+        elif name in PHASES:
+            inverse.append(Gate.from_fields(name[:-4] if name.endswith('_dag') else name + '_dag', gate.get_all_qubits()))
+        else:
+            raise ValueError('cannot invert gate %s' % name)
+    return inverse
+
+def wrap_angle(theta):
+    return math.remainder(theta, 2 * math.pi)
+
+def is_angle(theta, value):
+    return abs(wrap_angle(theta - value)) < TOLERANCE
+
+
+# type: (Int, np.ndarray, List[Gate]) -> np.ndarray
+# Applies a netlist to a batch of state vectors of shape (batch, 2, ..., 2), qubit q on axis q + 1. Every
+# gate is a few numpy operations on views selecting the basis states it acts on.
+def simulate(num_qubits, states, netlist):
+    def at(qubits, values):
+        idx = [slice(None)] * (num_qubits + 1)
+        for q, value in zip(qubits, values):
+            idx[q + 1] = value
+        return tuple(idx)
+
+    h = 1 / math.sqrt(2)
+    for gate in netlist:
+        name = gate.get_name()
+        qubits = gate.get_all_qubits()
+        t = qubits[-1]
+        controls = qubits[:-1]
+        if name == 'H':
+            zero, one = states[at([t], [0])].copy(), states[at([t], [1])]
+            states[at([t], [0])] = (zero + one) * h
+            states[at([t], [1])] = (zero - one) * h
+        elif name == 'R_z' or name in PHASES:
+            theta = gate.get_theta() if name == 'R_z' else PHASES[name]
+            states[at([t], [1])] *= complex(math.cos(theta), math.sin(theta))
+        elif name in ('X', 'CNOT', 'CCX'):
+            ones = [1] * len(controls)
+            zero = states[at(controls + [t], ones + [0])].copy()
+            states[at(controls + [t], ones + [0])] = states[at(controls + [t], ones + [1])]
+            states[at(controls + [t], ones + [1])] = zero
+        elif name in ('CZ', 'CCZ'):
+            states[at(qubits, [1] * len(qubits))] *= -1
+        else:
+            raise ValueError('cannot simulate gate %s' % name)
+    return states
+
+# type: (Int, Int, np.random.Generator) -> np.ndarray
+def random_states(num_qubits, batch, rng):
+    states = rng.normal(size=(batch,) + (2,) * num_qubits) + 1j * rng.normal(size=(batch,) + (2,) * num_qubits)
+    norms = np.sqrt(np.sum(np.abs(states.reshape(batch, -1)) ** 2, axis=1))
+    return states / norms.reshape((batch,) + (1,) * num_qubits)
+
+# type: (Int, List[Gate], List[Gate], Int, Int) -> VerificationReport
+# Runs both netlists on the same batch of random states and compares the results up to one global phase.
+# Circuits that differ by more than a global phase disagree on a random state with probability 1. The
+# divergent wires are those whose single qubit reduced states differ.
+def check_by_simulation(num_qubits, original, optimized, batch=DEFAULT_BATCH, seed=0):
+    states = random_states(num_qubits, batch, np.random.default_rng(seed))
+    a = simulate(num_qubits, states.copy(), original)
+    b = simulate(num_qubits, states, optimized)
+
+    overlap = np.vdot(a[0], b[0])
+    if abs(overlap) > TOLERANCE:
+        b = b * (abs(overlap) / overlap)
+    if np.allclose(a, b, atol=TOLERANCE * 2 ** (num_qubits / 2) + TOLERANCE):
+        return VerificationReport('simulation', True)
+
+    wires = []
+    for q in range(num_qubits):
+        x = np.moveaxis(a, q + 1, 1).reshape(batch, 2, -1)
+        y = np.moveaxis(b, q + 1, 1).reshape(batch, 2, -1)
+        rho_a = x @ x.conj().transpose(0, 2, 1)
+        rho_b = y @ y.conj().transpose(0, 2, 1)
+        if not np.allclose(rho_a, rho_b, atol=1e-6):
+            wires.append(q)
+    message = 'final states differ by %.3g' % np.max(np.abs(a - b))
+    return VerificationReport('simulation', False, wires or range(num_qubits), message=message)
+
+
+# Path sum of a circuit (Amy, Towards large-scale functional verification of universal quantum circuits):
+# |x> -> sum over path variables y of e^(i phase(x, y)) |outputs(x, y)>, up to normalization and global
+# phase. Variables are bits of an int, bit 0 the constant, bit q + 1 input x_q and higher bits the path
+# variables H gates introduce. Every wire holds an affine parity and the phase is a sum of angle * [parity]
+# terms, keyed by parities without the constant bit, as in rotation_merging. Diagonal gates only add terms,
+# CNOT and X update parities and H on a wire holding f sets it to a fresh y with the term pi * [f] * [y].
+class PathSum:
+    def __init__(self, num_qubits):
+        self.num_qubits = num_qubits
+        self.outputs = [1 << (q + 1) for q in range(num_qubits)]
+        self.terms = {}
+        # path variable bit -> wire of the H that introduced it
+        self.path_vars = {}
+        self.next_var = num_qubits + 1
+        # path variables to try reduce_var on, see reduce
+        self.pending = []
+
+    def path_bits(self, parity):
+        rest = parity >> (self.num_qubits + 1) << (self.num_qubits + 1)
+        while rest:
+            low = rest & -rest
+            yield low
+            rest ^= low
+
+    def add_term(self, parity, theta):
+        if parity & 1:
+            # [p xor 1] = 1 - [p], the constant part is a global phase
+            parity ^= 1
+            theta = -theta
+        if parity == 0:
+            return
+        theta = wrap_angle(self.terms.get(parity, 0.0) + theta)
+        if abs(theta) < TOLERANCE:
+            self.terms.pop(parity, None)
+        else:
+            self.terms[parity] = theta
+
+    # type: (Int) -> List[Tuple[Int, Float]]
+    # removes and returns the terms containing the variable bit, a scan is cheaper than keeping an index of
+    # the variables of every term up to date, the terms are long
+    def pop_terms(self, var):
+        popped = [(parity, theta) for parity, theta in self.terms.items() if parity & var]
+        for parity, _ in popped:
+            del self.terms[parity]
+        return popped
+
+    # pi * [f] * [g] as linear terms, [f][g] = ([f] + [g] - [f xor g]) / 2
+    def add_product(self, f, g, theta):
+        self.add_term(f, theta / 2)
+        self.add_term(g, theta / 2)
+        self.add_term(f ^ g, -theta / 2)
+
+    # type: (Gate) -> None
+    def apply(self, gate):
+        name = gate.get_name()
+        qubits = gate.get_all_qubits()
+        out = self.outputs
+        t = qubits[-1]
+        if name == 'X':
+            out[t] ^= 1
+        elif name == 'CNOT':
+            out[t] ^= out[qubits[0]]
+        elif name == 'R_z':
+            self.add_term(out[t], gate.get_theta())
+        elif name in PHASES:
+            self.add_term(out[t], PHASES[name])
+        elif name == 'CZ':
+            self.add_product(out[qubits[0]], out[t], math.pi)
+        elif name == 'CCZ':
+            a, b, c = (out[q] for q in qubits)
+            for parity, sign in ((a, 1), (b, 1), (c, 1), (a ^ b, -1), (a ^ c, -1), (b ^ c, -1), (a ^ b ^ c, 1)):
+                self.add_term(parity, sign * math.pi / 4)
+        elif name == 'H':
+            y = 1 << self.next_var
+            self.next_var += 1
+            self.path_vars[y] = t
+            self.add_product(out[t], y, math.pi)
+            # the variables only this wire held may be summed out now, which keeps the terms short
+            self.pending.extend(self.path_bits(out[t]))
+            out[t] = y
+        elif name == 'CCX':
+            for g in (Gate.from_fields('H', [t]), Gate.from_fields('CCZ', qubits), Gate.from_fields('H', [t])):
+                self.apply(g)
+        else:
+            raise ValueError('no path sum for gate %s' % name)
+
+    # replaces path variable z by the parity q xor z everywhere, which solves q = 0 for z
+    def substitute(self, z, q):
+        for parity, theta in self.pop_terms(z):
+            self.add_term(parity ^ q, theta)
+        for w in range(self.num_qubits):
+            if self.outputs[w] & z:
+                self.outputs[w] ^= q
+        del self.path_vars[z]
+
+    # drops y from the phase, keeping the value every term containing it has at y = 0
+    def eliminate(self, y):
+        for parity, theta in self.pop_terms(y):
+            self.add_term(parity ^ y, theta)
+        del self.path_vars[y]
+
+    # type: (Int) -> Bool
+    # Sums out a path variable y that no output depends on. Writing the terms containing y as theta0 * [y] and
+    # theta_k * [y xor f_k], the sum over y is 1 + e^(i D) with D = theta0 + sum theta_k (1 - 2 [f_k]). When
+    # every theta_k is +-pi / 2 or pi, D = c + pi [g] with g the xor of the f_k of the +-pi / 2 terms: c = 0
+    # or pi is the HH rule, a delta that solves g (or g xor 1) for another path variable, c = +-pi / 2 the
+    # omega rule, which leaves the term -c * [g]. A single y xor f term with any other angle also leaves one
+    # term on f. Eliminating y keeps the phase at y = 0, these rules add what the sum contributes on top.
+    def reduce_var(self, y):
+        if any(out & y for out in self.outputs):
+            return False
+        theta0 = self.terms.get(y, 0.0)
+        others = [(p ^ y, theta) for p, theta in self.terms.items() if p & y and p != y]
+
+        if all(is_angle(2 * theta, math.pi) or is_angle(theta, math.pi) for _, theta in others):
+            c = theta0 + sum(theta for _, theta in others)
+            g = 0
+            for f, theta in others:
+                if not is_angle(theta, math.pi):
+                    g ^= f
+            if is_angle(c, 0) or is_angle(c, math.pi):
+                q = g if is_angle(c, 0) else g ^ 1
+                if q == 0:
+                    self.eliminate(y)
+                    return True
+                # the newest variable is usually the one of the H y pairs up with, as in H H = I
+                candidates = sorted(self.path_bits(q), key=lambda z: -z)
+                if len(candidates) == 0:
+                    return False
+                z = candidates[0]
+                self.eliminate(y)
+                self.substitute(z, q)
+                return True
+            if is_angle(c, math.pi / 2) or is_angle(c, -math.pi / 2):
+                self.eliminate(y)
+                self.add_term(g, -c)
+                return True
+            if g == 0:
+                self.eliminate(y)
+                return True
+            return False
+
+        if len(others) == 1:
+            f, theta1 = others[0]
+            if is_angle(theta0, 0) and not is_angle(theta1, math.pi):
+                self.eliminate(y)
+                self.add_term(f, -theta1)
+                return True
+            if is_angle(theta0, math.pi):
+                self.eliminate(y)
+                self.add_term(f, math.pi - theta1)
+                return True
+            if is_angle(theta1, math.pi) and not is_angle(theta0, 0):
+                self.eliminate(y)
+                return True
+        return False
+
+    # applies reduce_var to the pending variables, and with full set until no path variable can be summed out
+    # any more
+    def reduce(self, full=True):
+        pending, self.pending = self.pending, []
+        for y in pending:
+            if y in self.path_vars:
+                self.reduce_var(y)
+        changed = full
+        while changed:
+            changed = False
+            for y in sorted(self.path_vars, reverse=True):
+                if y in self.path_vars and self.reduce_var(y):
+                    changed = True
+
+    # type: (Int, Int) -> Bool
+    # One phase function has many term sums, pi [a] + pi [b] - pi [a xor b] is 0 mod 2 pi, so what is left
+    # after reduction is evaluated on random assignments rather than compared to no terms. With angles that
+    # are multiples of pi / 4 a nonzero phase is nonzero on at least 1/8 of the assignments.
+    def phase_is_constant(self, samples=PHASE_SAMPLES, seed=0):
+        rng = random.Random(seed)
+        for _ in range(samples if len(self.terms) > 0 else 0):
+            x = rng.getrandbits(self.next_var)
+            phase = sum(theta for parity, theta in self.terms.items() if (parity & x).bit_count() & 1)
+            if abs(wrap_angle(phase)) > TOLERANCE * len(self.terms):
+                return False
+        return True
+
+    # type: () -> Set[Int]
+    # wires on which this path sum may not be the identity
+    def get_divergent_wires(self):
+        wires = set()
+        for q, out in enumerate(self.outputs):
+            if out != 1 << (q + 1):
+                wires.add(q)
+        for parity in self.terms:
+            for q in range(self.num_qubits):
+                if parity & (1 << (q + 1)):
+                    wires.add(q)
+            for var in self.path_bits(parity):
+                wires.add(self.path_vars[var])
+        for var, wire in self.path_vars.items():
+            wires.add(wire)
+        return wires
+
+# type: (Int, List[Gate], List[Gate]) -> VerificationReport
+# Builds the path sum of the original circuit followed by the inverse of the optimized one and reduces it.
+# It reduces to the identity exactly when the circuits are equal up to global phase, as far as the rules
+# reach: a reduced sum without path variables that is not the identity proves a difference, one with path
+# variables left is inconclusive.
+def check_by_path_sum(num_qubits, original, optimized):
+    path_sum = PathSum(num_qubits)
+    for gate in original:
+        path_sum.apply(gate)
+    path_sum.pending = []
+    for gate in inverse_netlist(optimized):
+        path_sum.apply(gate)
+        if len(path_sum.pending) > 0:
+            path_sum.reduce(full=False)
+    path_sum.reduce()
+
+    permuted = [q for q, out in enumerate(path_sum.outputs) if out != 1 << (q + 1)]
+    if len(path_sum.path_vars) == 0 and len(permuted) == 0 and path_sum.phase_is_constant():
+        return VerificationReport('path_sum', True)
+    wires = path_sum.get_divergent_wires()
+    if len(path_sum.path_vars) > 0:
+        return VerificationReport('path_sum', None, wires,
+                                  message='%d path variables could not be summed out' % len(path_sum.path_vars))
+    return VerificationReport('path_sum', False, wires,
+                              message='%d phase terms left, %d wires permuted' % (len(path_sum.terms), len(permuted)))
+
+
+# type: (Int, Iterable[Gate], Iterable[Gate], Int, Int, Int) -> VerificationReport
+# Checks that optimized implements the same unitary as original up to global phase. Both are split into
+# the connected components of their combined qubit interaction graph, which must each match on their own.
+# Components of at most max_simulation_qubits wires are simulated on a batch of random states, wider ones
+# are checked with path sums. The report covers the component whose divergent region starts first, or says
+# the circuits are equivalent (True), or that some component could not be decided (None).
+def verify(num_qubits, original, optimized, max_simulation_qubits=MAX_SIMULATION_QUBITS, batch=DEFAULT_BATCH,
+           seed=0):
+    original = list(original)
+    optimized = list(optimized)
+    tagged = list(enumerate(original)) + [(None, g) for g in optimized]
+    component = {}
+    for c, (qubits, _) in enumerate(partition_by_components(num_qubits, [g for _, g in tagged])):
+        for q in qubits:
+            component[q] = c
+
+    blocks = {}
+    for i, gate in tagged:
+        qubits, indices, a, b = blocks.setdefault(component[gate.get_target()], (set(), [], [], []))
+        qubits.update(gate.get_all_qubits())
+        if i is None:
+            b.append(gate)
+        else:
+            indices.append(i)
+            a.append(gate)
+
+    failures = []
+    undecided = None
+    methods = set()
+    for qubits, indices, a, b in blocks.values():
+        qubits = sorted(qubits)
+        local = {q: j for j, q in enumerate(qubits)}
+        a_local = [Gate.from_fields(g.get_name(), [local[q] for q in g.get_all_qubits()], g.get_theta()) for g in a]
+        b_local = [Gate.from_fields(g.get_name(), [local[q] for q in g.get_all_qubits()], g.get_theta()) for g in b]
+        if len(qubits) <= max_simulation_qubits:
+            report = check_by_simulation(len(qubits), a_local, b_local, batch, seed)
+        else:
+            report = check_by_path_sum(len(qubits), a_local, b_local)
+        methods.add(report.method)
+        if report.equivalent is True:
+            continue
+
+        report.wires = [qubits[w] for w in report.wires]
+        divergent = set(report.wires)
+        report.first_gate = next((i for i, g in zip(indices, a) if divergent.intersection(g.get_all_qubits())), None)
+        if report.equivalent is False:
+            failures.append(report)
+        elif undecided is None:
+            undecided = report
+
+    if len(failures) > 0:
+        return min(failures, key=lambda r: len(original) if r.first_gate is None else r.first_gate)
+    if undecided is not None:
+        return undecided
+    return VerificationReport('+'.join(sorted(methods)) or 'simulation', True)
+
+
+# type: (Int, List[Gate], Tuple[Str], Int) -> List[Dict]
+# Runs a pass pipeline like PassManager and verifies the DAG after every pass invocation against the one
+# before it, so a broken rewrite is pinned to the pass that made it. Returns the failing invocations.
+def verify_passes(num_qubits, netlist, passes=LIGHT, max_rounds=None, **kwargs):
+    failures = []
+    invocations = [0]
+
+    def checked(name):
+        pass_fn = PASSES[name] if isinstance(name, str) else name
+
+        def run(cd):
+            before = circuit_dag_to_netlist(cd)
+            result = pass_fn(cd)
+            report = verify(num_qubits, before, circuit_dag_to_netlist(cd), **kwargs)
+            if report.equivalent is False:
+                failures.append({'pass': run.__name__, 'invocation': invocations[0], 'report': report})
+            invocations[0] += 1
+            return result
+        run.__name__ = pass_fn.__name__
+        return run
+
+    PassManager([checked(name) for name in passes], max_rounds=max_rounds).run(CircuitDAG(num_qubits, netlist))
+    return failures
@@ -0,0 +1,47 @@
+import pytest
+import os
+import math
+import numpy as np
+
+from src.angles import normalize_angles, fold_angles, fold_rotations, snap_rotations, NOT_SNAPPED
+from src.circuit_dag import CircuitDAG
+from src.compact_circuit_dag import CompactCircuitDAG
+from src.adapter import circuit_dag_to_netlist
+from src.parser import Parser
+
+from testfixtures import TempDirectory
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+def test_fold_angles():
+    thetas = np.array([0.0, 2 * math.pi, math.pi, -math.pi, 3 * math.pi / 2, math.pi / 4 + 1e-14, -3 * math.pi / 4, 1.0])
+    assert np.allclose(normalize_angles(thetas), [0, 0, math.pi, math.pi, -math.pi / 2, math.pi / 4, -3 * math.pi / 4, 1])
+    folded, k = fold_angles(thetas)
+    assert list(k) == [0, 0, 4, 4, 6, 1, 5, NOT_SNAPPED]
+    assert folded[5] == math.pi / 4
+    assert folded[7] == 1.0
+
+
+@pytest.mark.parametrize('cls', [CircuitDAG, CompactCircuitDAG])
+def test_fold_and_snap_rotations(parser, cls):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, ('INIT 2\nR_z %r 0\nCNOT 0 1\nR_z %r 1\nR_z %r 0\nR_z 1.0 1\nR_z %r 1\n'
+                     % (2 * math.pi, 9 * math.pi / 4, -math.pi / 2, 3 * math.pi / 4)).encode())
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+
+        cd = cls(2, nl)
+        stats = fold_rotations(cd)
+        assert stats.gates_removed == 1
+        assert [(g.get_name(), g.get_theta()) for g in circuit_dag_to_netlist(cd)] == \
+            [('CNOT', None), ('R_z', math.pi / 4), ('R_z', -math.pi / 2), ('R_z', 1.0), ('R_z', 3 * math.pi / 4)]
+
+        cd = cls(2, nl)
+        stats = snap_rotations(cd)
+        assert stats.rewrites == 3
+        assert [g.get_text() for g in circuit_dag_to_netlist(cd)] == \
+            ['CNOT 0 1', 'T 1', 'P_dag 0', 'R_z 1.0 1', 'R_z %r 1' % (3 * math.pi / 4)]
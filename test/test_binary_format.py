@@ -0,0 +1,59 @@
+import pytest
+import os
+from src.binary_format import *
+from src.adapter import circuit_dag_to_netlist
+from src.optimizer_subroutines import hadamard_gate_reduction
+from src.parser import Parser
+from src.gate import Gate
+
+from testfixtures import TempDirectory
+
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+CIRCUIT = b'INIT 5\nCNOT 0 2\nH 2\nCCZ 0 3 4\nR_z 0.3400000000000001 4\nP_dag 1\nR_z -2 0\n'
+
+def edges(cd):
+    return {iden: (v.get_gate_name(), {u.get_id() for u in v.get_output()}) for iden, v in cd.get_vertex_map().items()}
+
+
+@pytest.mark.parametrize('links', [True, False])
+def test_round_trip(parser, links):
+    with TempDirectory() as d:
+        d.write('test_circ.txt', CIRCUIT)
+        nl = parser.get_netlist(os.path.join(d.path, 'test_circ.txt'))
+        fullpath = os.path.join(d.path, 'test_circ.qcb')
+        write_binary(fullpath, parser.get_num_qubits(), nl, links)
+
+        binary_nl = read_binary(fullpath)
+        assert binary_nl.get_num_qubits() == 5
+        assert len(binary_nl) == len(nl)
+        assert binary_nl.get_netlist() == nl
+        assert binary_nl[1] == Gate('H 2')
+
+        expected = CircuitDAG(5, nl)
+        assert edges(binary_nl.to_circuit_dag()) == edges(expected)
+        assert edges(load_compact_circuit_dag(fullpath)) == edges(expected)
+
+def test_loaded_dag_is_editable_and_file_unchanged(parser):
+    with TempDirectory() as d:
+        d.write('test_circ.txt', b'INIT 2\nH 0\nH 1\nCNOT 0 1\nH 0\nH 1\n')
+        nl = parser.get_netlist(os.path.join(d.path, 'test_circ.txt'))
+        fullpath = os.path.join(d.path, 'test_circ.qcb')
+        write_binary(fullpath, 2, nl)
+
+        cd = load_compact_circuit_dag(fullpath)
+        hadamard_gate_reduction(cd)
+        assert circuit_dag_to_netlist(cd) == [Gate('CNOT 1 0')]
+        assert read_binary(fullpath).get_netlist() == nl
+
+def test_dumps_loads(parser):
+    nl = [Gate('CNOT 0 1'), Gate('R_z 1.5 1'), Gate('H 0')]
+    data = dumps(2, nl)
+    assert loads(data).get_netlist() == nl
+    assert circuit_dag_to_netlist(loads(data).to_compact_circuit_dag()) == nl
+    with pytest.raises(ValueError):
+        loads(b'\0' * len(data))
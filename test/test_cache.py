@@ -0,0 +1,108 @@
+import pytest
+import os
+import time
+
+from src.cache import CompilationCache, config_bytes, get_cache, hash_netlist, hash_netlist_file
+from src.compiler import compile_file
+from src.pass_manager import LIGHT
+from src.parser import Parser
+from src.gate import Gate
+
+from testfixtures import TempDirectory
+
+CIRCUIT = b'INIT 2\nH 0\nH 1\nCNOT 0 1\nH 0\nH 1\nCNOT 1 0\nR_z 1 0\nR_z 2 0\n'
+
+
+def test_hash_is_canonical():
+    config = config_bytes(LIGHT)
+    with TempDirectory() as d:
+        d.write('a.txt', CIRCUIT)
+        d.write('b.txt', b'INIT 2\n\nH  0\nH 1\nCNOT 0 1\nH 0\nH 1\nCNOT 1 0\nR_z 1.0 0\nR_z 2.00 0\n')
+        key, num_qubits, num_gates = hash_netlist_file(os.path.join(d.path, 'a.txt'), config)
+        assert (num_qubits, num_gates) == (2, 8)
+        assert hash_netlist_file(os.path.join(d.path, 'b.txt'), config)[0] == key
+        assert hash_netlist(2, Parser().get_netlist(os.path.join(d.path, 'a.txt')), config) == key
+
+        assert hash_netlist_file(os.path.join(d.path, 'a.txt'), config_bytes(LIGHT, max_rounds=1))[0] != key
+        d.write('c.txt', CIRCUIT.replace(b'R_z 2', b'R_z 2.5'))
+        assert hash_netlist_file(os.path.join(d.path, 'c.txt'), config)[0] != key
+
+        d.write('a.qasm', b'OPENQASM 2.0;\nqreg q[2];\nh q;\ncx q[0],q[1];\nh q;\ncx q[1],q[0];\n'
+                          b'rz(1) q[0];\nrz(2) q[0];\n')
+        assert hash_netlist_file(os.path.join(d.path, 'a.qasm'), config) == (key, 2, 8)
+
+def test_headerless_netlist_through_cache():
+    config = config_bytes(LIGHT)
+    with TempDirectory() as d:
+        d.write('a.txt', CIRCUIT.replace(b'INIT 2\n', b''))
+        fullpath = os.path.join(d.path, 'a.txt')
+        # the qubit count comes from the highest wire, as in CircuitDAG.from_stream
+        key, num_qubits, num_gates = hash_netlist_file(fullpath, config)
+        assert (num_qubits, num_gates) == (2, 8)
+        d.write('b.txt', CIRCUIT)
+        assert hash_netlist_file(os.path.join(d.path, 'b.txt'), config)[0] == key
+        assert hash_netlist(None, Parser().get_netlist(fullpath), config) == key
+
+        cache_dir = os.path.join(d.path, 'cache')
+        first = compile_file(fullpath, os.path.join(d.path, 'out1.txt'), cache_dir=cache_dir)
+        second = compile_file(fullpath, os.path.join(d.path, 'out2.txt'), cache_dir=cache_dir)
+        assert (first.get('error'), first['cache'], second['cache']) == (None, 'miss', 'hit')
+        assert second['num_qubits'] == 2
+
+def test_cache_round_trip_and_eviction():
+    with TempDirectory() as d:
+        cache = CompilationCache(d.path)
+        assert cache.get('ab' * 32) is None
+        cache.put('ab' * 32, 3, [Gate('R_z 0.5 2'), Gate('CNOT 0 1')])
+        num_qubits, netlist = cache.get('ab' * 32)
+        assert num_qubits == 3
+        assert [g.get_text() for g in netlist] == ['R_z 0.5 2', 'CNOT 0 1']
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        entry_size = cache.get_size()
+        cache.max_bytes = 2 * entry_size
+        cache.put('cd' * 32, 3, [Gate('R_z 0.5 2'), Gate('CNOT 0 1')])
+        os.utime(cache.get_path('ab' * 32), (time.time() + 10, time.time() + 10))
+        cache.put('ef' * 32, 3, [Gate('R_z 0.5 2'), Gate('CNOT 0 1')])
+        # 'cd' is the least recently used entry
+        assert cache.get('cd' * 32) is None
+        assert cache.get('ab' * 32) is not None and cache.get('ef' * 32) is not None
+        assert all(not name.endswith('.tmp') for _, _, names in os.walk(d.path) for name in names)
+
+def test_put_walks_directory_only_over_limit(monkeypatch):
+    with TempDirectory() as d:
+        cache = get_cache(d.path)
+        assert get_cache(d.path) is cache
+        walks = []
+        get_entries = cache.get_entries
+        monkeypatch.setattr(cache, 'get_entries', lambda: walks.append(1) or get_entries())
+        netlist = [Gate('R_z 0.5 2'), Gate('CNOT 0 1')]
+        for i in range(20):
+            cache.put('%064x' % i, 3, netlist)
+        # the first put finds the size of the directory, the others only add their entry
+        # replacing an entry does not count it twice
+        cache.put('%064x' % 0, 3, netlist)
+        assert len(walks) == 1
+        entry_size = cache.total_bytes // 20
+        assert cache.total_bytes == 20 * entry_size == CompilationCache(d.path).get_size()
+
+        cache.max_bytes = 20 * entry_size
+        cache.put('%064x' % 20, 3, netlist)
+        assert len(walks) == 2
+        assert cache.total_bytes == 20 * entry_size == CompilationCache(d.path).get_size()
+
+def test_compile_file_uses_cache():
+    with TempDirectory() as d:
+        d.write('a.txt', CIRCUIT)
+        cache_dir = os.path.join(d.path, 'cache')
+        first = compile_file(os.path.join(d.path, 'a.txt'), os.path.join(d.path, 'out1.txt'), cache_dir=cache_dir)
+        second = compile_file(os.path.join(d.path, 'a.txt'), os.path.join(d.path, 'out2.txt'), cache_dir=cache_dir)
+        assert (first['cache'], second['cache']) == ('miss', 'hit')
+        assert 'passes' not in second
+        assert (second['gates_before'], second['gates_after']) == (8, 1)
+        with open(os.path.join(d.path, 'out1.txt')) as f1, open(os.path.join(d.path, 'out2.txt')) as f2:
+            assert f1.read() == f2.read()
+
+        other = compile_file(os.path.join(d.path, 'a.txt'), os.path.join(d.path, 'out3.txt'), cache_dir=cache_dir,
+                             passes=['single_qubit_gate_cancellation'])
+        assert other['cache'] == 'miss'
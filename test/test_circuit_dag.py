@@ -2,7 +2,7 @@ import pytest
 import os
 from src.circuit_dag import Vertex, CircuitDAG
 from src.parser import Parser
-from src.gate import Gate
+from src.gate import Gate, Opcode
 
 
 def test_vertex_init():
@@ -84,3 +84,190 @@ def test_delete_vertex(parser):
                 assert list(v.get_input())[0].get_gate_name() == 'CNOT'
 
 
+
+def dag_state(cd):
+    state = {}
+    for iden, v in cd.get_vertex_map().items():
+        gate = v.get_gate()
+        state[iden] = (gate.get_name(), gate.get_theta(), gate.get_target(), gate.get_controls(),
+                       {u.get_id() for u in v.get_input()}, {u.get_id() for u in v.get_output()})
+    return state
+
+def test_rollback_restores_dag(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nCNOT 0 2\nH 2\nR_z 0.5 2\nCCZ 0 1 2\nH 1\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+        before = dag_state(cd)
+        v_map = cd.get_vertex_map()
+
+        token = cd.checkpoint()
+        v_map[2].set_gate_theta(1.5)
+        v_map[1].set_gate_name('P')
+        v_map[0].set_target(1)
+        cd.remove_vertex_and_merge(v_map[1])
+        cd.remove_vertex_and_merge(v_map[3])
+        assert dag_state(cd) != before
+
+        cd.rollback(token)
+        assert dag_state(cd) == before
+        assert cd.undo_log is None
+
+def test_nested_checkpoints(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 2\nH 0\nCNOT 0 1\nH 1\nX 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(2, nl)
+        before = dag_state(cd)
+        v_map = cd.get_vertex_map()
+
+        outer = cd.checkpoint()
+        cd.remove_vertex_and_merge(v_map[0])
+        after_outer = dag_state(cd)
+
+        inner = cd.checkpoint()
+        cd.remove_vertex_and_merge(v_map[2])
+        cd.rollback(inner)
+        assert dag_state(cd) == after_outer
+
+        inner = cd.checkpoint()
+        cd.remove_vertex_and_merge(v_map[3])
+        cd.commit(inner)
+        assert len(v_map) == 2
+
+        cd.rollback(outer)
+        assert dag_state(cd) == before
+
+def test_exists_path():
+    # wire 1 starts after the CNOT on wire 0, wire 2 never touches the others
+    nl = [Gate('H 0'), Gate('CNOT 0 1'), Gate('H 1'), Gate('H 2')] + [Gate('H 0')] * 5000
+    cd = CircuitDAG(3, nl)
+    v_map = cd.get_vertex_map()
+
+    assert cd.exists_path(v_map[0], v_map[2])
+    assert cd.exists_path(v_map[0], v_map[len(nl) - 1])
+    assert not cd.exists_path(v_map[2], v_map[0])
+    assert not cd.exists_path(v_map[3], v_map[2])
+    assert not cd.exists_path(v_map[2], v_map[len(nl) - 1])
+    assert all(v_out.get_level() > v.get_level() for v in v_map.values() for v_out in v.get_output())
+
+def test_copy(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nCNOT 0 2\nH 2\nR_z 0.5 2\nCCZ 0 1 2\nH 1\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+        cd.remove_vertex_and_merge(cd.get_vertex_map()[1])
+        before = dag_state(cd)
+
+        new_cd = cd.copy()
+        assert dag_state(new_cd) == before
+        assert all(new_cd.get_vertex_map()[i].get_level() == v.get_level() for i, v in cd.get_vertex_map().items())
+
+        new_cd.get_vertex_map()[2].set_gate_theta(1.5)
+        new_cd.remove_vertex_and_merge(new_cd.get_vertex_map()[3])
+        assert dag_state(cd) == before
+        assert new_cd.get_vertex_map()[0].get_gate() is not cd.get_vertex_map()[0].get_gate()
+
+def test_snapshot_copies_on_write(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nCNOT 0 2\nH 2\nR_z 0.5 2\nCCZ 0 1 2\nH 1\nX 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+        before = dag_state(cd)
+
+        snap = cd.snapshot()
+        assert dag_state(snap) == before
+        assert snap.get_num_materialized() == 0
+
+        v_map = snap.get_vertex_map()
+        v_map[2].set_gate_theta(1.5)
+        snap.remove_vertex_and_merge(v_map[1])
+        # only the removed vertex and its two neighbors on wire 2, one of them edited before, are copied
+        assert snap.get_num_materialized() == 3
+        assert len(v_map) == 5 and 1 not in v_map
+        assert v_map[2].get_gate().get_theta() == 1.5
+        assert {u.get_id() for u in v_map[0].get_output()} == {2, 3}
+        assert dag_state(cd) == before
+
+        # snapshots of snapshots fork again, rollback works as on any CircuitDAG
+        inner = snap.snapshot()
+        token = inner.checkpoint()
+        inner.remove_vertex_and_merge(inner.get_vertex_map()[3])
+        assert len(inner.get_vertex_map()) == 4
+        inner.rollback(token)
+        assert dag_state(inner) == dag_state(snap)
+        assert dag_state(snap.copy()) == dag_state(snap)
+
+def test_indexes_follow_edits(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nH 0\nCNOT 0 1\nH 1\nP 1\nCNOT 2 1\nP_dag 2\nH 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+        v_map = cd.get_vertex_map()
+
+        assert cd.collect_gate_ids('H') == {0, 2, 6}
+        assert cd.collect_gate_ids('P') == {3}
+        assert cd.collect_opcode_ids(Opcode.P) == {3, 5}
+        assert [v.get_id() for v in cd.iter_wire(1)] == [1, 2, 3, 4]
+        assert cd.get_first_on_wire(2) is v_map[4] and cd.get_last_on_wire(0) is v_map[6]
+
+        token = cd.checkpoint()
+        cd.remove_vertex_and_merge(v_map[0])
+        v_map[2].set_gate_name('X')
+        cd.swap_2_vertex_neighbors(v_map[4], v_map[5])
+        cd.remove_vertex_and_merge(v_map[3])
+        assert cd.collect_gate_ids('H') == {6}
+        assert cd.collect_opcode_ids(Opcode.X) == {2}
+        assert cd.collect_opcode_ids(Opcode.P) == {5}
+        assert cd.get_first_on_wire(0) is v_map[1]
+        assert cd.get_first_on_wire(2) is v_map[5] and cd.get_last_on_wire(2) is v_map[4]
+        assert [v.get_id() for v in cd.iter_wire(1)] == [1, 2, 4]
+
+        cd.rollback(token)
+        assert cd.collect_gate_ids('H') == {0, 2, 6}
+        assert cd.collect_opcode_ids(Opcode.P) == {3, 5}
+        assert cd.get_first_on_wire(0) is v_map[0]
+        assert cd.get_first_on_wire(2) is v_map[4] and cd.get_last_on_wire(2) is v_map[5]
+        assert [v.get_id() for v in cd.snapshot().iter_wire(1)] == [1, 2, 3, 4]
+
+def test_metrics_follow_edits(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nH 0\nCNOT 0 1\nH 1\nP 1\nCNOT 2 1\nP_dag 2\nH 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+        v_map = cd.get_vertex_map()
+
+        assert cd.get_metrics() == {'gates': 7, 'two_qubit_gates': 2, 'rotations': 0, 'depth': 6,
+                                    'opcodes': {'H': 3, 'CNOT': 2, 'P': 2}}
+        assert cd.get_gate_depth(6) == 3
+
+        token = cd.checkpoint()
+        cd.remove_vertex_and_merge(v_map[3])
+        assert cd.get_depth() == 5
+        # P_dag 2 moves in front of the CNOT, which then only waits for H 1
+        cd.swap_2_vertex_neighbors(v_map[4], v_map[5])
+        assert cd.get_depth() == 4
+        cd.remove_vertex_and_merge(v_map[2])
+        v_map[5].set_gate_name('R_z')
+        assert cd.get_depth() == 3
+        assert cd.get_num_gates() == 5
+        assert cd.get_num_rotations() == 1
+        assert cd.get_opcode_count(Opcode.P) == 0
+
+        cd.rollback(token)
+        assert cd.get_depth() == 6
+        assert cd.get_gate_depth(4) == 5
+        assert cd.get_opcode_counts() == {Opcode.H: 3, Opcode.CNOT: 2, Opcode.P: 2}
+        assert cd.snapshot().get_depth() == cd.copy().get_depth() == 6
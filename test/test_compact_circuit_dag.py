@@ -0,0 +1,116 @@
+import pytest
+import os
+from src.circuit_dag import CircuitDAG
+from src.compact_circuit_dag import CompactCircuitDAG, CompactVertex
+from src.optimizer_subroutines import *
+from src.parser import Parser
+from src.gate import Gate, Opcode
+
+from testfixtures import TempDirectory
+
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+def edges(cd):
+    return {iden: (v.get_gate_name(), {u.get_id() for u in v.get_input()}, {u.get_id() for u in v.get_output()})
+            for iden, v in cd.get_vertex_map().items()}
+
+def both_dags(parser, text, num_qubits):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, text)
+        nl = parser.get_netlist(os.path.join(d.path, fn))
+    return nl, CircuitDAG(num_qubits, nl), CompactCircuitDAG(num_qubits, nl)
+
+
+def test_same_structure(parser):
+    nl, cd, compact = both_dags(parser, b'INIT 5\nCNOT 0 2\nH 2\nCCZ 0 3 4\nR_z 0.25 4\nCNOT 0 2\n', 5)
+    assert edges(cd) == edges(compact)
+    assert len(compact.get_vertex_map()) == 5
+
+    v = compact.get_vertex_map()[3]
+    assert v.get_gate() == nl[3]
+    assert v.get_gate_target() == 4
+    assert compact.get_vertex_map()[2].get_gate_controls() == [0, 3]
+    assert compact.get_next_on_wire(0, 0) == 2
+    assert compact.get_prev_on_wire(4, 2) == 1
+    assert compact.collect_gate_ids('CNOT') == {0, 4}
+
+def test_remove_and_swap_match_circuit_dag(parser):
+    _, cd, compact = both_dags(parser, b'INIT 3\nCCX 0 1 2\nCCY 0 1 2\nCNOT 0 2\nCCZ 0 1 2\nH 1\n', 3)
+    for dag in (cd, compact):
+        v_map = dag.get_vertex_map()
+        swap_2_vertex_neighbors(v_map[1], v_map[2])
+        dag.remove_vertex_and_merge(v_map[3])
+    assert edges(cd) == edges(compact)
+    assert compact.first_on_wire[2] == 0 and compact.last_on_wire[1] == 4
+
+def test_rollback(parser):
+    _, _, compact = both_dags(parser, b'INIT 2\nR_z 3 0\nCNOT 0 1\nCZ 0 1\nCNOT 0 1\nR_z 2 0\n', 2)
+    before = edges(compact)
+
+    assert find_R_z_combination(compact, compact.get_vertex_map()[0]) is compact
+    assert edges(compact) == before
+    assert compact.undo_log is None
+
+def test_optimizer_subroutines_on_compact_dag(parser):
+    nl, _, compact = both_dags(parser, b'INIT 2\nR_z 3 0\nCNOT 0 1\nCNOT 0 1\nCNOT 0 1\nR_z 2 0\n', 2)
+    find_R_z_combination(compact, compact.get_vertex_map()[0])
+
+    new_nl = circuit_dag_to_netlist(compact)
+    assert [g.get_name() for g in new_nl] == ['CNOT', 'CNOT', 'CNOT', 'R_z']
+    assert new_nl[3].get_theta() == 5.0
+
+    _, _, compact = both_dags(parser, b'INIT 2\nH 0\nH 1\nCNOT 0 1\nH 0\nH 1\n', 2)
+    hadamard_gate_reduction(compact)
+    v = list(compact.get_vertex_map().values())[0]
+    assert len(compact.get_vertex_map()) == 1
+    assert v.get_gate_target() == 0 and v.get_gate_controls() == [1]
+
+def test_levels_and_paths_match_circuit_dag(parser):
+    _, cd, compact = both_dags(parser, b'INIT 3\nCNOT 0 1\nCNOT 2 1\nH 1\nH 2\nCNOT 1 0\n', 3)
+    for dag in (cd, compact):
+        v_map = dag.get_vertex_map()
+        swap_2_vertex_neighbors(v_map[0], v_map[1])
+        assert all(v_out.get_level() > v.get_level() for v in v_map.values() for v_out in v.get_output())
+        assert dag.exists_path(v_map[1], v_map[0])
+        assert not dag.exists_path(v_map[0], v_map[1])
+        assert dag.exists_path(v_map[1], v_map[3])
+        assert not dag.exists_path(v_map[0], v_map[3])
+
+def test_copy_and_snapshot(parser):
+    nl, cd, compact = both_dags(parser, b'INIT 2\nR_z 3 0\nCNOT 0 1\nCNOT 0 1\nH 1\nR_z 2 0\n', 2)
+    compact.remove_vertex_and_merge(compact.get_vertex_map()[3])
+    before = edges(compact)
+
+    for fork in (compact.copy(), compact.snapshot()):
+        assert edges(fork) == before
+        single_qubit_gate_cancellation(fork)
+        assert [g.get_text() for g in circuit_dag_to_netlist(fork)] == ['R_z 5.0 0']
+        assert edges(compact) == before
+    assert isinstance(compact.copy(), CompactCircuitDAG)
+
+def test_indexes_match_circuit_dag(parser):
+    _, cd, compact = both_dags(parser, b'INIT 3\nH 0\nCNOT 0 1\nP 1\nCNOT 2 1\nP_dag 2\nH 0\n', 3)
+    for dag in (cd, compact):
+        v_map = dag.get_vertex_map()
+        dag.remove_vertex_and_merge(v_map[0])
+        v_map[2].set_gate_name('H')
+    for wire in range(3):
+        assert [v.get_id() for v in cd.iter_wire(wire)] == [v.get_id() for v in compact.iter_wire(wire)]
+    assert compact.collect_gate_ids('H') == cd.collect_gate_ids('H') == {2, 5}
+    assert compact.collect_opcode_ids(Opcode.P) == {4}
+    assert compact.get_last_on_wire(0).get_id() == 5
+
+def test_metrics_match_circuit_dag(parser):
+    _, cd, compact = both_dags(parser, b'INIT 3\nH 0\nCNOT 0 1\nH 1\nP 1\nCNOT 2 1\nP_dag 2\nH 0\nR_z 1 2\n', 3)
+    assert compact.get_metrics() == cd.get_metrics()
+    for dag in (cd, compact):
+        v_map = dag.get_vertex_map()
+        dag.remove_vertex_and_merge(v_map[3])
+        dag.swap_2_vertex_neighbors(v_map[4], v_map[5])
+    assert compact.get_depth() == cd.get_depth() == 5
+    assert compact.get_metrics() == cd.get_metrics()
@@ -0,0 +1,87 @@
+import pytest
+import os
+import json
+
+from src.compiler import collect_files, compile_file, compile_batch, main
+from src.parser import Parser
+
+from testfixtures import TempDirectory
+
+CIRCUIT = b'INIT 2\nH 0\nH 1\nCNOT 0 1\nH 0\nH 1\nCNOT 1 0\nR_z 1 0\nR_z 2 0\n'
+
+
+def test_collect_files():
+    with TempDirectory() as d:
+        d.write('a.txt', CIRCUIT)
+        d.write('batch/b.txt', CIRCUIT)
+        d.write('batch/nested/c.txt', CIRCUIT)
+        d.write('batch/notes.md', b'')
+        d.write('batch/out/a.txt', CIRCUIT)
+        pairs = collect_files([os.path.join(d.path, 'a.txt'), os.path.join(d.path, 'batch')],
+                              os.path.join(d.path, 'batch', 'out'))
+        assert [os.path.relpath(i, d.path) for i, _ in pairs] == ['a.txt', 'batch/b.txt', 'batch/nested/c.txt']
+        assert [os.path.relpath(o, d.path) for _, o in pairs] == ['batch/out/a.txt', 'batch/out/b.txt', 'batch/out/nested/c.txt']
+
+        assert len(collect_files([os.path.join(d.path, 'batch'), os.path.join(d.path, 'batch')], 'out')) == 3
+        d.write('batch/a.txt', CIRCUIT)
+        with pytest.raises(ValueError):
+            collect_files([os.path.join(d.path, 'a.txt'), os.path.join(d.path, 'batch')], 'out')
+
+def test_compile_file():
+    with TempDirectory() as d:
+        d.write('a.txt', CIRCUIT)
+        d.write('bad.txt', b'INIT 2\nCNOT 0\nFOO\n')
+        out = os.path.join(d.path, 'out', 'a.txt')
+        record = compile_file(os.path.join(d.path, 'a.txt'), out)
+        assert (record['gates_before'], record['gates_after']) == (8, 1)
+        assert [g.get_text() for g in Parser().get_netlist(out)] == ['R_z 3.0 0']
+
+        record = compile_file(os.path.join(d.path, 'bad.txt'), os.path.join(d.path, 'out', 'bad.txt'))
+        assert 'error' in record
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_compile_batch(jobs):
+    with TempDirectory() as d:
+        for name in ('a.txt', 'b.txt', 'c.txt'):
+            d.write(os.path.join('in', name), CIRCUIT)
+        pairs = collect_files([os.path.join(d.path, 'in')], os.path.join(d.path, 'out'))
+        records = compile_batch(pairs, jobs=jobs)
+        assert [r['input'] for r in records] == [i for i, _ in pairs]
+        assert all(r['gates_after'] == 1 for r in records)
+
+def test_main(capsys):
+    with TempDirectory() as d:
+        d.write('in/a.txt', CIRCUIT)
+        d.write('in/bad.txt', b'INIT 2\nCNOT 0\nFOO\n')
+        report = os.path.join(d.path, 'report.json')
+        code = main([os.path.join(d.path, 'in'), '-o', os.path.join(d.path, 'out'), '--report', report,
+                     '--passes', 'single_qubit_gate_cancellation'])
+        assert code == 1
+        with open(report) as f:
+            total = json.load(f)['total']
+        assert (total['files'], total['failed'], total['gates_before'], total['gates_after']) == (2, 1, 8, 7)
+        assert 'bad.txt' in capsys.readouterr().err
+
+def test_compile_file_verify():
+    with TempDirectory() as d:
+        d.write('a.txt', CIRCUIT)
+        record = compile_file(os.path.join(d.path, 'a.txt'), os.path.join(d.path, 'out', 'a.txt'), verify=True)
+        assert record['verification']['equivalent'] is True
+        assert 'error' not in record
+
+        # without an INIT header the qubit count comes from the gates, as it does without verify
+        d.write('c.txt', CIRCUIT.split(b'\n', 1)[1])
+        record = compile_file(os.path.join(d.path, 'c.txt'), os.path.join(d.path, 'out', 'c.txt'), verify=True)
+        assert 'error' not in record
+        assert record['verification']['equivalent'] is True
+
+        # a pass that turns the first H into an X is caught and nothing is written
+        def h_to_x(cd):
+            v = next(v for v in cd.get_vertex_map().values() if v.get_gate().get_name() == 'H')
+            v.set_gate_name('X')
+        out = os.path.join(d.path, 'out', 'b.txt')
+        record = compile_file(os.path.join(d.path, 'a.txt'), out, passes=(h_to_x,), max_rounds=1, verify=True)
+        assert record['verification']['equivalent'] is False
+        assert record['verification']['first_gate'] == 0
+        assert 'error' in record
+        assert not os.path.exists(out)
@@ -0,0 +1,53 @@
+import pytest
+import os
+import math
+import numpy as np
+
+from src.fusion import gate_fusion, synthesize, get_sequence, DIAGONAL, HADAMARD, ANTI_DIAGONAL, EULER
+from src.circuit_dag import CircuitDAG
+from src.compact_circuit_dag import CompactCircuitDAG
+from src.adapter import circuit_dag_to_netlist
+from src.verification import verify
+from src.parser import Parser
+
+from testfixtures import TempDirectory
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+def test_synthesize():
+    h = np.array([[1, 1], [1, -1]]) / np.sqrt(2)
+    p = np.diag([1, 1j])
+    products = np.stack([p @ p, h, np.array([[0, 1j], [1, 0]]), h @ np.diag([1, np.exp(0.5j)]) @ h])
+    shapes, angles = synthesize(products)
+    assert shapes.tolist() == [DIAGONAL, HADAMARD, ANTI_DIAGONAL, EULER]
+    assert get_sequence(shapes[0], *angles[:, 0]) == [('R_z', math.pi)]
+    assert get_sequence(shapes[1], *angles[:, 1]) == [('H', None)]
+    assert get_sequence(shapes[2], *angles[:, 2]) == [('X', None), ('R_z', -math.pi / 2)]
+    gates = get_sequence(shapes[3], *angles[:, 3])
+    assert [name for name, _ in gates] == ['H', 'R_z', 'H']
+    assert abs(gates[1][1] - 0.5) < 1e-12
+
+
+@pytest.mark.parametrize('cls', [CircuitDAG, CompactCircuitDAG])
+def test_gate_fusion(parser, cls):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        # H H and T T P H X H = Z Z multiply out to the identity, X P X T to P_dag T = T_dag and the last
+        # run on wire 0 is already as short as its Euler form
+        d.write(fn, b'INIT 2\nH 0\nH 0\nCNOT 0 1\nT 1\nT 1\nP 1\nH 1\nX 1\nH 1\nCNOT 0 1\nX 1\nP 1\nX 1\nT 1\n'
+                    b'R_z 0.5 0\nH 0\nR_z 0.25 0\nH 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = cls(2, nl)
+
+        stats = gate_fusion(cd)
+        new_nl = circuit_dag_to_netlist(cd)
+        assert stats.attempts == 4
+        assert stats.rewrites == 3
+        assert stats.gates_removed == 11
+        assert sorted(g.get_text() for g in new_nl) == \
+            sorted(['CNOT 0 1', 'CNOT 0 1', 'R_z %r 1' % (-math.pi / 4), 'R_z 0.5 0', 'H 0', 'R_z 0.25 0', 'H 0'])
+        assert verify(2, nl, new_nl).equivalent is True
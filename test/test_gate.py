@@ -1,5 +1,5 @@
 import pytest
-from src.gate import Gate
+from src.gate import Gate, Opcode
 
 def test_single_qubit():
     gate = Gate('H 1')
@@ -17,3 +17,30 @@ def test_two_qubit():
     assert gate.get_all_qubits() == [1,3]
 
 
+
+def test_opcode_and_dagger():
+    gate = Gate('P_dag 2')
+    assert gate.get_opcode() == Opcode.P
+    assert gate.is_dagger()
+    assert gate.is_dagger_to(Gate('P 0'))
+    assert not gate.is_dagger_to(Gate('P_dag 0'))
+
+    assert Gate('R_z 0.5 1').get_opcode() == Opcode.R_z
+    assert Gate('FOO 1 2').get_opcode() is None
+    assert Gate('CNOT 0 1').get_name() is Gate('CNOT 2 3').get_name()
+
+def test_copy_and_text():
+    gate = Gate('R_z 0.125 3')
+    gate_copy = gate.copy()
+    assert gate_copy == gate
+    gate_copy.set_theta(1.0)
+    assert gate.get_theta() == 0.125
+    assert Gate(gate.get_text()) == gate
+    assert not hasattr(gate, '__dict__')
+
+    gate = Gate('CNOT 1 3')
+    gate.set_target(1)
+    gate.set_controls([3])
+    assert gate.get_all_qubits() == [3, 1]
+    assert gate.get_text() == 'CNOT 3 1'
+    assert Gate.from_fields('CNOT', (3, 1)) == gate
@@ -0,0 +1,58 @@
+import pytest
+import os
+import json
+import pstats
+
+from src import instrumentation
+from src.instrumentation import instrument
+from src.pass_manager import PassManager, LIGHT
+from src.circuit_dag import CircuitDAG
+from src.parser import Parser
+
+from testfixtures import TempDirectory
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+def test_instrument_counts_rules_and_times(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 2\nH 0\nH 1\nCNOT 0 1\nH 0\nH 1\nCNOT 1 0\nR_z 1 0\nR_z 2 0\n')
+        fullpath = os.path.join(d.path, fn)
+        cd = CircuitDAG(2, parser.get_netlist(fullpath))
+
+        events = []
+        with instrument(lambda kind, name, value: events.append((kind, name))) as inst:
+            PassManager(LIGHT).run(cd)
+        assert instrumentation.ACTIVE is None
+        assert CircuitDAG.rollback.__name__ == 'rollback' and not hasattr(CircuitDAG.rollback, '__wrapped__')
+
+        report = inst.to_dict()
+        assert report['rules']['hadamard_gate_reduction/rule_3'] == {'attempts': 1, 'successes': 1}
+        assert report['timers']['CircuitDAG.remove_vertex_and_merge']['calls'] == 7
+        assert report['timers']['hadamard_gate_reduction']['calls'] == 4
+        assert report['timers']['CircuitDAG.checkpoint']['calls'] > 0
+        assert ('rule', 'hadamard_gate_reduction/rule_3') in events
+        assert json.loads(inst.to_json()) == report
+
+        inst.dump_stats(os.path.join(d.path, 'out.prof'))
+        stats = pstats.Stats(os.path.join(d.path, 'out.prof')).stats
+        assert stats[('q_compile', 0, 'hadamard_gate_reduction/rule_3')][:2] == (1, 1)
+
+
+def test_commute_rule_counts(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        # the first R_z commutes through the CNOT control (rule 3) to meet the second
+        d.write(fn, b'INIT 2\nR_z 1 0\nCNOT 0 1\nR_z 2 0\n')
+        fullpath = os.path.join(d.path, fn)
+        cd = CircuitDAG(2, parser.get_netlist(fullpath))
+
+        with instrument() as inst:
+            PassManager(['single_qubit_gate_cancellation'], max_rounds=1).run(cd)
+        counters = inst.get_counters()
+        assert counters['single_R_z_commute/rule_3'][1] == 1
+        assert counters['single_R_z_commute/rule_1'][0] >= 1
+        assert len(cd.get_vertex_map()) == 2
@@ -523,3 +523,191 @@ def test_hard_commute_cnot_combination(parser):
 
         assert len(new_nl) == 4
         assert new_nl == nl[1:-1]
+
+def test_failed_combination_rolls_back_in_place(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 2\nR_z 3 0\nCNOT 0 1\nCZ 0 1\nCNOT 0 1\nR_z 2 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(2, nl)
+        edges = {iden: ({u.get_id() for u in v.get_input()}, {u.get_id() for u in v.get_output()})
+                 for iden, v in cd.get_vertex_map().items()}
+
+        v_target = cd.get_vertex_map()[0]
+        assert find_R_z_combination(cd, v_target) is cd
+
+        assert edges == {iden: ({u.get_id() for u in v.get_input()}, {u.get_id() for u in v.get_output()})
+                         for iden, v in cd.get_vertex_map().items()}
+        assert cd.get_vertex_map()[0] is v_target
+
+def test_cd_to_netlist_keeps_gate_order(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nH 2\nH 0\nCNOT 0 1\nX 2\nH 1\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+
+        assert circuit_dag_to_netlist(cd) == nl
+
+def test_topological_sort_long_wire():
+    nl = [Gate('H 0'), Gate('P 0')] * 5000
+    cd = CircuitDAG(1, nl)
+
+    order = topological_sort(cd)
+    assert [v.get_id() for v in order] == list(range(len(nl)))
+
+def test_schedule_layers(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nH 2\nH 0\nCNOT 0 1\nX 2\nH 1\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+
+        layers = circuit_dag_to_netlist(cd, layers=True)
+        assert [[g.get_text() for g in layer] for layer in layers] == [['H 0', 'H 2'], ['CNOT 0 1', 'X 2'], ['H 1']]
+        layers = circuit_dag_to_netlist(cd, 'alap', layers=True)
+        assert [[g.get_text() for g in layer] for layer in layers] == [['H 0'], ['CNOT 0 1', 'H 2'], ['H 1', 'X 2']]
+        assert [g.get_text() for g in circuit_dag_to_netlist(cd, 'asap')] == ['H 0', 'H 2', 'CNOT 0 1', 'X 2', 'H 1']
+        assert len(schedule_layers(cd)) == cd.get_depth() == 3
+        with pytest.raises(ValueError):
+            schedule_layers(cd, 'greedy')
+
+def test_single_qubit_gate_cancellation(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nR_z 1 0\nCNOT 0 1\nR_z 2 0\nCNOT 1 2\nCNOT 1 2\nH 0\nR_z 4 0\nR_z 8 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+
+        stats = single_qubit_gate_cancellation(cd)
+        new_nl = circuit_dag_to_netlist(cd)
+
+        assert [g.get_name() for g in new_nl] == ['CNOT', 'R_z', 'H', 'R_z']
+        assert abs(new_nl[1].get_theta() - 3.0) < FLOAT_DELTA
+        assert abs(new_nl[3].get_theta() - 12.0) < FLOAT_DELTA
+        assert stats.gates_removed == 4
+        assert stats.rewrites == 3
+        assert stats.iterations == 2
+        assert stats.to_dict()['name'] == 'single_qubit_gate_cancellation'
+
+def test_single_qubit_gate_cancellation_budget(parser):
+    nl = [Gate('R_z 1 0'), Gate('R_z 1 0')] * 50
+    cd = CircuitDAG(1, nl)
+
+    stats = single_qubit_gate_cancellation(cd, max_iterations=1)
+    assert stats.iterations == 1
+    assert len(cd.get_vertex_map()) == 1
+    assert circuit_dag_to_netlist(cd)[0].get_theta() == 100
+
+def test_swap_keeps_wire_adjacency(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 4\nCNOT 3 1\nCNOT 1 0\nCNOT 3 2\nCNOT 2 1\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(4, nl)
+        v1, v2, v3, v4 = [cd.get_vertex_map()[i] for i in range(4)]
+
+        swap_2_vertex_neighbors(v1, v3)
+
+        assert v3.get_input() == set()
+        assert v3.get_output() == {v1, v4}
+        assert v1.get_input() == {v3}
+        assert v1.get_output() == {v2}
+        assert v4.get_input() == {v2, v3}
+        assert v3.get_level() < v1.get_level() < v2.get_level() < v4.get_level()
+
+def test_R_z_commute_rule2_needs_idle_control(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 2\nR_z 1 1\nCNOT 0 1\nR_z 2 1\nH 0\nCNOT 0 1\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(2, nl)
+
+        assert not single_R_z_commute(cd.get_vertex_map()[0])
+        assert circuit_dag_to_netlist(cd) == nl
+
+def test_cnot_commute_rule3_respects_paths(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 3\nCNOT 0 1\nH 1\nX 0\nCNOT 0 2\nCNOT 1 2\nH 1\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+
+        assert not single_cnot_commute(cd.get_vertex_map()[0])
+        assert circuit_dag_to_netlist(cd) == nl
+
+def test_rotation_merging(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        # the R_z gates on parities x0 ^ x1 and not x0 are far apart, the H on wire 2 does not separate them
+        d.write(fn, b'INIT 3\nR_z 1 0\nCNOT 0 1\nR_z 2 1\nH 2\nCNOT 0 1\nX 0\nR_z 4 0\nCNOT 0 1\nT 1\nR_z 8 1\nX 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(3, nl)
+
+        stats = rotation_merging(cd)
+        new_nl = circuit_dag_to_netlist(cd)
+
+        assert [g.get_name() for g in new_nl] == ['R_z', 'CNOT', 'R_z', 'H', 'CNOT', 'X', 'CNOT', 'T', 'X']
+        assert abs(new_nl[0].get_theta() - (1 - 4)) < FLOAT_DELTA
+        assert abs(new_nl[2].get_theta() - (2 - 8)) < FLOAT_DELTA
+        assert stats.gates_removed == 2
+        assert stats.rewrites == 2
+        assert stats.attempts == 4
+
+def test_rotation_merging_cancels_and_stops_at_hadamard(parser):
+    nl = [Gate('R_z 0.5 0'), Gate('H 1'), Gate('CNOT 1 0'), Gate('R_z 1.5 0'), Gate('CNOT 1 0'),
+          Gate('R_z -0.5 0')]
+    cd = CircuitDAG(2, nl)
+
+    stats = rotation_merging(cd)
+    new_nl = circuit_dag_to_netlist(cd)
+
+    # the last R_z sees x0 again and cancels the first, the middle one depends on the fresh variable from H
+    assert [g.get_name() for g in new_nl] == ['H', 'CNOT', 'R_z', 'CNOT']
+    assert new_nl[2].get_theta() == 1.5
+    assert stats.gates_removed == 2
+
+def test_rotation_merging_across_many_hadamards():
+    # the H gates on wire 2 hand out far more variables than there are wires, so the parities get rebased
+    # several times while the terms x0 and x0 ^ x1 wait for their second R_z
+    nl = [Gate('R_z 1 0'), Gate('CNOT 1 0'), Gate('R_z 0.5 0')]
+    for _ in range(40):
+        nl += [Gate('H 2'), Gate('CNOT 0 2'), Gate('R_z 0.25 2')]
+    nl += [Gate('CNOT 1 0'), Gate('R_z 2 0'), Gate('CNOT 1 0'), Gate('R_z 0.5 0')]
+    cd = CircuitDAG(3, nl)
+
+    stats = rotation_merging(cd)
+    new_nl = circuit_dag_to_netlist(cd)
+
+    rotations = [g for g in new_nl if g.get_name() == 'R_z' and g.get_target() == 0]
+    assert [g.get_theta() for g in rotations] == [3, 1]
+    assert len([g for g in new_nl if g.get_name() == 'R_z']) == 42
+    assert stats.gates_removed == 2
+    assert stats.rewrites == 2
+
+def test_hadamard_reduction_runs_queue_to_completion(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        # rule 1 on the second H makes the first H start a rule 2 pattern, rule 3 fires on wires 2 and 3
+        d.write(fn, b'INIT 4\nH 0\nH 0\nP 0\nH 0\nH 2\nH 3\nCNOT 2 3\nH 2\nH 3\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(4, nl)
+
+        hadamard_gate_reduction(cd)
+        new_nl = circuit_dag_to_netlist(cd)
+
+        assert [g.get_name() for g in new_nl] == ['P', 'H', 'P', 'P_dag', 'CNOT']
+        assert new_nl[4].get_controls() == [3] and new_nl[4].get_target() == 2
+
+def test_hadamard_rule_index():
+    assert [len(rule.names) for rule in HADAMARD_RULE_INDEX[(Opcode.H, Opcode.P)]] == [3, 3, 5, 5]
+    assert [rule.cnot_role for rule in HADAMARD_RULE_INDEX[(Opcode.H, Opcode.CNOT)]] == ['control']
@@ -0,0 +1,56 @@
+import pytest
+import os
+
+from src.parallel import partition_by_components, slice_blocks, optimize_parallel
+from src.circuit_dag import CircuitDAG
+from src.adapter import circuit_dag_to_netlist
+from src.pass_manager import PassManager
+from src.gate import Gate
+from src.parser import Parser
+
+from testfixtures import TempDirectory
+
+
+def block_netlist():
+    # wires 0, 1 and 2, 4 form two blocks, wire 3 is idle
+    return [Gate('R_z 1 0'), Gate('CNOT 0 1'), Gate('H 2'), Gate('CNOT 0 1'), Gate('CNOT 4 2'),
+            Gate('R_z 2 0'), Gate('CNOT 4 2'), Gate('H 2'), Gate('X 1')]
+
+def test_partition_by_components():
+    partition = partition_by_components(5, block_netlist())
+    assert sorted(qubits for qubits, _ in partition) == [[0, 1], [2, 4]]
+    for qubits, gates in partition:
+        assert all(set(g.get_all_qubits()) <= set(qubits) for g in gates)
+    assert sum(len(gates) for _, gates in partition) == len(block_netlist())
+
+def test_slice_blocks():
+    sliced = slice_blocks([([0], [Gate('H 0')] * 5)], 2)
+    assert [len(gates) for _, gates in sliced] == [2, 2, 1]
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_optimize_parallel_matches_sequential(jobs):
+    nl = block_netlist()
+    cd = PassManager().run(CircuitDAG(5, nl))
+    expected = circuit_dag_to_netlist(cd)
+
+    optimized = optimize_parallel(5, nl, jobs=jobs)
+    assert sorted(g.get_text() for g in optimized) == sorted(g.get_text() for g in expected)
+    assert [g.get_text() for g in optimized if 0 in g.get_all_qubits()] == ['R_z 3.0 0']
+
+def test_optimize_parallel_slices_keep_order():
+    nl = [Gate('R_z 1 0'), Gate('R_z 2 0'), Gate('H 0'), Gate('R_z 4 0'), Gate('R_z 8 0')]
+    optimized = optimize_parallel(1, nl, jobs=1, max_block_gates=3)
+    assert [g.get_text() for g in optimized] == ['R_z 3.0 0', 'H 0', 'R_z 12.0 0']
+
+def test_optimize_parallel_headerless():
+    text = ''.join(g.get_text() + '\n' for g in block_netlist())
+    expected = sorted(g.get_text() for g in optimize_parallel(5, block_netlist(), jobs=1))
+    with TempDirectory() as d:
+        d.write('a.txt', text.encode())
+        parser = Parser()
+        nl = parser.get_netlist(os.path.join(d.path, 'a.txt'))
+        assert parser.get_num_qubits() is None
+        assert sorted(qubits for qubits, _ in partition_by_components(None, nl)) == [[0, 1], [2, 4]]
+        assert sorted(g.get_text() for g in optimize_parallel(None, nl, jobs=1)) == expected
+        # a header that undercounts the wires
+        assert sorted(g.get_text() for g in optimize_parallel(2, nl, jobs=1)) == expected
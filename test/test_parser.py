@@ -1,6 +1,10 @@
 import pytest
 import os
-from src.parser import Parser
+import math
+from src.parser import Parser, qasm_angle, evaluate_qasm_angle, QASM_ANGLE_CACHE_SIZE
+from src.gate import Gate
+from src.circuit_dag import CircuitDAG
+from src.adapter import circuit_dag_to_netlist
 from testfixtures import TempDirectory
 
 
@@ -18,3 +22,156 @@ def test_netlist_length(parser):
         assert len(nl) == 3
 
 
+
+
+def test_iter_gates_reads_header(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'\nINIT 4\nCNOT 0 2\n\nH 2\nR_z 0.5 3')
+        fullpath = os.path.join(d.path, fn)
+        gates = parser.iter_gates(fullpath)
+        assert parser.get_num_qubits() == 4
+
+        assert next(gates).get_name() == 'CNOT'
+        assert [g.get_name() for g in gates] == ['H', 'R_z']
+        assert parser.get_netlist(fullpath) == [Gate('CNOT 0 2'), Gate('H 2'), Gate('R_z 0.5 3')]
+
+
+def test_iter_gates_in_chunks(parser, monkeypatch):
+    monkeypatch.setattr('src.parser.CHUNK_SIZE', 16)
+    fn = 'test_circ.txt'
+    lines = ['CNOT %d %d' % (i % 3, (i + 1) % 3) for i in range(100)]
+    with TempDirectory() as d:
+        d.write(fn, ('INIT 3\n' + '\n'.join(lines) + '\n').encode())
+        nl = list(parser.iter_gates(os.path.join(d.path, fn)))
+        assert nl == [Gate(line) for line in lines]
+
+
+def test_iter_gates_falls_back_to_lines(parser, monkeypatch):
+    monkeypatch.setattr('src.parser.CHUNK_SIZE', 32)
+    fn = 'test_circ.txt'
+    # a name without a fixed arity and a CNOT with two controls do not line up with the token walk
+    lines = ['H 0', 'R_z 0.5 1', 'FOO 2', 'CNOT 0 1 2', 'CCZ 0 1 2', 'T_dag 2', 'CNOT 2 0']
+    with TempDirectory() as d:
+        d.write(fn, ('INIT 3\n' + '\n'.join(lines) + '\n').encode())
+        assert parser.get_netlist(os.path.join(d.path, fn)) == [Gate(line) for line in lines]
+
+        d.write(fn, b'INIT 3\nH 0\nH x\n')
+        with pytest.raises(ValueError):
+            parser.get_netlist(os.path.join(d.path, fn))
+
+
+def test_circuit_dag_from_stream(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, b'INIT 6\nCNOT 0 2\nH 2\nCCZ 0 3 4\n')
+        fullpath = os.path.join(d.path, fn)
+        cd = parser.get_circuit_dag(fullpath)
+        expected = CircuitDAG(6, parser.get_netlist(fullpath))
+
+        assert cd.get_num_qubits() == 6
+        assert circuit_dag_to_netlist(cd) == circuit_dag_to_netlist(expected)
+        edges = lambda dag: {i: {u.get_id() for u in v.get_output()} for i, v in dag.get_vertex_map().items()}
+        assert edges(cd) == edges(expected)
+        assert CircuitDAG.from_stream(iter([Gate('H 7')])).get_num_qubits() == 8
+
+
+def test_write_netlist_round_trip(parser):
+    nl = [Gate('CNOT 0 2'), Gate('R_z 0.1 1'), Gate('P_dag 2')]
+    with TempDirectory() as d:
+        fullpath = os.path.join(d.path, 'out.txt')
+        parser.write_netlist(fullpath, 3, nl)
+        assert parser.get_netlist(fullpath) == nl
+        assert parser.get_num_qubits() == 3
+
+
+def test_iter_qasm_gates(parser):
+    fn = 'test_circ.qasm'
+    with TempDirectory() as d:
+        d.write(fn, b'OPENQASM 2.0;\ninclude "qelib1.inc";\nqreg a[2];\nqreg b[3]; creg c[5];\n'
+                    b'// a comment; with a semicolon\nh a[1]; cx a[0],b[2];\n'
+                    b'rz(pi/4) b[0];\nrz(-3*pi/4) b[1]; // rz(1) b[1];\n'
+                    b's b[2];\nsdg a[0];\nbarrier a, b;\ncx a[0] ,\n  b[0];\n')
+        fullpath = os.path.join(d.path, fn)
+        gates = parser.iter_gates(fullpath)
+        # every qreg before the first gate is counted before it is pulled
+        assert parser.get_num_qubits() == 5
+        assert list(gates) == [Gate('H 1'), Gate('CNOT 0 4'), Gate('R_z %r 2' % (math.pi / 4)),
+                               Gate('R_z %r 3' % (-3 * math.pi / 4)), Gate('P 4'), Gate('P_dag 0'),
+                               Gate('CNOT 0 2')]
+
+
+def test_qasm_broadcast_and_errors(parser):
+    with TempDirectory() as d:
+        d.write('a.qasm', b'OPENQASM 2.0;\nqreg q[3];\nqreg r[3];\nh q;\ncx q,r;\nrz(0.5) r[1];\n')
+        nl = parser.get_netlist(os.path.join(d.path, 'a.qasm'))
+        assert nl == [Gate('H 0'), Gate('H 1'), Gate('H 2'), Gate('CNOT 0 3'), Gate('CNOT 1 4'),
+                      Gate('CNOT 2 5'), Gate('R_z 0.5 4')]
+
+        d.write('b.qasm', b'OPENQASM 2.0;\nqreg q[1];\ncreg c[1];\nh q[0];\nmeasure q[0] -> c[0];\n')
+        with pytest.raises(ValueError, match='measure'):
+            parser.get_netlist(os.path.join(d.path, 'b.qasm'))
+        d.write('c.qasm', b'OPENQASM 2.0;\nqreg q[1];\nrz(__import__) q[0];\n')
+        with pytest.raises(ValueError):
+            parser.get_netlist(os.path.join(d.path, 'c.qasm'))
+
+
+@pytest.mark.parametrize('body, reason', [
+    (b'h a[3];', 'outside register a'),
+    (b'qreg a[1];', 'already declared'),
+    (b'cx a[0];', 'acts on 2 qubits, not 1'),
+    (b'h a[0], b[0];', 'acts on 1 qubits, not 2'),
+    (b'h(0.3) a[0];', 'takes no parameters'),
+    (b'rz a[0];', 'takes an angle'),
+    (b'rz(1/0) a[0];', 'unsupported QASM parameter'),
+    (b'h c[0];', 'register c is not declared'),
+    (b'h;', 'acts on 1 qubits, not 0'),
+    (b'cx a[1], a[1];', 'a qubit appears twice'),
+    (b'cx a, a[1];', 'a qubit appears twice'),
+    (b'cx a, c;', 'register c is not declared'),
+    (b'qreg c[3];\ncx a, c;', 'registers of different sizes'),
+    (b'h a[0] b[0];', 'bad operand'),
+    (b'qreg d;', 'expected qreg name'),
+    (b'1 a[0];', 'not a statement'),
+])
+def test_invalid_qasm(parser, body, reason):
+    with TempDirectory() as d:
+        # the same statement is rejected as the first gate of the file and in the middle of the stream
+        for prefix in [b'', b'h a[0];\n']:
+            d.write('a.qasm', b'OPENQASM 2.0;\nqreg a[2];\nqreg b[2];\n' + prefix + body + b'\nx b[1];\n')
+            with pytest.raises(ValueError, match='invalid QASM statement .*: .*' + reason):
+                parser.get_netlist(os.path.join(d.path, 'a.qasm'))
+
+
+def test_qasm_angle():
+    assert qasm_angle('0.5') == 0.5
+    assert qasm_angle('-3*pi/4') == -3 * math.pi / 4
+    assert qasm_angle('2^3') == 8.0
+    assert qasm_angle('sqrt(2)/2') == math.sqrt(2) / 2
+    # operands are floats, so a tower of powers overflows at once instead of computing a huge int
+    for text in ['9^9^9', '1/0', 'sqrt(-1)', '(-8)^0.5', 'inf', '__import__("os")', 'pi/']:
+        with pytest.raises(ValueError, match='unsupported QASM parameter'):
+            qasm_angle(text)
+
+    # the memo of evaluated expressions stays bounded however many distinct ones a file has
+    for k in range(2 * QASM_ANGLE_CACHE_SIZE):
+        assert qasm_angle('%d*pi/4' % k) == k * math.pi / 4
+    assert evaluate_qasm_angle.cache_info().currsize == QASM_ANGLE_CACHE_SIZE
+
+
+def test_qasm_in_chunks(parser, monkeypatch):
+    monkeypatch.setattr('src.parser.CHUNK_SIZE', 16)
+    lines = ['CNOT %d %d' % (i % 3, (i + 1) % 3) for i in range(100)]
+    text = 'OPENQASM 2.0;\nqreg q[3];\n' + ''.join('cx q[%d], q[%d]; ' % (i % 3, (i + 1) % 3) for i in range(100))
+    with TempDirectory() as d:
+        d.write('a.qasm', text.encode())
+        assert parser.get_netlist(os.path.join(d.path, 'a.qasm')) == [Gate(line) for line in lines]
+
+
+def test_write_qasm_round_trip(parser):
+    nl = [Gate('CNOT 0 2'), Gate('R_z 0.1 1'), Gate('P_dag 2'), Gate('T 0'), Gate('CCX 0 1 2'), Gate('CZ 1 0')]
+    with TempDirectory() as d:
+        fullpath = os.path.join(d.path, 'out.qasm')
+        parser.write_netlist(fullpath, 3, nl + [Gate('CCZ 0 1 2')])
+        assert parser.get_netlist(fullpath) == nl + [Gate('H 2'), Gate('CCX 0 1 2'), Gate('H 2')]
+        assert parser.get_num_qubits() == 3
@@ -0,0 +1,104 @@
+import pytest
+import os
+
+from src.pass_manager import PassManager, PASSES, LIGHT, HEAVY
+from src.verification import verify
+from src.circuit_dag import CircuitDAG
+from src.adapter import circuit_dag_to_netlist
+from src.parser import Parser
+from src.gate import Gate
+
+from testfixtures import TempDirectory
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+def test_pass_manager_light(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        # after the Hadamard rewrites the two CNOTs meet and cancel
+        d.write(fn, b'INIT 2\nH 0\nH 1\nCNOT 0 1\nH 0\nH 1\nCNOT 1 0\nR_z 1 0\nR_z 2 0\n')
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        cd = CircuitDAG(2, nl)
+
+        pm = PassManager(LIGHT)
+        pm.run(cd)
+        new_nl = circuit_dag_to_netlist(cd)
+
+        assert [g.get_name() for g in new_nl] == ['R_z']
+        assert new_nl[0].get_theta() == 3
+        records = pm.get_records()
+        assert records[0].name == 'hadamard_gate_reduction'
+        assert records[0].get_gate_delta() == -4
+        assert records[1].get_gate_delta() == -3
+        assert records[1].stats.gates_removed == 3
+        # the second round removes nothing and ends the run
+        assert max(r.round_index for r in records) == 1
+        assert pm.summary()['single_qubit_gate_cancellation']['gates_removed'] == 3
+        assert records[1].to_dict()['stats']['name'] == 'single_qubit_gate_cancellation'
+
+def test_pass_manager_max_rounds():
+    nl = [Gate('R_z 1 0'), Gate('R_z 1 0')] * 5
+    cd = CircuitDAG(1, nl)
+    calls = []
+
+    def counting_pass(cd):
+        calls.append(len(cd.get_vertex_map()))
+        return cd
+
+    pm = PassManager([counting_pass, 'single_qubit_gate_cancellation'], max_rounds=1)
+    pm.run(cd)
+    assert calls == [10]
+    assert [r.name for r in pm.get_records()] == ['counting_pass', 'single_qubit_gate_cancellation']
+
+def test_pass_manager_time_budget():
+    cd = CircuitDAG(1, [Gate('H 0')])
+    pm = PassManager(time_budget=0)
+    pm.run(cd)
+    assert pm.get_records() == []
+
+def test_pass_manager_skip_stale():
+    cd = CircuitDAG(2, [Gate('H 0'), Gate('R_z 1 1'), Gate('R_z 1 1'), Gate('CNOT 0 1')])
+    removed = []
+
+    # removes one gate per call until only one is left
+    def shrink(cd):
+        v_map = cd.get_vertex_map()
+        if len(v_map) > 1:
+            cd.remove_vertex_and_merge(v_map[max(v_map)])
+            removed.append(1)
+
+    pm = PassManager(['hadamard_gate_reduction', shrink], skip_stale=1)
+    pm.run(cd)
+
+    names = [r.name for r in pm.get_records()]
+    assert len(cd.get_vertex_map()) == 1
+    assert names.count('hadamard_gate_reduction') == 1
+    assert names.count('shrink') == 4
+    assert set(LIGHT) <= set(PASSES)
+
+def test_pass_manager_heavy():
+    # X P X T is T_dag and X H Z H is the identity, neither run has a pair LIGHT could cancel
+    nl = [Gate('X 0'), Gate('P 0'), Gate('X 0'), Gate('T 0'), Gate('CNOT 0 1'), Gate('X 1'), Gate('H 1'),
+          Gate('Z 1'), Gate('H 1')]
+    light = PassManager(LIGHT).run(CircuitDAG(2, nl))
+    heavy = PassManager(HEAVY).run(CircuitDAG(2, nl))
+    assert set(HEAVY) <= set(PASSES)
+    assert len(heavy.get_vertex_map()) < len(light.get_vertex_map())
+    assert len(heavy.get_vertex_map()) == 2
+    assert verify(2, nl, circuit_dag_to_netlist(heavy)).equivalent is True
+
+def test_pass_manager_track_depth():
+    cd = CircuitDAG(2, [Gate('H 0'), Gate('R_z 1 1'), Gate('R_z 1 1'), Gate('CNOT 0 1'), Gate('H 1')])
+    pm = PassManager(['rotation_merging'], track_depth=True)
+    pm.run(cd)
+    record = pm.get_records()[0]
+    assert (record.depth_before, record.depth_after) == (4, 3)
+    assert record.to_dict()['depth_after'] == 3
+
+    pm = PassManager(['rotation_merging'])
+    pm.run(cd)
+    assert 'depth_after' not in pm.get_records()[0].to_dict()
@@ -0,0 +1,64 @@
+import pytest
+import os
+
+from src.streaming import optimize_stream, optimize_file, split_window
+from src.circuit_dag import CircuitDAG
+from src.parser import Parser
+from src.gate import Gate
+
+from testfixtures import TempDirectory
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+def test_split_window_flushes_a_prefix():
+    nl = [Gate('H 0'), Gate('CNOT 0 1'), Gate('H 0'), Gate('H 0'), Gate('X 2'), Gate('H 1')]
+    cd = CircuitDAG(3, nl)
+
+    flush, keep = split_window(cd, {0, 1}, 1)
+    # wire 2 was idle and is flushed, the last gate of wires 0 and 1 stays with nothing it depends on
+    assert [g.get_text() for g in flush] == ['H 0', 'CNOT 0 1', 'H 0', 'X 2']
+    assert [g.get_text() for g in keep] == ['H 0', 'H 1']
+
+def test_optimize_stream_small_window():
+    nl = [Gate('R_z 1 0'), Gate('R_z 2 0'), Gate('H 0')] * 4 + [Gate('CNOT 0 1'), Gate('CNOT 0 1')]
+    out = list(optimize_stream(2, nl, window=2))
+
+    assert [g.get_text() for g in out] == ['R_z 3.0 0', 'H 0'] * 4
+    # the input netlist is left untouched
+    assert nl[0].get_text() == 'R_z 1.0 0'
+
+def test_optimize_stream_window_trade_off():
+    # the pair of R_z gates is 6 gates apart on wire 0, only a wide enough window merges them
+    nl = [Gate('R_z 1 0')] + [Gate('CNOT 0 1')] * 6 + [Gate('R_z 2 0')]
+    assert len(list(optimize_stream(2, nl, window=1))) == 2
+    assert len(list(optimize_stream(2, nl, window=8))) == 1
+
+def test_optimize_file(parser):
+    with TempDirectory() as d:
+        d.write('in.txt', b'INIT 2\nR_z 1 1\nCNOT 0 1\nCNOT 0 1\nR_z 2 1\nH 0\n')
+        out_fn = os.path.join(d.path, 'out.txt')
+        optimize_file(os.path.join(d.path, 'in.txt'), out_fn, window=2)
+
+        assert [g.get_text() for g in parser.get_netlist(out_fn)] == ['R_z 3.0 1', 'H 0']
+        assert parser.get_num_qubits() == 2
+
+def test_optimize_file_headerless(parser):
+    with TempDirectory() as d:
+        d.write('in.txt', b'R_z 1 1\nCNOT 0 2\nCNOT 0 2\nR_z 2 1\nH 0\n')
+        out_fn = os.path.join(d.path, 'out.txt')
+        optimize_file(os.path.join(d.path, 'in.txt'), out_fn, window=2)
+
+        # the header counts up to the highest wire of the input, as CircuitDAG.from_stream does
+        assert [g.get_text() for g in parser.get_netlist(out_fn)] == ['R_z 3.0 1', 'H 0']
+        assert parser.get_num_qubits() == 3
+        assert sorted(os.listdir(d.path)) == ['in.txt', 'out.txt']
+
+        # INIT 4 undercounts the CCZ on wire 4
+        d.write('in.txt', b'INIT 4\nCNOT 0 2\nH 2\nCCZ 0 3 4\nR_z 0.34 4\n')
+        out_fn = os.path.join(d.path, 'out.qasm')
+        optimize_file(os.path.join(d.path, 'in.txt'), out_fn)
+        assert len(parser.get_netlist(out_fn)) == 6
+        assert parser.get_num_qubits() == 5
@@ -0,0 +1,93 @@
+import pytest
+import os
+import math
+
+from src.verification import verify, verify_passes, check_by_simulation, check_by_path_sum, inverse_netlist
+from src.pass_manager import PassManager, LIGHT
+from src.circuit_dag import CircuitDAG
+from src.adapter import circuit_dag_to_netlist
+from src.parser import Parser
+from src.gate import Gate
+
+from testfixtures import TempDirectory
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+CIRC = (b'INIT 4\nH 0\nH 1\nCNOT 0 1\nH 0\nH 1\nCNOT 1 0\nR_z 1 0\nR_z 2 0\nP 2\nH 2\nP 2\nCNOT 2 3\n'
+        b'T 3\nCNOT 2 3\nH 3\nX 3\nR_z 0.5 3\nH 1\nCNOT 1 2\nT_dag 2\nCNOT 1 2\nH 1\n')
+
+
+def test_verify_optimized(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, CIRC)
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        new_nl = circuit_dag_to_netlist(PassManager(LIGHT).run(CircuitDAG(4, nl)))
+        assert len(new_nl) < len(nl)
+
+        report = verify(4, nl, new_nl)
+        assert report.equivalent is True
+        assert report.method == 'simulation'
+        assert check_by_simulation(4, nl, new_nl).equivalent is True
+        assert check_by_path_sum(4, nl, new_nl).equivalent is True
+        assert check_by_path_sum(4, nl + inverse_netlist(nl), []).equivalent is True
+        # the qubit pairs {0, 1} and {2, 3} never interact and are checked on their own
+        assert verify(4, nl, new_nl, max_simulation_qubits=0).method == 'path_sum'
+
+
+def test_verify_divergent_region(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, CIRC)
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        broken = list(nl)
+        # T 3 became T_dag 3, only wires 2 and 3 see the difference
+        broken[12] = Gate.from_fields('T_dag', [3])
+
+        report = verify(4, nl, broken)
+        assert report.equivalent is False
+        assert set(report.wires) <= {2, 3}
+        assert report.first_gate == 8
+        assert report.to_dict()['equivalent'] is False
+
+        # a path sum that keeps a path variable cannot tell, but it still locates the region
+        report = verify(4, nl, broken, max_simulation_qubits=0)
+        assert report.equivalent is None
+        assert report.wires == [2, 3]
+        assert report.first_gate == 8
+
+
+def test_hadamard_rule_is_equivalent():
+    hph = [Gate.from_fields('H', [0]), Gate.from_fields('P', [0]), Gate.from_fields('H', [0])]
+    pdag_h_pdag = [Gate.from_fields('P_dag', [0]), Gate.from_fields('H', [0]), Gate.from_fields('P_dag', [0])]
+    assert check_by_simulation(1, hph, pdag_h_pdag).equivalent is True
+    assert check_by_path_sum(1, hph, pdag_h_pdag).equivalent is True
+    # R_z angles only matter up to a global phase and 2 pi
+    assert check_by_path_sum(1, [Gate.from_fields('R_z', [0], 2.5 * math.pi)], [Gate.from_fields('P', [0])]).equivalent
+    # H H reduces to the identity, which is no X
+    assert check_by_path_sum(1, [Gate.from_fields('H', [0])] * 2, [Gate.from_fields('X', [0])]).equivalent is False
+
+
+def test_verify_passes(parser):
+    fn = 'test_circ.txt'
+    with TempDirectory() as d:
+        d.write(fn, CIRC)
+        fullpath = os.path.join(d.path, fn)
+        nl = parser.get_netlist(fullpath)
+        assert verify_passes(4, nl, LIGHT) == []
+
+        # drops the first T, a rewrite that is plainly wrong
+        def drop_t(cd):
+            for v in list(cd.get_vertex_map().values()):
+                if v.get_gate().get_name() == 'T':
+                    cd.remove_vertex_and_merge(v)
+                    break
+        failures = verify_passes(4, nl, LIGHT + (drop_t,), max_rounds=1)
+        assert [f['pass'] for f in failures] == ['drop_t']
+        assert failures[0]['invocation'] == len(LIGHT)
+        assert failures[0]['report'].wires == [2, 3]